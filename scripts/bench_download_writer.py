@@ -0,0 +1,132 @@
+"""Benchmark local write paths for SFTP downloads.
+
+Downloads the same remote file with paramiko's `SFTPClient.get()` & with
+`modules.ssh_mod.writer.download_file()` at a few buffer sizes & through an mmap,
+then reports throughput (MB/s) & CPU time for each.
+
+CPU time is measured with `time.process_time()`, which includes paramiko's transport
+thread, so it covers decryption as well as the local writes.
+
+Usage:
+    python scripts/bench_download_writer.py --host backup01 --user backup \
+        --keyfile ~/.ssh/id_rsa --remote-path /backups/large.tar.gz --local-dir /mnt/xfs/bench
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+import time
+import typing as t
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "auto_sftp"))
+
+from modules.ssh_mod import writer  # noqa: E402
+import paramiko  # noqa: E402
+
+MiB: int = 1024 * 1024
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", required=True)
+    parser.add_argument("--port", type=int, default=22)
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--password", default=None)
+    parser.add_argument("--keyfile", default=None)
+    parser.add_argument("--remote-path", required=True, help="Remote file to download")
+    parser.add_argument(
+        "--local-dir",
+        default=".",
+        help="Directory to download into. Use the volume backups are written to.",
+    )
+    parser.add_argument("--runs", type=int, default=3, help="Runs per write path")
+    parser.add_argument(
+        "--buffer-sizes",
+        default="1,8,32",
+        help="Comma-separated buffer sizes to test, in MiB",
+    )
+
+    return parser.parse_args()
+
+
+def bench(name: str, runs: int, fn) -> dict:
+    wall: list[float] = []
+    cpu: list[float] = []
+    size: int = 0
+
+    for _ in range(runs):
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        size = fn()
+        cpu.append(time.process_time() - cpu_start)
+        wall.append(time.perf_counter() - wall_start)
+
+    ## Best run, to reduce noise from other traffic on the link
+    best: int = min(range(runs), key=lambda i: wall[i])
+
+    return {
+        "name": name,
+        "mb_s": size / MiB / wall[best],
+        "wall_s": wall[best],
+        "cpu_s": cpu[best],
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    local_path: Path = Path(args.local_dir).expanduser() / Path(args.remote_path).name
+
+    ssh_client = paramiko.SSHClient()
+    ssh_client.load_system_host_keys()
+    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh_client.connect(
+        hostname=args.host,
+        port=args.port,
+        username=args.user,
+        password=args.password,
+        key_filename=str(Path(args.keyfile).expanduser()) if args.keyfile else None,
+    )
+    sftp_client = ssh_client.open_sftp()
+
+    def _get() -> int:
+        local_path.unlink(missing_ok=True)
+        sftp_client.get(args.remote_path, str(local_path))
+
+        return local_path.stat().st_size
+
+    def _writer(buffer_size: int, use_mmap: bool):
+        def _run() -> int:
+            local_path.unlink(missing_ok=True)
+
+            return writer.download_file(
+                sftp_client=sftp_client,
+                remote_path=args.remote_path,
+                local_path=local_path,
+                buffer_size=buffer_size,
+                use_mmap=use_mmap,
+            )
+
+        return _run
+
+    cases: list[tuple[str, t.Callable[[], int]]] = [("SFTPClient.get()", _get)]
+    for mib in [int(s) for s in args.buffer_sizes.split(",")]:
+        cases.append((f"writer buffered {mib} MiB", _writer(mib * MiB, False)))
+    cases.append(("writer mmap", _writer(writer.DEFAULT_BUFFER_SIZE, True)))
+
+    try:
+        results: list[dict] = [bench(name, args.runs, fn) for name, fn in cases]
+    finally:
+        local_path.unlink(missing_ok=True)
+        sftp_client.close()
+        ssh_client.close()
+
+    print(f"{'write path':<28} {'MB/s':>10} {'wall (s)':>10} {'CPU (s)':>10}")
+    for r in results:
+        print(
+            f"{r['name']:<28} {r['mb_s']:>10.1f} {r['wall_s']:>10.2f} {r['cpu_s']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
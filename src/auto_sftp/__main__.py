@@ -1,18 +1,57 @@
 from __future__ import annotations
 
-from auto_sftp.main import run_backup
+import argparse
+from pathlib import Path
+
+from auto_sftp.main import plan_backup, run_backup
 
 from core import settings, ssh_settings
+from core.helpers import init_logging
 from core.paths import ENSURE_DIRS
-from packages import cleanup
+from modules import ssh_mod
+from packages import cleanup, daemon
 
 from loguru import logger as log
-from red_utils.ext.loguru_utils import init_logger, sinks
 
 
-def main(cleanup_threshold: int = 14):
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="auto_sftp")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["run", "plan"],
+        default="run",
+        help="run: download new backups (default). plan: dry run, report what would be downloaded & an ETA",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running, syncing on an interval/cron schedule over a persistent SSH connection",
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=None,
+        help="Daemon mode: seconds between runs (default: ssh_daemon_interval)",
+    )
+    parser.add_argument(
+        "--cron",
+        default=None,
+        help="Daemon mode: 5-field cron expression to run on instead of an interval (default: ssh_daemon_cron)",
+    )
+
+    return parser.parse_args()
+
+
+def main(cleanup_threshold: int = 14, ssh_manager: ssh_mod.SSHManager | None = None):
+    ## Scan local backups for cleanup while the backup runs
+    cleanup_scan = cleanup.local.start_local_cleanup(
+        local_dest=Path(f"{ssh_settings.local_dest}{ssh_settings.extra_path_suffix}"),
+        threshold=cleanup_threshold,
+    )
+
     try:
-        run_backup(ssh_settings=ssh_settings)
+        report = run_backup(ssh_settings=ssh_settings, ssh_manager=ssh_manager)
     except Exception as exc:
         msg = Exception(f"Unhandled exception running backup. Details: {exc}")
         log.error(msg)
@@ -23,7 +62,9 @@ def main(cleanup_threshold: int = 14):
 
     log.info(">> Start Cleanup")
     try:
-        cleanup.local.run_local_cleanup(threshold=cleanup_threshold)
+        cleanup.local.finish_local_cleanup(
+            scan=cleanup_scan, new_files=report.files, removed_files=report.evicted
+        )
     except Exception as exc:
         msg = Exception(f"Unhandled exception running local cleanup. Details: {exc}")
         log.error(msg)
@@ -32,14 +73,22 @@ def main(cleanup_threshold: int = 14):
 
 
 if __name__ == "__main__":
-    init_logger(
-        sinks=[
-            sinks.LoguruSinkStdErr(level=settings.log_level).as_dict(),
-            sinks.LoguruSinkAppFile(sink=f"{settings.logs_dir}/app.log").as_dict(),
-            sinks.LoguruSinkErrFile(sink=f"{settings.logs_dir}/error.log").as_dict(),
-        ]
+    args = parse_args()
+
+    init_logging(
+        log_level=settings.log_level,
+        logs_dir=settings.logs_dir,
+        json=settings.log_json,
+        enqueue=settings.log_enqueue,
+        event_rate=settings.log_event_rate,
     )
 
+    if args.command == "plan":
+        plan = plan_backup(ssh_settings=ssh_settings)
+        log.info(f"Transfer plan:\n{plan.summary()}")
+
+        raise SystemExit(0)
+
     log.info(f">> Start Backup")
     log.info(
         f"""Remote Host Details:
@@ -50,4 +99,15 @@ Remote CWD: {ssh_settings.remote_cwd}
 """
     )
 
-    main(cleanup_threshold=ssh_settings.local_backup_limit)
+    if args.daemon:
+        daemon.run_daemon(
+            ssh_settings=ssh_settings,
+            job=lambda ssh_manager: main(
+                cleanup_threshold=ssh_settings.local_backup_limit,
+                ssh_manager=ssh_manager,
+            ),
+            interval=args.interval or ssh_settings.daemon_interval,
+            cron=args.cron or (None if args.interval else ssh_settings.daemon_cron),
+        )
+    else:
+        main(cleanup_threshold=ssh_settings.local_backup_limit)
@@ -1,6 +1,16 @@
 from __future__ import annotations
 
+import typing as t
+
+from . import dependencies
 from .config import AppSettings, SSHSettings
 from .constants import DEFAULT_SSH_DIR, DEFAULT_SSH_PRIVKEY, DEFAULT_SSH_PUBKEY
-from .dependencies import ensure_dirs, settings, ssh_settings
+from .dependencies import ensure_dirs, get_settings, get_ssh_settings
 from .paths import DATA_DIR, ENSURE_DIRS, LOG_DIR
+
+def __getattr__(name: str) -> t.Any:
+    ## Loaded on first use, see core.dependencies
+    if name in ["settings", "ssh_settings"]:
+        return getattr(dependencies, name)
+
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
@@ -19,6 +19,9 @@ class AppSettings(BaseSettings):
     container_env: bool = Field(default=False, env="CONTAINER_ENV")
     log_level: str = Field(default="INFO", env="LOG_LEVEL")
     logs_dir: str = Field(default="logs", env="LOGS_DIR")
+    log_json: bool = Field(default=False, env="LOG_JSON")
+    log_enqueue: bool = Field(default=True, env="LOG_ENQUEUE")
+    log_event_rate: float = Field(default=10.0, env="LOG_EVENT_RATE")
 
 
 class SSHSettings(BaseSettings):
@@ -44,6 +47,78 @@ class SSHSettings(BaseSettings):
     
     local_backup_limit: int = Field(default=None, env="SSH_LOCAL_BACKUP_LIMIT")
     remote_backup_limit: int = Field(default=None, env="SSH_REMOTE_BACKUP_LIMIT")
+    local_backup_max_bytes: int | None = Field(
+        default=None, env="SSH_LOCAL_BACKUP_MAX_BYTES"
+    )
+
+    partition_by_date: bool = Field(default=False, env="SSH_PARTITION_BY_DATE")
+    use_listing_cache: bool = Field(default=True, env="SSH_USE_LISTING_CACHE")
+
+    dedupe: bool = Field(default=False, env="SSH_DEDUPE")
+    dedupe_link_mode: str = Field(default="hardlink", env="SSH_DEDUPE_LINK_MODE")
+
+    delta_transfer: bool = Field(default=False, env="SSH_DELTA_TRANSFER")
+    delta_min_size: int = Field(default=64 * 1024 * 1024, env="SSH_DELTA_MIN_SIZE")
+    delta_block_size: int = Field(default=128 * 1024, env="SSH_DELTA_BLOCK_SIZE")
+    delta_python_bin: str = Field(default="python3", env="SSH_DELTA_PYTHON_BIN")
+    delta_helper_timeout: int = Field(default=600, env="SSH_DELTA_HELPER_TIMEOUT")
+
+    download_buffer_size: int = Field(
+        default=8 * 1024 * 1024, env="SSH_DOWNLOAD_BUFFER_SIZE"
+    )
+    download_use_mmap: bool = Field(default=False, env="SSH_DOWNLOAD_USE_MMAP")
+    download_preallocate: bool = Field(default=True, env="SSH_DOWNLOAD_PREALLOCATE")
+    download_drop_cache: bool = Field(default=False, env="SSH_DOWNLOAD_DROP_CACHE")
+
+    durable_commits: bool = Field(default=True, env="SSH_DURABLE_COMMITS")
+    commit_batch_files: int = Field(default=64, env="SSH_COMMIT_BATCH_FILES")
+
+    walk_include: list[str] = Field(default=[], env="SSH_WALK_INCLUDE")
+    walk_exclude: list[str] = Field(default=[], env="SSH_WALK_EXCLUDE")
+    walk_min_size: int | None = Field(default=None, env="SSH_WALK_MIN_SIZE")
+    walk_max_size: int | None = Field(default=None, env="SSH_WALK_MAX_SIZE")
+    walk_min_age: int | None = Field(default=None, env="SSH_WALK_MIN_AGE")
+    walk_max_age: int | None = Field(default=None, env="SSH_WALK_MAX_AGE")
+
+    transfer_min_workers: int = Field(default=1, env="SSH_TRANSFER_MIN_WORKERS")
+    transfer_max_workers: int = Field(default=8, env="SSH_TRANSFER_MAX_WORKERS")
+    transfer_timeout: int = Field(default=60, env="SSH_TRANSFER_TIMEOUT")
+    transfer_order: str = Field(default="largest_first", env="SSH_TRANSFER_ORDER")
+    transfer_protocol: str = Field(default="sftp", env="SSH_TRANSFER_PROTOCOL")
+    transfer_retries: int = Field(default=3, env="SSH_TRANSFER_RETRIES")
+    transfer_retry_backoff: float = Field(default=2.0, env="SSH_TRANSFER_RETRY_BACKOFF")
+    transfer_max_retry_backoff: float = Field(
+        default=60.0, env="SSH_TRANSFER_MAX_RETRY_BACKOFF"
+    )
+    use_run_journal: bool = Field(default=True, env="SSH_USE_RUN_JOURNAL")
+    stable_quiet_period: float = Field(default=60.0, env="SSH_STABLE_QUIET_PERIOD")
+    stable_recheck_interval: float = Field(
+        default=2.0, env="SSH_STABLE_RECHECK_INTERVAL"
+    )
+    refresh_truncated: bool = Field(default=True, env="SSH_REFRESH_TRUNCATED")
+
+    recompress: bool = Field(default=False, env="SSH_RECOMPRESS")
+    recompress_level: int = Field(default=10, env="SSH_RECOMPRESS_LEVEL")
+    recompress_workers: int = Field(default=0, env="SSH_RECOMPRESS_WORKERS")
+    recompress_max_in_flight_bytes: int = Field(
+        default=2 * 1024 * 1024 * 1024, env="SSH_RECOMPRESS_MAX_IN_FLIGHT_BYTES"
+    )
+
+    keepalive_interval: int = Field(default=30, env="SSH_KEEPALIVE_INTERVAL")
+    daemon_interval: int = Field(default=60, env="SSH_DAEMON_INTERVAL")
+    daemon_cron: str | None = Field(default=None, env="SSH_DAEMON_CRON")
+
+    @field_validator(
+        "local_backup_max_bytes",
+        "walk_min_size",
+        "walk_max_size",
+        "walk_min_age",
+        "walk_max_age",
+        "daemon_cron",
+    )
+    def validate_unset(cls, v):
+        ## 0 or "" in settings.toml leaves the option unset
+        return v or None
 
     @field_validator("privkey")
     def validate_privkey(cls, v) -> Path:
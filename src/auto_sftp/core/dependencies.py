@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from functools import cache
 from pathlib import Path
 import typing as t
 
@@ -39,23 +40,85 @@ def ensure_dirs(paths: list[Path] = ENSURE_DIRS) -> None:
         raise msg
 
 
-settings: AppSettings = AppSettings(
-    env=DYNACONF_SETTINGS.ENV,
-    container_env=DYNACONF_SETTINGS.CONTAINER_ENV,
-    log_level=DYNACONF_SETTINGS.LOG_LEVEL,
-    logs_dir=DYNACONF_SETTINGS.LOGS_DIR,
-)
+@cache
+def get_settings() -> AppSettings:
+    """Load the app settings from config/settings.toml & the environment, once."""
+    return AppSettings(
+        env=DYNACONF_SETTINGS.ENV,
+        container_env=DYNACONF_SETTINGS.CONTAINER_ENV,
+        log_level=DYNACONF_SETTINGS.LOG_LEVEL,
+        logs_dir=DYNACONF_SETTINGS.LOGS_DIR,
+        log_json=DYNACONF_SETTINGS.LOG_JSON,
+        log_enqueue=DYNACONF_SETTINGS.LOG_ENQUEUE,
+        log_event_rate=DYNACONF_SETTINGS.LOG_EVENT_RATE,
+    )
 
-ssh_settings: SSHSettings = SSHSettings(
-    remote_host=DYNACONF_SSH_SETTINGS.SSH_REMOTE_HOST,
-    remote_port=DYNACONF_SSH_SETTINGS.SSH_REMOTE_PORT,
-    remote_user=DYNACONF_SSH_SETTINGS.SSH_REMOTE_USER,
-    remote_password=DYNACONF_SSH_SETTINGS.SSH_REMOTE_PASSWORD,
-    remote_cwd=DYNACONF_SSH_SETTINGS.SSH_REMOTE_CWD,
-    local_dest=DYNACONF_SSH_SETTINGS.SSH_LOCAL_DEST_PATH,
-    extra_path_suffix=DYNACONF_SSH_SETTINGS.SSH_EXTRA_PATH_SUFFIX,
-    privkey=DYNACONF_SSH_SETTINGS.SSH_PRIVKEY_FILE,
-    pubkey=DYNACONF_SSH_SETTINGS.SSH_PUBKEY_FILE,
-    local_backup_limit=DYNACONF_SSH_SETTINGS.SSH_LOCAL_BACKUP_LIMIT,
-    remote_backup_limit=DYNACONF_SSH_SETTINGS.SSH_REMOTE_BACKUP_LIMIT,
-)
+
+@cache
+def get_ssh_settings() -> SSHSettings:
+    """Load the SSH settings from config/ssh/settings.toml & the environment, once."""
+    return SSHSettings(
+        remote_host=DYNACONF_SSH_SETTINGS.SSH_REMOTE_HOST,
+        remote_port=DYNACONF_SSH_SETTINGS.SSH_REMOTE_PORT,
+        remote_user=DYNACONF_SSH_SETTINGS.SSH_REMOTE_USER,
+        remote_password=DYNACONF_SSH_SETTINGS.SSH_REMOTE_PASSWORD,
+        remote_cwd=DYNACONF_SSH_SETTINGS.SSH_REMOTE_CWD,
+        local_dest=DYNACONF_SSH_SETTINGS.SSH_LOCAL_DEST_PATH,
+        extra_path_suffix=DYNACONF_SSH_SETTINGS.SSH_EXTRA_PATH_SUFFIX,
+        privkey=DYNACONF_SSH_SETTINGS.SSH_PRIVKEY_FILE,
+        pubkey=DYNACONF_SSH_SETTINGS.SSH_PUBKEY_FILE,
+        local_backup_limit=DYNACONF_SSH_SETTINGS.SSH_LOCAL_BACKUP_LIMIT,
+        remote_backup_limit=DYNACONF_SSH_SETTINGS.SSH_REMOTE_BACKUP_LIMIT,
+        local_backup_max_bytes=DYNACONF_SSH_SETTINGS.SSH_LOCAL_BACKUP_MAX_BYTES,
+        partition_by_date=DYNACONF_SSH_SETTINGS.SSH_PARTITION_BY_DATE,
+        use_listing_cache=DYNACONF_SSH_SETTINGS.SSH_USE_LISTING_CACHE,
+        dedupe=DYNACONF_SSH_SETTINGS.SSH_DEDUPE,
+        dedupe_link_mode=DYNACONF_SSH_SETTINGS.SSH_DEDUPE_LINK_MODE,
+        delta_transfer=DYNACONF_SSH_SETTINGS.SSH_DELTA_TRANSFER,
+        delta_min_size=DYNACONF_SSH_SETTINGS.SSH_DELTA_MIN_SIZE,
+        delta_block_size=DYNACONF_SSH_SETTINGS.SSH_DELTA_BLOCK_SIZE,
+        delta_python_bin=DYNACONF_SSH_SETTINGS.SSH_DELTA_PYTHON_BIN,
+        delta_helper_timeout=DYNACONF_SSH_SETTINGS.SSH_DELTA_HELPER_TIMEOUT,
+        download_buffer_size=DYNACONF_SSH_SETTINGS.SSH_DOWNLOAD_BUFFER_SIZE,
+        download_use_mmap=DYNACONF_SSH_SETTINGS.SSH_DOWNLOAD_USE_MMAP,
+        download_preallocate=DYNACONF_SSH_SETTINGS.SSH_DOWNLOAD_PREALLOCATE,
+        download_drop_cache=DYNACONF_SSH_SETTINGS.SSH_DOWNLOAD_DROP_CACHE,
+        durable_commits=DYNACONF_SSH_SETTINGS.SSH_DURABLE_COMMITS,
+        commit_batch_files=DYNACONF_SSH_SETTINGS.SSH_COMMIT_BATCH_FILES,
+        walk_include=DYNACONF_SSH_SETTINGS.SSH_WALK_INCLUDE,
+        walk_exclude=DYNACONF_SSH_SETTINGS.SSH_WALK_EXCLUDE,
+        walk_min_size=DYNACONF_SSH_SETTINGS.SSH_WALK_MIN_SIZE,
+        walk_max_size=DYNACONF_SSH_SETTINGS.SSH_WALK_MAX_SIZE,
+        walk_min_age=DYNACONF_SSH_SETTINGS.SSH_WALK_MIN_AGE,
+        walk_max_age=DYNACONF_SSH_SETTINGS.SSH_WALK_MAX_AGE,
+        transfer_min_workers=DYNACONF_SSH_SETTINGS.SSH_TRANSFER_MIN_WORKERS,
+        transfer_max_workers=DYNACONF_SSH_SETTINGS.SSH_TRANSFER_MAX_WORKERS,
+        transfer_timeout=DYNACONF_SSH_SETTINGS.SSH_TRANSFER_TIMEOUT,
+        transfer_order=DYNACONF_SSH_SETTINGS.SSH_TRANSFER_ORDER,
+        transfer_protocol=DYNACONF_SSH_SETTINGS.SSH_TRANSFER_PROTOCOL,
+        transfer_retries=DYNACONF_SSH_SETTINGS.SSH_TRANSFER_RETRIES,
+        transfer_retry_backoff=DYNACONF_SSH_SETTINGS.SSH_TRANSFER_RETRY_BACKOFF,
+        transfer_max_retry_backoff=DYNACONF_SSH_SETTINGS.SSH_TRANSFER_MAX_RETRY_BACKOFF,
+        use_run_journal=DYNACONF_SSH_SETTINGS.SSH_USE_RUN_JOURNAL,
+        stable_quiet_period=DYNACONF_SSH_SETTINGS.SSH_STABLE_QUIET_PERIOD,
+        stable_recheck_interval=DYNACONF_SSH_SETTINGS.SSH_STABLE_RECHECK_INTERVAL,
+        refresh_truncated=DYNACONF_SSH_SETTINGS.SSH_REFRESH_TRUNCATED,
+        recompress=DYNACONF_SSH_SETTINGS.SSH_RECOMPRESS,
+        recompress_level=DYNACONF_SSH_SETTINGS.SSH_RECOMPRESS_LEVEL,
+        recompress_workers=DYNACONF_SSH_SETTINGS.SSH_RECOMPRESS_WORKERS,
+        recompress_max_in_flight_bytes=DYNACONF_SSH_SETTINGS.SSH_RECOMPRESS_MAX_IN_FLIGHT_BYTES,
+        keepalive_interval=DYNACONF_SSH_SETTINGS.SSH_KEEPALIVE_INTERVAL,
+        daemon_interval=DYNACONF_SSH_SETTINGS.SSH_DAEMON_INTERVAL,
+        daemon_cron=DYNACONF_SSH_SETTINGS.SSH_DAEMON_CRON,
+    )
+
+
+def __getattr__(name: str) -> t.Any:
+    ## `settings` & `ssh_settings` are loaded on first use instead of on import, so
+    #  importing the library has no side effects (see get_settings()/get_ssh_settings())
+    if name == "settings":
+        return get_settings()
+    if name == "ssh_settings":
+        return get_ssh_settings()
+
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
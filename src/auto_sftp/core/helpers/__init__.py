@@ -1,4 +1,5 @@
 from __future__ import annotations
 
 from .cli import get_console, simple_spinner
+from .logging import SampledLog, init_logging
 from .os import get_host_os
@@ -0,0 +1,4 @@
+from __future__ import annotations
+
+from .classes import SampledLog
+from .methods import get_sinks, init_logging, set_event_rate
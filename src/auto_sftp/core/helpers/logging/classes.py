@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from . import methods
+
+from loguru import logger as log
+
+class SampledLog:
+    """Rate-limited log of per-item events (i.e. one per file), with a summary per batch.
+
+    Description:
+        On runs over hundreds of thousands of files, logging every file is visible in
+        profiles. Events are emitted at up to max_per_second (with a burst of as many), the
+        rest are only counted. `summary()` logs one record with the number of events & how
+        many were not logged.
+
+        Messages use loguru's `{}` placeholders, so a message is only formatted if it is
+        emitted & a sink accepts its level. Keyword fields are bound to the record, so they
+        appear under `extra` in JSON-lines output.
+
+    Params:
+        name (str): Name of the event, bound to each record as `event`.
+        level (str): Level events are logged at.
+        max_per_second (float | None): Events emitted per second. 0 emits every event.
+            Defaults to the rate set by `init_logging()`.
+    """
+
+    def __init__(
+        self,
+        name: str = None,
+        level: str = "DEBUG",
+        max_per_second: float | None = None,
+    ):
+        assert name, ValueError("Missing an event name")
+
+        self.name: str = name
+        self.level: str = level
+        self.max_per_second: float = (
+            methods.EVENT_RATE if max_per_second is None else max_per_second
+        )
+
+        self.count: int = 0
+        self.suppressed: int = 0
+
+        self._tokens: float = self.max_per_second
+        self._last: float = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _allow(self) -> bool:
+        if self.max_per_second <= 0:
+            return True
+
+        now: float = time.monotonic()
+        self._tokens = min(
+            self.max_per_second,
+            self._tokens + (now - self._last) * self.max_per_second,
+        )
+        self._last = now
+
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+
+        return False
+
+    def event(self, message: str, *args, **fields) -> None:
+        with self._lock:
+            self.count += 1
+            allowed: bool = self._allow()
+            if not allowed:
+                self.suppressed += 1
+
+        if allowed:
+            log.opt(depth=1).bind(event=self.name, **fields).log(
+                self.level, message, *args
+            )
+
+    def summary(self, message: str = "", level: str = "INFO", **fields) -> None:
+        """Log the number of events since the last summary, then reset the counts."""
+        with self._lock:
+            count, suppressed = self.count, self.suppressed
+            self.count, self.suppressed = 0, 0
+
+        log.opt(depth=1).bind(
+            event=f"{self.name}.summary", count=count, suppressed=suppressed, **fields
+        ).log(
+            level,
+            "{}: [{}] event(s), [{}] not logged{}",
+            self.name,
+            count,
+            suppressed,
+            f". {message}" if message else "",
+        )
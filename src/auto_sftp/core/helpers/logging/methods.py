@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from loguru import logger as log
+from red_utils.ext.loguru_utils import init_logger, sinks
+
+## Default per-item events per second of a SampledLog, see set_event_rate()
+EVENT_RATE: float = 10.0
+
+
+def set_event_rate(max_per_second: float = 10.0) -> None:
+    """Set the rate of `SampledLog`s created after this call. 0 logs every event."""
+    global EVENT_RATE
+
+    EVENT_RATE = max_per_second
+
+
+def get_sinks(
+    log_level: str = "INFO",
+    logs_dir: str | None = None,
+    json: bool = False,
+    enqueue: bool = True,
+) -> list[dict]:
+    """Build the app's loguru sinks.
+
+    Params:
+        log_level (str): Level of the stderr sink.
+        logs_dir (str | None): Directory for the app & error log files. `None` only logs
+            to stderr.
+        json (bool): Write the log files as JSON lines (`app.jsonl`, `error.jsonl`), one
+            serialized record per line including bound fields.
+        enqueue (bool): Hand records to a background thread that writes them, so logging
+            never blocks on I/O.
+    """
+    _sinks: list[dict] = [
+        {**sinks.LoguruSinkStdErr(level=log_level).as_dict(), "enqueue": enqueue}
+    ]
+
+    if logs_dir is None:
+        return _sinks
+
+    ext: str = "jsonl" if json else "log"
+    for file_sink in [
+        sinks.LoguruSinkAppFile(sink=f"{logs_dir}/app.{ext}"),
+        sinks.LoguruSinkErrFile(sink=f"{logs_dir}/error.{ext}"),
+    ]:
+        sink: dict = {**file_sink.as_dict(), "enqueue": enqueue}
+        if json:
+            sink["serialize"] = True
+            sink["colorize"] = False
+
+        _sinks.append(sink)
+
+    return _sinks
+
+
+def init_logging(
+    log_level: str = "INFO",
+    logs_dir: str | None = None,
+    json: bool = False,
+    enqueue: bool = True,
+    event_rate: float = EVENT_RATE,
+) -> None:
+    """Configure loguru with the app's sinks (see `get_sinks()`).
+
+    With enqueue, records are written by a background thread; it is flushed when the
+    interpreter exits.
+    """
+    init_logger(
+        sinks=get_sinks(log_level=log_level, logs_dir=logs_dir, json=json, enqueue=enqueue)
+    )
+    set_event_rate(event_rate)
@@ -5,21 +5,34 @@ from pathlib import Path
 import sys
 import typing as t
 
-from core import SSHSettings, settings, ssh_settings
-from core.helpers import get_host_os
+from core import SSHSettings, get_settings, get_ssh_settings
+from core.helpers import get_host_os, init_logging
 from core.paths import DATA_DIR, ENSURE_DIRS
 from loguru import logger as log
 from modules import ssh_mod
 from packages import sftp_backup
 from paramiko.channel import ChannelFile, ChannelStderrFile, ChannelStdinFile
-from red_utils.ext.loguru_utils import init_logger, sinks
 from red_utils.std import path_utils
 
 from packages import cleanup
 import pendulum
 
 
-def run_backup(ssh_settings: t.Union[SSHSettings, dict] = None):
+def run_backup(
+    ssh_settings: t.Union[SSHSettings, dict] = None,
+    ssh_manager: ssh_mod.SSHManager | None = None,
+    data_dir: t.Union[str, Path] | None = None,
+) -> sftp_backup.TransferReport:
+    """Back up ssh_settings' remote_cwd to its local_dest.
+
+    Only the passed settings are used, so a long-lived process can call this for many
+    targets, reusing a connected ssh_manager per target & a data_dir for each target's
+    state (see `sftp_backup.run_sftp_backup()`).
+
+    Returns:
+        (TransferReport): Files downloaded, bytes, duration & errors.
+
+    """
     assert ssh_settings, ValueError("Missing ssh_settings")
     assert isinstance(ssh_settings, SSHSettings) or isinstance(
         ssh_settings, dict
@@ -61,12 +74,16 @@ def run_backup(ssh_settings: t.Union[SSHSettings, dict] = None):
 
         log.info("Starting SFTP backup")
         try:
-            sftp_backup.run_sftp_backup(
+            report: sftp_backup.TransferReport = sftp_backup.run_sftp_backup(
                 ssh_settings=ssh_settings,
                 remote_dir=f"{_remote_dir}".replace("\\", "/"),
                 local_backup_path=f"{_local_backup_path}".replace("\\", "/"),
+                ssh_manager=ssh_manager,
+                data_dir=data_dir,
             )
             log.success(f"Transferred backups to '{_local_backup_path}'")
+
+            return report
         except Exception as exc:
             msg = Exception(f"Unhandled exception running sftp backup. Details: {exc}")
             log.error(msg)
@@ -79,9 +96,55 @@ def run_backup(ssh_settings: t.Union[SSHSettings, dict] = None):
         raise exc
 
 
-def main(ssh_settings: SSHSettings = ssh_settings, cleanup_threshold: int = 10):
+def plan_backup(
+    ssh_settings: SSHSettings = None,
+    ssh_manager: ssh_mod.SSHManager | None = None,
+) -> sftp_backup.TransferPlan:
+    """Report what `run_backup()` would download, without downloading anything."""
+    assert ssh_settings, ValueError("Missing ssh_settings")
+
+    _remote_dir = Path(f"{ssh_settings.remote_cwd}{ssh_settings.extra_path_suffix}")
+    _local_backup_path = Path(f"{ssh_settings.local_dest}{ssh_settings.extra_path_suffix}")
+
+    try:
+        plan: sftp_backup.TransferPlan = sftp_backup.plan_sftp_backup(
+            ssh_settings=ssh_settings,
+            remote_dir=f"{_remote_dir}".replace("\\", "/"),
+            local_backup_path=f"{_local_backup_path}".replace("\\", "/"),
+            ssh_manager=ssh_manager,
+        )
+    except Exception as exc:
+        msg = Exception(f"Unhandled exception planning SFTP backup. Details: {exc}")
+        log.error(msg)
+
+        raise exc
+
+    return plan
+
+
+def main(
+    ssh_settings: SSHSettings | None = None,
+    cleanup_threshold: int = 10,
+    ssh_manager: ssh_mod.SSHManager | None = None,
+) -> sftp_backup.TransferReport:
+    """Run a backup, then delete old local backups.
+
+    Uses the settings loaded from config/ssh/ when ssh_settings is `None`. Local backups
+    are scanned for cleanup while the backup runs, so retention is applied as soon as the
+    downloads finish.
+    """
+    if ssh_settings is None:
+        ssh_settings = get_ssh_settings()
+
+    cleanup_scan: cleanup.local.CleanupScan = cleanup.local.start_local_cleanup(
+        local_dest=Path(f"{ssh_settings.local_dest}{ssh_settings.extra_path_suffix}"),
+        threshold=cleanup_threshold,
+    )
+
     try:
-        run_backup(ssh_settings=ssh_settings)
+        report: sftp_backup.TransferReport = run_backup(
+            ssh_settings=ssh_settings, ssh_manager=ssh_manager
+        )
     except Exception as exc:
         msg = Exception(f"Unhandled exception running backup. Details: {exc}")
         log.error(msg)
@@ -89,34 +152,52 @@ def main(ssh_settings: SSHSettings = ssh_settings, cleanup_threshold: int = 10):
         raise exc
 
     try:
-        cleanup.local.run_local_cleanup(threshold=cleanup_threshold)
+        cleanup.local.finish_local_cleanup(
+            scan=cleanup_scan, new_files=report.files, removed_files=report.evicted
+        )
     except Exception as exc:
         msg = Exception(f"Unhandled exception running local cleanup. Details: {exc}")
         log.error(msg)
 
         raise exc
 
+    return report
+
 
 if __name__ == "__main__":
-    init_logger(sinks=[sinks.LoguruSinkStdErr(level=settings.log_level).as_dict()])
+    settings = get_settings()
+    ssh_settings = get_ssh_settings()
+
+    init_logging(
+        log_level=settings.log_level,
+        enqueue=settings.log_enqueue,
+        event_rate=settings.log_event_rate,
+    )
 
     path_utils.ensure_dirs_exist(ENSURE_DIRS)
 
     _os = get_host_os()
-    log.debug(f"Detected host OS as: {_os}")
+    log.debug("Detected host OS as: {}", _os)
 
     log.info("App start")
-    log.debug(f"App settings: {settings}")
-    log.debug(f"SSH settings: {ssh_settings}")
-
-    log.debug(
-        f"Private key [exists:{ssh_settings.privkey_exists}]: {ssh_settings.privkey}"
+    ## Arguments are only formatted (& the exists checks only run) if DEBUG is enabled
+    log.debug("App settings: {}", settings)
+    log.debug("SSH settings: {}", ssh_settings)
+
+    log.opt(lazy=True).debug(
+        "Private key [exists:{}]: {}",
+        lambda: ssh_settings.privkey_exists,
+        lambda: ssh_settings.privkey,
     )
-    log.debug(
-        f"Public key [exists:{ssh_settings.pubkey_exists}]: {ssh_settings.pubkey}"
+    log.opt(lazy=True).debug(
+        "Public key [exists:{}]: {}",
+        lambda: ssh_settings.pubkey_exists,
+        lambda: ssh_settings.pubkey,
     )
-    log.debug(
-        f"Local destination [exists:{ssh_settings.local_dest_exists}]: {ssh_settings.local_dest}"
+    log.opt(lazy=True).debug(
+        "Local destination [exists:{}]: {}",
+        lambda: ssh_settings.local_dest_exists,
+        lambda: ssh_settings.local_dest,
     )
 
     main(cleanup_threshold=ssh_settings.local_backup_limit)
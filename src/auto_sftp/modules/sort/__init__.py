@@ -1 +1,7 @@
-from .__methods import sort_into_date_dirs
+from .__methods import (
+    crawl_files,
+    date_partition_template,
+    extract_dt_from_filename,
+    extract_dts_from_filenames,
+    sort_into_date_dirs,
+)
@@ -1,26 +1,105 @@
 import typing as t
 from pathlib import Path
+from datetime import datetime
+from functools import lru_cache
+import os
 import re
 from loguru import logger as log
 
-from core import settings, ssh_settings
-
-from red_utils.std import path_utils
+from core import get_ssh_settings
 
 import pendulum
 
+DEFAULT_TS_PATTERN: str = r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2})"
+DEFAULT_TS_FORMAT: str = "YYYY-MM-DD_HH-mm"
+
+## Precompiled default timestamp pattern
+TS_REGEX: re.Pattern = re.compile(DEFAULT_TS_PATTERN)
+
+## Above this many files, _pre_sort_files() parses timestamps with pandas
+VECTORIZE_THRESHOLD: int = 100_000
+
+## Pendulum format tokens that have a direct strptime equivalent
+_PENDULUM_STRPTIME_TOKENS: dict[str, str] = {
+    "YYYY": "%Y",
+    "MM": "%m",
+    "DD": "%d",
+    "HH": "%H",
+    "mm": "%M",
+    "ss": "%S",
+}
+_PENDULUM_TOKEN_REGEX: re.Pattern = re.compile(r"YYYY|MM|DD|HH|mm|ss|[A-Za-z]+")
+
+
+@lru_cache(maxsize=32)
+def _compile_ts_pattern(ts_pattern: str) -> re.Pattern:
+    if ts_pattern == DEFAULT_TS_PATTERN:
+        return TS_REGEX
+
+    return re.compile(ts_pattern)
+
+
+@lru_cache(maxsize=32)
+def _pendulum_to_strptime(ts_format: str) -> str | None:
+    """Translate a pendulum format string to a strptime format.
+
+    Returns `None` if the format uses a token with no strptime equivalent, in which case
+    callers should fall back to `pendulum.from_format()`.
+    """
+    parts: list[str] = []
+    pos: int = 0
+
+    for match in _PENDULUM_TOKEN_REGEX.finditer(ts_format):
+        token = match.group(0)
+        if token not in _PENDULUM_STRPTIME_TOKENS:
+            return None
+
+        parts.append(ts_format[pos : match.start()].replace("%", "%%"))
+        parts.append(_PENDULUM_STRPTIME_TOKENS[token])
+        pos = match.end()
+
+    parts.append(ts_format[pos:].replace("%", "%%"))
+
+    return "".join(parts)
+
+
+@lru_cache(maxsize=65536)
+def _parse_ts_str(timestamp_str: str, ts_format: str) -> pendulum.DateTime:
+    """Parse a timestamp string, memoizing the result.
+
+    Backups are usually created on a schedule, so the same timestamp string shows up
+    across many filenames.
+    """
+    if ts_format == DEFAULT_TS_FORMAT:
+        ## YYYY-MM-DD_HH-mm, sliced directly
+        return pendulum.datetime(
+            int(timestamp_str[0:4]),
+            int(timestamp_str[5:7]),
+            int(timestamp_str[8:10]),
+            int(timestamp_str[11:13]),
+            int(timestamp_str[14:16]),
+        )
+
+    strptime_format = _pendulum_to_strptime(ts_format)
+    if strptime_format is not None:
+        return pendulum.instance(
+            datetime.strptime(timestamp_str, strptime_format), tz="UTC"
+        )
+
+    return pendulum.from_format(timestamp_str, ts_format)
+
 
 def extract_dt_from_filename(
     filename: t.Union[str, Path] = None,
-    ts_pattern: str = r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2})",
+    ts_pattern: str = DEFAULT_TS_PATTERN,
     # ts_format: str = "YYYY-MM-DD HH:mm",
-    ts_format: str = "YYYY-MM-DD_HH-mm",
+    ts_format: str = DEFAULT_TS_FORMAT,
 ):
     filename: str = f"{filename}"
     # log.debug(f"Filename: {filename}")
 
     # Search for the pattern in the filename
-    match = re.search(ts_pattern, filename)
+    match = _compile_ts_pattern(ts_pattern).search(filename)
     # log.debug(f"Found match: {match}")
 
     if match:
@@ -29,11 +108,7 @@ def extract_dt_from_filename(
         # log.debug(f"Extracted timestamp string: {timestamp_str}")
 
         # Convert the timestamp string to a Pendulum DateTime object
-        # Replace '_' with ' ' and '-' with ':' for correct format
-        # timestamp_str = timestamp_str.replace("_", " ").replace("-", ":", 2)
-        # log.debug(f"Formatted timestamp string: {timestamp_str}")
-
-        datetime_obj = pendulum.from_format(timestamp_str, ts_format)
+        datetime_obj = _parse_ts_str(timestamp_str, ts_format)
         # log.debug(f"Pendulum DateTime object: {datetime_obj}")
 
         return datetime_obj
@@ -41,12 +116,121 @@ def extract_dt_from_filename(
         raise ValueError(f"No valid timestamp found in filename: '{filename}'")
 
 
-def _pre_sort_files(files: list[Path] = None):
-    filename_dt_pairs: list[dict[str, t.Union[str, pendulum.DateTime]]] = []
+def extract_dts_from_filenames(
+    filenames: list[t.Union[str, Path]] = None,
+    ts_pattern: str = DEFAULT_TS_PATTERN,
+    ts_format: str = DEFAULT_TS_FORMAT,
+    as_pendulum: bool = True,
+) -> list[datetime | None]:
+    """Vectorized `extract_dt_from_filename()` for large batches of filenames.
+
+    Description:
+        Extracts & parses timestamps for all filenames at once with pandas. Filenames with
+        no valid timestamp are returned as `None` instead of raising a `ValueError`.
+
+        Building a `pendulum.DateTime` is the most expensive part of parsing a batch, so
+        callers that only need the date parts should pass `as_pendulum=False` to get
+        timezone-aware `datetime.datetime` objects instead.
+
+    Params:
+        filenames (list[str | Path]): Filenames to parse.
+        ts_pattern (str): Regex with one capture group matching the timestamp.
+        ts_format (str): Pendulum format of the captured timestamp.
+        as_pendulum (bool): Return `pendulum.DateTime` objects instead of `datetime.datetime`.
+    """
+    assert filenames is not None, ValueError("Missing list of filenames")
+
+    strptime_format = _pendulum_to_strptime(ts_format)
+    if strptime_format is None:
+        log.warning(
+            f"Timestamp format '{ts_format}' has no strptime equivalent. Parsing filenames one at a time."
+        )
+        dts: list[pendulum.DateTime | None] = []
+        for f in filenames:
+            try:
+                dts.append(extract_dt_from_filename(f, ts_pattern, ts_format))
+            except ValueError:
+                dts.append(None)
+
+        return dts
+
+    ## Imported here so the per-file path does not pay for importing pandas
+    import pandas as pd
+
+    names = pd.Series([f"{f}" for f in filenames], dtype="string")
+    ts_strs = names.str.extract(ts_pattern, expand=False)
+    parsed = pd.to_datetime(ts_strs, format=strptime_format, errors="coerce", utc=True)
+
+    ## Convert each distinct timestamp to pendulum once, then map back by position
+    codes, uniques = pd.factorize(parsed)
+    if as_pendulum:
+        unique_dts: list[datetime] = [
+            pendulum.instance(ts.to_pydatetime()) for ts in uniques
+        ]
+    else:
+        unique_dts: list[datetime] = list(uniques.to_pydatetime())
+
+    return [None if code < 0 else unique_dts[code] for code in codes]
 
-    for _file in files:
-        filename_dt = extract_dt_from_filename(filename=_file)
-        dest_path = _append_local_dest(dt=filename_dt, src_filename=_file.name)
+
+def crawl_files(
+    src_dir: t.Union[str, Path] = None, filetype_filters: list[str] | None = None
+) -> list[Path]:
+    """Recursively list files in src_dir in one pass, matching any of filetype_filters.
+
+    Params:
+        src_dir (str | Path): Directory to crawl.
+        filetype_filters (list[str] | None): File suffixes to match, i.e. `[".tar.gz", ".zip"]`.
+            If empty or `None`, all files are returned.
+    """
+    extensions: tuple[str, ...] | None = (
+        tuple(filetype_filters) if filetype_filters else None
+    )
+    files: list[Path] = []
+    stack: list[str] = [f"{src_dir}"]
+
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif extensions is None or entry.name.endswith(extensions):
+                        files.append(Path(entry.path))
+        except OSError as exc:
+            log.warning(f"Unable to scan directory '{current}'. Details: {exc}")
+
+            continue
+
+    return files
+
+
+def _pre_sort_files(files: list[Path] = None, dest_root: t.Union[str, Path] = None):
+    filename_dt_pairs: list[dict[str, t.Union[str, Path, datetime]]] = []
+
+    if len(files) >= VECTORIZE_THRESHOLD:
+        filename_dts = extract_dts_from_filenames(
+            filenames=[f.name for f in files], as_pendulum=False
+        )
+    else:
+        filename_dts = []
+        for _file in files:
+            try:
+                filename_dts.append(extract_dt_from_filename(filename=_file.name))
+            except ValueError:
+                filename_dts.append(None)
+
+    skipped: int = 0
+
+    for _file, filename_dt in zip(files, filename_dts):
+        if filename_dt is None:
+            skipped += 1
+            continue
+
+        dest_path = _append_local_dest(
+            dt=filename_dt, src_filename=_file.name, dest_root=dest_root
+        )
 
         _pair = {
             "filename": _file.name,
@@ -56,24 +240,73 @@ def _pre_sort_files(files: list[Path] = None):
         }
         filename_dt_pairs.append(_pair)
 
+    if skipped:
+        log.warning(f"Skipped [{skipped}] file(s) with no valid timestamp in filename")
+
     return filename_dt_pairs
 
 
-def _append_local_dest(dt: pendulum.DateTime = None, src_filename: str = None):
-    dir_path = Path(
-        f"{ssh_settings.local_dest}/{dt.year}/{dt.month}/{dt.day}/{src_filename}"
-    )
+def _append_local_dest(
+    dt: datetime = None,
+    src_filename: str = None,
+    dest_root: t.Union[str, Path] = None,
+):
+    if dest_root is None:
+        dest_root = get_ssh_settings().local_dest
+
+    dir_path = Path(f"{dest_root}/{dt.year}/{dt.month}/{dt.day}/{src_filename}")
 
     return dir_path
 
 
+def date_partition_template(
+    dest_root: t.Union[str, Path] = None,
+    ts_pattern: str = DEFAULT_TS_PATTERN,
+    ts_format: str = DEFAULT_TS_FORMAT,
+) -> t.Callable[[str], Path]:
+    """Build a path template that places files in year/month/day directories under dest_root.
+
+    Description:
+        The returned function maps a (remote) file path to its local destination using the
+        timestamp in the filename, i.e. `dest_root/2024/3/5/2024-03-05_10-30_backup.tar.gz`.
+        Files with no timestamp in their name are placed directly in dest_root.
+
+    Params:
+        dest_root (str | Path): Root directory of the year/month/day tree.
+        ts_pattern (str): Regex with one capture group matching the timestamp.
+        ts_format (str): Pendulum format of the captured timestamp.
+    """
+    assert dest_root, ValueError("Missing a destination root directory")
+    dest_root: Path = Path(f"{dest_root}").expanduser()
+
+    def _template(remote_path: str) -> Path:
+        filename: str = os.path.basename(remote_path)
+
+        try:
+            filename_dt = extract_dt_from_filename(
+                filename=filename, ts_pattern=ts_pattern, ts_format=ts_format
+            )
+        except ValueError:
+            return dest_root / filename
+
+        return _append_local_dest(
+            dt=filename_dt, src_filename=filename, dest_root=dest_root
+        )
+
+    return _template
+
+
 def sort_into_date_dirs(
-    src_dir: t.Union[str, Path] = None, filetype_filters: list[str] | None = [".tar.gz"]
+    src_dir: t.Union[str, Path] = None,
+    filetype_filters: list[str] | None = [".tar.gz", ".tar.zst"],
+    dest_root: t.Union[str, Path] = None,
 ):
     """Sort files in a path into subdirectories based on year, month, day.
 
     Files must contain a formatted timestamp somewhere in the filename, ideally at the beginning.
     i.e. `YYYY-MM-DD_HH-ss-ss_filename.tar.gz`
+
+    Returns a list of dicts describing each file's source & planned destination.
     """
     assert src_dir, ValueError("Missing a src_dir to scan")
     assert isinstance(src_dir, Path) or isinstance(src_dir, str), TypeError(
@@ -86,26 +319,20 @@ def sort_into_date_dirs(
     if not src_dir.exists():
         raise FileNotFoundError(f"Could not find src_dir '{src_dir}'.")
 
-    files_list = []
-
-    if filetype_filters:
-        for _ext in filetype_filters:
-            _files: list[Path] = path_utils.crawl_dir(
-                target=src_dir, filetype_filter=_ext, return_type="files"
-            )
-
-            try:
-                files_list = files_list + _files
-            except Exception as exc:
-                msg = Exception(
-                    f"Unhandled exception merging list of crawled files into existing files list. Details: {exc}"
-                )
-                log.warning(msg)
+    try:
+        files_list: list[Path] = crawl_files(
+            src_dir=src_dir, filetype_filters=filetype_filters
+        )
+    except Exception as exc:
+        msg = Exception(
+            f"Unhandled exception crawling path '{src_dir}' for files. Details: {exc}"
+        )
+        log.error(msg)
 
-                continue
+        raise exc
 
-    file_sort_meta = _pre_sort_files(files=files_list)
-    log.debug(f"Example file sort meta: {file_sort_meta[0]}")
+    file_sort_meta = _pre_sort_files(files=files_list, dest_root=dest_root)
+    if file_sort_meta:
+        log.debug(f"Example file sort meta: {file_sort_meta[0]}")
 
-    # log.info(f"Sorting files in path '{src_dir}' into year/month/day directories.")
-    # _pre_sort_files()
+    return file_sort_meta
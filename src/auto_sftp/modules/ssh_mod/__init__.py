@@ -1,8 +1,13 @@
 from __future__ import annotations
 
+from . import cache, delta, keys, transfer, writer
+from .cache import RemoteListingCache
 from .context import (
     SSHManager,
     get_sftp_client,
     get_ssh_client,
 )
+from .filters import WalkFilter
 from .methods import get_sftp_client, get_ssh_client, sftp_download_all, upload_ssh_key
+from .pipeline import PipelineResult, SFTPPipeline
+from .stability import StabilityCheck
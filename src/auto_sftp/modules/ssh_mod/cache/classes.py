@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+import time
+import typing as t
+
+from core.paths import DATA_DIR
+from loguru import logger as log
+from paramiko.sftp_attr import SFTPAttributes
+
+DEFAULT_LISTING_CACHE_FILE: Path = Path(f"{DATA_DIR}/remote_listing_cache.json")
+
+## SFTP (v3) mtimes have 1 second resolution. A directory modified within this many
+#  seconds of being listed may change again without its mtime changing, so it isn't cached.
+MTIME_SETTLE_SECONDS: int = 2
+
+
+class RemoteListingCache:
+    """Persisted cache of remote directory listings, keyed on each directory's mtime.
+
+    Description:
+        Stores `directory path -> (mtime, child entries)` for a single remote. A directory's
+        mtime changes whenever an entry is added, removed or renamed in it, so if a
+        directory's current mtime matches the cached one, its cached children can be reused
+        instead of listing it again.
+
+        Files modified in place do not change their parent directory's mtime, so cached
+        child sizes & mtimes can be stale. Callers that need exact file attributes should
+        stat the files they care about.
+
+    Params:
+        namespace (str): Identifies the remote, i.e. `user@host:port`.
+        cache_file (str | Path): JSON file the cache is persisted to.
+    """
+
+    def __init__(
+        self,
+        namespace: str = None,
+        cache_file: t.Union[str, Path] = DEFAULT_LISTING_CACHE_FILE,
+    ):
+        assert namespace, ValueError("Missing a cache namespace")
+
+        self.namespace: str = namespace
+        self.cache_file: Path = Path(f"{cache_file}")
+
+        self._all: dict[str, dict[str, dict]] = self._load()
+        self._dirs: dict[str, dict] = self._all.setdefault(namespace, {})
+        self._dirty: bool = False
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def _load(self) -> dict[str, dict[str, dict]]:
+        if not self.cache_file.exists():
+            return {}
+
+        try:
+            with open(self.cache_file, "r") as f:
+                return json.load(f)
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception reading listing cache '{self.cache_file}'. Starting with an empty cache. Details: {exc}"
+            )
+            log.warning(msg)
+
+            return {}
+
+    def get(self, remote_dir: str = None, mtime: int | None = None) -> list[SFTPAttributes] | None:
+        """Return cached children of remote_dir if its mtime is unchanged, otherwise `None`."""
+        cached: dict | None = self._dirs.get(remote_dir)
+
+        if cached is None or mtime is None or cached["mtime"] != mtime:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        entries: list[SFTPAttributes] = []
+        for filename, st_mode, st_size, st_mtime in cached["entries"]:
+            attr = SFTPAttributes()
+            attr.filename = filename
+            attr.st_mode = st_mode
+            attr.st_size = st_size
+            attr.st_mtime = st_mtime
+            entries.append(attr)
+
+        return entries
+
+    def put(
+        self,
+        remote_dir: str = None,
+        mtime: int | None = None,
+        entries: list[SFTPAttributes] = None,
+    ) -> None:
+        """Cache the children of remote_dir at the given directory mtime."""
+        if mtime is None or mtime >= time.time() - MTIME_SETTLE_SECONDS:
+            ## Unknown or too-recent mtime, can't tell if a later change would be visible
+            self.discard(remote_dir)
+            return
+
+        self._dirs[remote_dir] = {
+            "mtime": mtime,
+            "entries": [
+                [e.filename, e.st_mode, e.st_size, e.st_mtime] for e in entries
+            ],
+        }
+        self._dirty = True
+
+    def discard(self, remote_dir: str = None) -> None:
+        if self._dirs.pop(remote_dir, None) is not None:
+            self._dirty = True
+
+    def prune(self, root: str = None, seen: set[str] = None) -> None:
+        """Drop cached directories under root that were not seen during the last walk."""
+        prefix: str = f"{root.rstrip('/')}/"
+
+        for remote_dir in list(self._dirs):
+            if (remote_dir == root or remote_dir.startswith(prefix)) and remote_dir not in seen:
+                del self._dirs[remote_dir]
+                self._dirty = True
+
+    def save(self) -> None:
+        """Write the cache to disk, if it changed."""
+        if not self._dirty:
+            return
+
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file: Path = self.cache_file.with_name(f"{self.cache_file.name}.tmp")
+
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump(self._all, f)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception saving listing cache '{self.cache_file}'. Details: {exc}"
+            )
+            log.error(msg)
+
+            raise exc
+
+        self._dirty = False
+        log.debug(
+            f"Saved listing cache '{self.cache_file}' (hits: {self.hits}, misses: {self.misses})"
+        )
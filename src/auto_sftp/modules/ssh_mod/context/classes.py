@@ -1,15 +1,24 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import AbstractContextManager
 from pathlib import Path
 import typing as t
+import errno
 import os
+import time
 from stat import S_ISDIR
 
 from core import helpers
 from loguru import logger as log
 import paramiko
 
+from .. import delta, keys, transfer, writer
+from ..cache import RemoteListingCache
+from ..filters import WalkFilter
+from ..pipeline import PipelineResult, SFTPPipeline
+from ..stability import StabilityCheck
+
 
 class SSHManager(AbstractContextManager):
     def __init__(
@@ -20,12 +29,15 @@ class SSHManager(AbstractContextManager):
         password: str | None = None,
         ssh_keyfile: t.Union[str, Path] | None = None,
         timeout: int = 5000,
+        keepalive: int = 0,
     ):
         self.host: str = host
         self.port: int = port
         self.user: str = user
         self.password: str | None = password
         self.timeout: int = timeout
+        ## Seconds between keepalive packets on an idle connection. 0 disables keepalives
+        self.keepalive: int = keepalive
 
         if ssh_keyfile:
             if isinstance(ssh_keyfile, str):
@@ -44,20 +56,77 @@ class SSHManager(AbstractContextManager):
         ## Initialize a parameter for a paramiko.SSHClient
         self.ssh_client = None
 
+        ## Seconds spent loading keys & on the handshake (TCP connect, key exchange &
+        #  authentication) of each connection opened by this manager
+        self.key_load_seconds: float = 0.0
+        self.handshake_seconds: list[float] = []
+
     def __enter__(self) -> t.Self:
+        return self.connect()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+        if exc_type is not None:
+            msg = f"({exc_type}) Unhandled exception during SSH session: {exc_value}"
+            log.error(msg)
+
+            if traceback:
+                log.error(f"Traceback:\n{traceback}")
+
+            raise exc_value
+
+        return
+
+    @property
+    def is_connected(self) -> bool:
+        """`True` if the SSH connection is open & its transport is still active."""
+        if self.ssh_client is None:
+            return False
+
+        transport: paramiko.Transport | None = self.ssh_client.get_transport()
+
+        return transport is not None and transport.is_active()
+
+    def connect(self) -> t.Self:
+        """Open the SSH connection. Closes any previous connection first."""
+        self.close()
+
+        started: float = time.perf_counter()
+        pkey: paramiko.PKey | None = None
+        if self.ssh_keyfile:
+            try:
+                pkey = keys.load_private_key(self.ssh_keyfile, passphrase=self.password)
+            except Exception as exc:
+                log.warning(
+                    f"Unable to load private key '{self.ssh_keyfile}', leaving it to paramiko. Details: {exc}"
+                )
+
         self.ssh_client = paramiko.SSHClient()
-        self.ssh_client.load_system_host_keys()
+        ## Shared, parsed once per process. paramiko only reads system host keys, new
+        #  hosts are added to the client's own host keys by AutoAddPolicy
+        self.ssh_client._system_host_keys = keys.load_known_hosts()
         self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.key_load_seconds += time.perf_counter() - started
 
         try:
+            started = time.perf_counter()
             self.ssh_client.connect(
                 hostname=self.host,
                 port=self.port,
                 username=self.user,
                 password=self.password,
-                key_filename=self.ssh_keyfile,
+                pkey=pkey,
+                key_filename=self.ssh_keyfile if pkey is None else None,
                 timeout=self.timeout,
             )
+            self.handshake_seconds.append(time.perf_counter() - started)
+            log.debug(
+                f"Connected to {self.user}@{self.host}:{self.port}, handshake took {self.handshake_seconds[-1]:.3f}s"
+            )
+
+            if self.keepalive:
+                self.ssh_client.get_transport().set_keepalive(self.keepalive)
 
             return self
         except Exception as exc:
@@ -67,25 +136,15 @@ class SSHManager(AbstractContextManager):
             log.error(msg)
 
             self.ssh_client.close()
+            self.ssh_client = None
 
             raise exc
 
-    def __exit__(self, exc_type, exc_value, traceback):
+    def close(self) -> None:
         if self.ssh_client:
             self.ssh_client.close()
             self.ssh_client = None
 
-        if exc_type is not None:
-            msg = f"({exc_type}) Unhandled exception during SSH session: {exc_value}"
-            log.error(msg)
-
-            if traceback:
-                log.error(f"Traceback:\n{traceback}")
-
-            raise exc_value
-
-        return
-
     def get_sftp_client(self) -> paramiko.SFTPClient:
         if self.ssh_client is None:
             raise ValueError("SSH client has not been initialized")
@@ -136,33 +195,673 @@ class SSHManager(AbstractContextManager):
 
                 raise exc
 
-    def _sftp_walk(self, sftp_client: paramiko.SFTPClient, remotepath: str):
-        files_to_download = []
+    def sftp_list_partitions(
+        self, remote_paths: list[str] = None, max_workers: int = 4
+    ) -> dict[str, list[str]]:
+        """List several remote directories concurrently.
 
-        def recursive_walk(remotepath):
-            for item in sftp_client.listdir_attr(remotepath):
+        Description:
+            Each worker opens its own SFTP session on the shared SSH transport, so listings
+            run in parallel instead of waiting on each other's round trips. Directories that
+            do not exist on the remote are returned with an empty list.
 
-                # log.info(f"Processing item: {item.filename}")
+        Params:
+            remote_paths (list[str]): Remote directories to list.
+            max_workers (int): Maximum number of directories to list at once.
 
-                remote_item = f"{remotepath}/{item.filename}"
-                if S_ISDIR(item.st_mode):
-                    # log.info(f"Item is a directory: {item.filename}")
-                    recursive_walk(remote_item)
+        Returns:
+            (dict[str, list[str]]): Map of remote directory -> filenames in that directory.
 
-                else:
-                    # log.info(f"Item is a file: {item.filename}")
-                    files_to_download.append(remote_item)
+        """
+        assert remote_paths is not None, ValueError("Missing remote paths to list")
+        assert isinstance(max_workers, int) and max_workers > 0, ValueError(
+            f"max_workers must be a positive integer. Got: {max_workers}"
+        )
+
+        def _list_partition(remote_path: str) -> list[str]:
+            sftp: paramiko.SFTPClient = self.get_sftp_client()
+            try:
+                return sftp.listdir(path=remote_path)
+            except IOError as exc:
+                if exc.errno == errno.ENOENT:
+                    log.debug(f"Remote path '{remote_path}' does not exist")
+                    return []
+
+                raise exc
+            finally:
+                sftp.close()
+
+        log.info(f"Listing [{len(remote_paths)}] remote path(s) on {self.host}")
+        try:
+            with ThreadPoolExecutor(
+                max_workers=min(max_workers, max(len(remote_paths), 1))
+            ) as executor:
+                return dict(
+                    zip(remote_paths, executor.map(_list_partition, remote_paths))
+                )
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception listing remote paths on {self.host}. Details: {exc}"
+            )
+            log.error(msg)
+
+            raise exc
+
+    def _get_pipeline(
+        self, sftp_client: paramiko.SFTPClient | None = None, max_in_flight: int = 64
+    ) -> tuple[SFTPPipeline, bool]:
+        """Return an SFTPPipeline, and whether the SFTP client was opened for it."""
+        if sftp_client is not None:
+            return SFTPPipeline(sftp_client=sftp_client, max_in_flight=max_in_flight), False
+
+        return (
+            SFTPPipeline(
+                sftp_client=self.get_sftp_client(), max_in_flight=max_in_flight
+            ),
+            True,
+        )
+
+    def stat_many(
+        self,
+        remote_paths: t.Iterable[str] = None,
+        sftp_client: paramiko.SFTPClient | None = None,
+        max_in_flight: int = 64,
+        follow_symlinks: bool = True,
+    ) -> PipelineResult:
+        """Stat many remote paths with pipelined SFTP requests.
+
+        Params:
+            remote_paths (Iterable[str]): Remote paths to stat.
+            sftp_client (paramiko.SFTPClient): An existing SFTP client to reuse. If `None`, a
+                new SFTP session is opened for the batch & closed when it finishes.
+            max_in_flight (int): Maximum number of requests awaiting a reply at once.
+            follow_symlinks (bool): When `False`, use `lstat` instead of `stat`.
+
+        Returns:
+            (PipelineResult): `results` maps path -> `paramiko.SFTPAttributes`, `errors` maps
+                path -> exception.
+
+        """
+        assert remote_paths is not None, ValueError("Missing remote paths to stat")
+
+        pipeline, opened = self._get_pipeline(
+            sftp_client=sftp_client, max_in_flight=max_in_flight
+        )
+        try:
+            return pipeline.stat_many(paths=remote_paths, follow_symlinks=follow_symlinks)
+        except Exception as exc:
+            msg = Exception(f"Unhandled exception stating remote paths. Details: {exc}")
+            log.error(msg)
+
+            raise exc
+        finally:
+            if opened:
+                pipeline.sftp_client.close()
+
+    def remove_many(
+        self,
+        remote_paths: t.Iterable[str] = None,
+        sftp_client: paramiko.SFTPClient | None = None,
+        max_in_flight: int = 64,
+    ) -> PipelineResult:
+        """Remove many remote files with pipelined SFTP requests."""
+        assert remote_paths is not None, ValueError("Missing remote paths to remove")
+
+        pipeline, opened = self._get_pipeline(
+            sftp_client=sftp_client, max_in_flight=max_in_flight
+        )
+        try:
+            return pipeline.remove_many(paths=remote_paths)
+        except Exception as exc:
+            msg = Exception(f"Unhandled exception removing remote paths. Details: {exc}")
+            log.error(msg)
+
+            raise exc
+        finally:
+            if opened:
+                pipeline.sftp_client.close()
+
+    def rename_many(
+        self,
+        remote_pairs: t.Iterable[tuple[str, str]] = None,
+        sftp_client: paramiko.SFTPClient | None = None,
+        max_in_flight: int = 64,
+    ) -> PipelineResult:
+        """Rename many remote paths with pipelined SFTP requests.
+
+        Params:
+            remote_pairs (Iterable[tuple[str, str]]): `(src, dest)` pairs to rename.
+        """
+        assert remote_pairs is not None, ValueError("Missing remote paths to rename")
+
+        pipeline, opened = self._get_pipeline(
+            sftp_client=sftp_client, max_in_flight=max_in_flight
+        )
+        try:
+            return pipeline.rename_many(pairs=remote_pairs)
+        except Exception as exc:
+            msg = Exception(f"Unhandled exception renaming remote paths. Details: {exc}")
+            log.error(msg)
+
+            raise exc
+        finally:
+            if opened:
+                pipeline.sftp_client.close()
+
+    def _sftp_delta_update(
+        self,
+        sftp_client: paramiko.SFTPClient,
+        candidates: list[tuple[str, Path]],
+        commits: writer.CommitBatch,
+        download: t.Callable[[transfer.TransferJob], None],
+        block_size: int = delta.DEFAULT_BLOCK_SIZE,
+        python_bin: str = "python3",
+        run_helper: delta.HelperRunner | None = None,
+        helper_timeout: int = delta.DEFAULT_HELPER_TIMEOUT,
+        reserve_space: t.Callable[[transfer.TransferJob], None] | None = None,
+        release_space: t.Callable[[transfer.TransferJob], None] | None = None,
+    ) -> None:
+        """Delta-update local copies of remote files that changed since they were downloaded.
+
+        Description:
+            Candidates are stat'ed in one pipelined batch, because cached listings may hold
+            stale sizes for files modified in place. A file has changed if its size differs
+            from the local copy, or its remote mtime is newer than the local copy's.
+
+            Updated files are written to their temporary path & queued on commits, like
+            downloads, so they are committed, journaled & passed to `on_commit` the same
+            way. If a delta transfer fails, or too much of the file changed for it to be
+            worthwhile, the file is downloaded in full with download instead.
+        """
+        remote_stats = SFTPPipeline(sftp_client=sftp_client).stat_many(
+            paths=[remote_item for remote_item, _ in candidates]
+        )
+        if run_helper is None:
+            run_helper = delta.ssh_helper_runner(
+                ssh_client=self.ssh_client, timeout=helper_timeout
+            )
+        helper_command: str = delta.get_helper_command(python_bin=python_bin)
+
+        for remote_item, local_item in candidates:
+            remote_attrs = remote_stats.results.get(remote_item)
+            if remote_attrs is None:
+                log.warning(
+                    f"Unable to stat remote file '{remote_item}'. Skipping delta update. Details: {remote_stats.errors.get(remote_item)}"
+                )
+                continue
+
+            local_stat = local_item.stat()
+            if (
+                remote_attrs.st_size == local_stat.st_size
+                and remote_attrs.st_mtime <= local_stat.st_mtime
+            ):
+                continue
+
+            job = transfer.TransferJob(
+                remote_path=remote_item,
+                local_path=local_item,
+                temp_path=commits.temp_path(local_item),
+                size=remote_attrs.st_size or 0,
+            )
+            if reserve_space is not None:
+                try:
+                    reserve_space(job)
+                except Exception as exc:
+                    log.warning(
+                        f"Skipping delta update of '{local_item}'. Details: {exc}"
+                    )
+                    continue
+
+            try:
+                try:
+                    with helpers.simple_spinner(
+                        text=f"Delta updating file '{local_item}' from '{remote_item}' ..."
+                    ):
+                        delta_stats = delta.delta_download(
+                            sftp_client=sftp_client,
+                            remote_path=remote_item,
+                            local_path=local_item,
+                            run_helper=run_helper,
+                            block_size=block_size,
+                            helper_command=helper_command,
+                            dest_path=job.temp_path,
+                        )
+                except Exception as exc:
+                    log.warning(
+                        f"Delta update of '{local_item}' failed, downloading in full. Details: {exc}"
+                    )
+                    delta_stats = None
+
+                if delta_stats is None:
+                    download(job)
+
+                ## Match the remote mtime, so unchanged files are skipped next time
+                os.utime(job.temp_path, (local_stat.st_atime, remote_attrs.st_mtime))
+            except Exception as exc:
+                job.temp_path.unlink(missing_ok=True)
+                if release_space is not None:
+                    release_space(job)
+
+                raise exc
+
+            commits.add(temp_path=job.temp_path, final_path=local_item, size=job.size)
+
+    def _sftp_walk_attrs(
+        self,
+        sftp_client: paramiko.SFTPClient,
+        remotepath: str,
+        listing_cache: RemoteListingCache | None = None,
+        walk_filter: WalkFilter | None = None,
+    ) -> list[tuple[str, paramiko.SFTPAttributes]]:
+        """Recursively list files under remotepath, returning `(path, attributes)` pairs.
+
+        Description:
+            With a walk_filter, excluded directories are never listed & excluded files are
+            left out. Rules match paths relative to remotepath.
+
+            Without a listing_cache, every directory is listed with `listdir_attr()`.
 
-        # log.info(f"Crawling remote path: {remotepath}")
-        recursive_walk(remotepath)
+            With a listing_cache, the tree is walked one level at a time. Directories whose
+            mtime isn't already known from a fresh listing are stat'ed in one pipelined
+            batch, and directories whose mtime matches the cache reuse the cached children
+            instead of being listed again.
+        """
+        files_to_download: list[tuple[str, paramiko.SFTPAttributes]] = []
+        if walk_filter is not None and walk_filter.is_empty:
+            walk_filter = None
+        ## Offset of paths relative to remotepath, for walk_filter
+        rel_start: int = len(remotepath.rstrip("/")) + 1
+
+        if listing_cache is None:
+
+            def recursive_walk(remotepath):
+                for item in sftp_client.listdir_attr(remotepath):
+
+                    # log.info(f"Processing item: {item.filename}")
+
+                    remote_item = f"{remotepath}/{item.filename}"
+                    if S_ISDIR(item.st_mode):
+                        # log.info(f"Item is a directory: {item.filename}")
+                        if walk_filter is None or walk_filter.allow_dir(
+                            remote_item[rel_start:]
+                        ):
+                            recursive_walk(remote_item)
+
+                    elif walk_filter is None or walk_filter.allow_file(
+                        remote_item[rel_start:], item
+                    ):
+                        # log.info(f"Item is a file: {item.filename}")
+                        files_to_download.append((remote_item, item))
+
+            # log.info(f"Crawling remote path: {remotepath}")
+            recursive_walk(remotepath)
+
+            return files_to_download
+
+        pipeline = SFTPPipeline(sftp_client=sftp_client)
+        seen_dirs: set[str] = set()
+        ## (directory, mtime) pairs for the current level. mtime is None when it must be stat'ed.
+        level: list[tuple[str, int | None]] = [(remotepath, None)]
+
+        while level:
+            unknown: list[str] = [d for d, mtime in level if mtime is None]
+            dir_stats = pipeline.stat_many(paths=unknown) if unknown else None
+
+            next_level: list[tuple[str, int | None]] = []
+            for remote_dir, mtime in level:
+                if mtime is None:
+                    if remote_dir in dir_stats.errors:
+                        if remote_dir == remotepath:
+                            raise dir_stats.errors[remote_dir]
+
+                        log.warning(
+                            f"Unable to stat remote directory '{remote_dir}'. Skipping. Details: {dir_stats.errors[remote_dir]}"
+                        )
+                        continue
+
+                    mtime = dir_stats.results[remote_dir].st_mtime
+
+                seen_dirs.add(remote_dir)
+
+                entries = listing_cache.get(remote_dir=remote_dir, mtime=mtime)
+                fresh: bool = entries is None
+                if fresh:
+                    entries = sftp_client.listdir_attr(remote_dir)
+                    listing_cache.put(remote_dir=remote_dir, mtime=mtime, entries=entries)
+
+                for item in entries:
+                    remote_item = f"{remote_dir}/{item.filename}"
+                    if S_ISDIR(item.st_mode):
+                        if walk_filter is not None and not walk_filter.allow_dir(
+                            remote_item[rel_start:]
+                        ):
+                            continue
+
+                        ## A fresh listing has current mtimes for its subdirectories
+                        next_level.append((remote_item, item.st_mtime if fresh else None))
+                    elif walk_filter is None or walk_filter.allow_file(
+                        remote_item[rel_start:], item
+                    ):
+                        files_to_download.append((remote_item, item))
+
+            level = next_level
+
+        listing_cache.prune(root=remotepath, seen=seen_dirs)
 
         return files_to_download
 
+    def _sftp_walk(
+        self,
+        sftp_client: paramiko.SFTPClient,
+        remotepath: str,
+        listing_cache: RemoteListingCache | None = None,
+        walk_filter: WalkFilter | None = None,
+    ) -> list[str]:
+        return [
+            remote_item
+            for remote_item, _ in self._sftp_walk_attrs(
+                sftp_client=sftp_client,
+                remotepath=remotepath,
+                listing_cache=listing_cache,
+                walk_filter=walk_filter,
+            )
+        ]
+
+    @staticmethod
+    def _local_item_for(
+        remote_item: str,
+        local_dest: Path,
+        path_template: t.Callable[[str], Path] | None = None,
+    ) -> Path:
+        """Return the local path a remote file is downloaded to."""
+        if path_template is not None:
+            return Path(path_template(remote_item))
+
+        return local_dest / Path(os.path.basename(remote_item))
+
+    def _defer_unstable(
+        self,
+        sftp_client: paramiko.SFTPClient,
+        stability: StabilityCheck,
+        jobs: list[transfer.TransferJob],
+        delta_candidates: list[tuple[str, Path]] | None = None,
+        on_deferred: t.Callable[[dict[str, str]], None] | None = None,
+    ) -> tuple[list[transfer.TransferJob], list[tuple[str, Path]]]:
+        """Drop files the remote is still writing from jobs & delta_candidates.
+
+        Description:
+            Kept jobs get the size from the latest stat. Jobs refreshing an existing local
+            file are also dropped if the latest remote size matches the local copy, because
+            the size they were planned from may have come from a stale listing.
+
+        Returns:
+            (tuple[list[TransferJob], list[tuple[str, Path]]]): The jobs & delta candidates
+                to transfer now.
+
+        """
+        delta_candidates = delta_candidates or []
+        stable, deferred = stability.split(
+            stat_many=lambda paths: self.stat_many(
+                remote_paths=paths, sftp_client=sftp_client
+            ),
+            remote_paths=[job.remote_path for job in jobs]
+            + [remote_item for remote_item, _ in delta_candidates],
+        )
+        if deferred and on_deferred is not None:
+            on_deferred(deferred)
+
+        stable_jobs: list[transfer.TransferJob] = []
+        for job in jobs:
+            attrs: paramiko.SFTPAttributes | None = stable.get(job.remote_path)
+            if attrs is None:
+                continue
+
+            job.size = attrs.st_size or 0
+            if job.local_path.exists() and job.local_path.stat().st_size == job.size:
+                continue
+
+            stable_jobs.append(job)
+
+        return stable_jobs, [
+            candidate for candidate in delta_candidates if candidate[0] in stable
+        ]
+
+    def _truncated_jobs(
+        self,
+        sftp_client: paramiko.SFTPClient,
+        candidates: list[tuple[str, Path, int]],
+        listing_cache: RemoteListingCache | None = None,
+    ) -> list[transfer.TransferJob]:
+        """Return jobs for local copies whose size differs from the remote file's.
+
+        Description:
+            candidates are `(remote path, local path, remote size)` for files that already
+            exist locally. Sizes from a cached listing can be stale, because appending to a
+            file in place does not change its directory's mtime, so when a listing_cache is
+            passed the remote files are stat'd again (pipelined) before comparing. Files
+            that can no longer be stat'd are left alone.
+        """
+        if listing_cache is not None and candidates:
+            result: PipelineResult = self.stat_many(
+                remote_paths=[remote_item for remote_item, _, _ in candidates],
+                sftp_client=sftp_client,
+            )
+            candidates = [
+                (remote_item, local_item, result.results[remote_item].st_size or 0)
+                for remote_item, local_item, _ in candidates
+                if remote_item in result.results
+            ]
+
+        return [
+            transfer.TransferJob(
+                remote_path=remote_item, local_path=local_item, size=remote_size
+            )
+            for remote_item, local_item, remote_size in candidates
+            if local_item.stat().st_size != remote_size
+        ]
+
+    def plan_download(
+        self,
+        remote_src: t.Union[str, Path] = None,
+        local_dest: t.Union[str, Path] = None,
+        path_template: t.Callable[[str], Path] | None = None,
+        listing_cache: RemoteListingCache | None = None,
+        walk_filter: WalkFilter | None = None,
+        already_downloaded: t.Callable[[Path], bool] | None = None,
+        refresh_truncated: bool = False,
+        stability: StabilityCheck | None = None,
+        on_deferred: t.Callable[[dict[str, str]], None] | None = None,
+    ) -> list[transfer.TransferJob]:
+        """Return the files `sftp_download_all()` would download, without downloading them.
+
+        Description:
+            Walks remote_src (reusing cached listings when a listing_cache is passed) &
+            compares it against local_dest. No remote or local file is opened. See
+            `sftp_download_all()` for refresh_truncated, stability & on_deferred.
+
+        Returns:
+            (list[TransferJob]): A job for each remote file missing locally, with its size.
+
+        """
+        assert remote_src, ValueError("Missing a remote source directory")
+        assert local_dest, ValueError("Missing a local destination directory")
+        remote_src: str = f"{remote_src}"
+        local_dest: Path = Path(f"{local_dest}").expanduser()
+
+        sftp_client: paramiko.SFTPClient = self.get_sftp_client()
+        try:
+            files: list[tuple[str, paramiko.SFTPAttributes]] = self._sftp_walk_attrs(
+                sftp_client=sftp_client,
+                remotepath=remote_src,
+                listing_cache=listing_cache,
+                walk_filter=walk_filter,
+            )
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception walking remote path '{remote_src}'. Details: {exc}"
+            )
+            log.error(msg)
+
+            sftp_client.close()
+            raise exc
+
+        try:
+            jobs: list[transfer.TransferJob] = []
+            existing: list[tuple[str, Path, int]] = []
+            for remote_item, remote_attrs in files:
+                local_item: Path = self._local_item_for(
+                    remote_item=remote_item,
+                    local_dest=local_dest,
+                    path_template=path_template,
+                )
+                if local_item.exists():
+                    if refresh_truncated:
+                        existing.append(
+                            (remote_item, local_item, remote_attrs.st_size or 0)
+                        )
+                    continue
+                elif already_downloaded is not None and already_downloaded(local_item):
+                    continue
+
+                jobs.append(
+                    transfer.TransferJob(
+                        remote_path=remote_item,
+                        local_path=local_item,
+                        size=remote_attrs.st_size or 0,
+                    )
+                )
+
+            jobs += self._truncated_jobs(
+                sftp_client=sftp_client,
+                candidates=existing,
+                listing_cache=listing_cache,
+            )
+
+            if stability is not None and jobs:
+                jobs, _ = self._defer_unstable(
+                    sftp_client=sftp_client,
+                    stability=stability,
+                    jobs=jobs,
+                    on_deferred=on_deferred,
+                )
+
+            return jobs
+        finally:
+            sftp_client.close()
+
     def sftp_download_all(
         self,
         remote_src: t.Union[str, Path] = None,
         local_dest: t.Union[str, Path] = None,
-    ):
+        path_template: t.Callable[[str], Path] | None = None,
+        listing_cache: RemoteListingCache | None = None,
+        delta_min_size: int | None = None,
+        delta_block_size: int = delta.DEFAULT_BLOCK_SIZE,
+        delta_python_bin: str = "python3",
+        delta_helper_runner: delta.HelperRunner | None = None,
+        delta_helper_timeout: int = delta.DEFAULT_HELPER_TIMEOUT,
+        buffer_size: int | None = writer.DEFAULT_BUFFER_SIZE,
+        use_mmap: bool = False,
+        preallocate: bool = True,
+        drop_cache: bool = False,
+        durable: bool = True,
+        commit_batch_files: int = 64,
+        controller: transfer.AIMDController | None = None,
+        transfer_timeout: float | None = None,
+        transfer_order: str = "largest_first",
+        transfer_protocol: str = "sftp",
+        protocol_selector: transfer.ProtocolSelector | None = None,
+        already_downloaded: t.Callable[[Path], bool] | None = None,
+        on_commit: t.Callable[[list[Path]], None] | None = None,
+        walk_filter: WalkFilter | None = None,
+        throughput_history: transfer.ThroughputHistory | None = None,
+        transfer_retries: int = 0,
+        transfer_retry_backoff: float = 2.0,
+        transfer_max_retry_backoff: float = 60.0,
+        journal: transfer.RunJournal | None = None,
+        refresh_truncated: bool = False,
+        stability: StabilityCheck | None = None,
+        on_deferred: t.Callable[[dict[str, str]], None] | None = None,
+        reserve_space: t.Callable[[transfer.TransferJob], None] | None = None,
+        release_space: t.Callable[[transfer.TransferJob], None] | None = None,
+    ) -> list[Path]:
+        """Recursively download all files in remote_src to local_dest.
+
+        Params:
+            remote_src (str | Path): Remote directory to download.
+            local_dest (str | Path): Local directory to download files into.
+            path_template (Callable[[str], Path] | None): Maps a remote file path to its local
+                destination path, i.e. `modules.sort.date_partition_template()`. When `None`,
+                files are downloaded flat into local_dest by filename.
+            listing_cache (RemoteListingCache | None): Reuse cached listings of remote
+                directories whose mtime has not changed since they were last listed.
+            delta_min_size (int | None): When set, files of at least this many bytes that
+                already exist locally but changed on the remote are updated with a delta
+                transfer (see `modules.ssh_mod.delta`). When `None`, existing files are skipped.
+            delta_block_size (int): Block size used to compare files in a delta transfer.
+            delta_python_bin (str): Python interpreter on the remote that runs the delta helper.
+            delta_helper_runner (HelperRunner | None): Runs the delta helper. Defaults to
+                running it on the remote over SSH. Pass `delta.local_helper_runner()` to test
+                against a local SFTP server.
+            delta_helper_timeout (int): Seconds the remote delta helper may run without
+                replying. It replies once it has read the whole file, so raise this for very
+                large files.
+            buffer_size (int | None): Write downloads through a buffer of this many bytes
+                (see `modules.ssh_mod.writer`). When `None`, `SFTPClient.get()` is used.
+            use_mmap (bool): Write downloads through an mmap of the local file.
+            preallocate (bool): Preallocate local files from the remote file size.
+            drop_cache (bool): Drop downloaded files from the page cache once written.
+            durable (bool): fsync downloaded files & their directories before they are
+                committed. Files are always downloaded to a temporary name & renamed into
+                place once complete (see `modules.ssh_mod.writer.CommitBatch`).
+            commit_batch_files (int): Number of downloaded files committed at a time.
+            controller (AIMDController | None): Tunes how many files download in parallel
+                from measured throughput (see `modules.ssh_mod.transfer`). Defaults to
+                `AIMDController()`. Pass the same controller to several calls to keep what
+                it learned.
+            transfer_timeout (float | None): Seconds a download may stall before it fails.
+            transfer_order (str): Order downloads are started in, by remote file size:
+                `"largest_first"` (shortest total time), `"smallest_first"` or `"walk"`.
+                See `modules.ssh_mod.transfer.order_jobs()`.
+            transfer_protocol (str): `"sftp"`, `"scp"`, or `"auto"` to measure both on the
+                first files of each size class & use the faster one for the rest.
+            protocol_selector (ProtocolSelector | None): Calibration state for `"auto"`.
+                Pass the same selector to several calls to keep its measurements.
+            already_downloaded (Callable[[Path], bool] | None): Called for files missing from
+                their local path, returns `True` if the file is stored locally under another
+                name (i.e. after recompression) & should not be downloaded again.
+            on_commit (Callable[[list[Path]], None] | None): Called with each batch of
+                downloaded files as it is committed.
+            walk_filter (WalkFilter | None): Include/exclude rules & size/age bounds applied
+                while walking remote_src (see `modules.ssh_mod.filters`).
+            throughput_history (ThroughputHistory | None): Records the measured throughput,
+                for estimating future runs (see `plan_download()`).
+            transfer_retries (int): Times a failed download is retried, waiting
+                transfer_retry_backoff seconds (doubled after each attempt, up to
+                transfer_max_retry_backoff) while other downloads continue.
+            journal (RunJournal | None): Journal the planned, started, failed & committed
+                downloads. If the run being resumed already planned remote_src, it is not
+                walked again & only its uncommitted files are downloaded. Downloads that fail
+                every retry are left in the journal for the next run, instead of raising.
+            refresh_truncated (bool): Download files again when the local copy's size differs
+                from the remote file's, i.e. a copy of a file the remote was still writing.
+                With a listing_cache, existing files are stat'd again for their current size.
+            stability (StabilityCheck | None): Defer new & refreshed files the remote is
+                still writing (see `modules.ssh_mod.stability`). Resumed downloads are not
+                checked again.
+            on_deferred (Callable[[dict[str, str]], None] | None): Called with a map of
+                deferred remote path -> reason, so the caller can make sure a later run
+                walks remote_src again.
+            reserve_space (Callable[[TransferJob], None] | None): Called before each download
+                starts, i.e. `packages.cleanup.local.DiskBudget.reserve()` to evict old
+                backups. If it raises, the download fails without being retried.
+            release_space (Callable[[TransferJob], None] | None): Called after each failed
+                download attempt, to return what reserve_space reserved.
+
+        Returns:
+            (list[Path]): Local paths of the files downloaded during this call.
+
+        """
         assert remote_src, ValueError("Missing a remote source directory")
         assert isinstance(remote_src, str) or isinstance(remote_src, Path), TypeError(
             f"remote_src should be a string or Path. Got type: ({type(remote_src)})"
@@ -182,7 +881,7 @@ class SSHManager(AbstractContextManager):
         if not self.ssh_client:
             msg = Exception(f"SSH client is None.")
             log.error(msg)
-            return
+            return []
 
         else:
             try:
@@ -195,21 +894,257 @@ class SSHManager(AbstractContextManager):
                 raise exc
 
         try:
-            with helpers.cli.spinners.simple_spinner(
-                text=f"Getting list of files from remote {self.host}:{remote_src} ..."
-            ):
-                files_to_download = self._sftp_walk(
-                    sftp_client=sftp_client, remotepath=remote_src
+            resumed_jobs: list[transfer.TransferJob] | None = (
+                journal.remaining(remote_src) if journal is not None else None
+            )
+
+            if resumed_jobs is None:
+                with helpers.simple_spinner(
+                    text=f"Getting list of files from remote {self.host}:{remote_src} ..."
+                ):
+                    files_to_download = self._sftp_walk_attrs(
+                        sftp_client=sftp_client,
+                        remotepath=remote_src,
+                        listing_cache=listing_cache,
+                        walk_filter=walk_filter,
+                    )
+            else:
+                log.info(
+                    f"Resuming [{len(resumed_jobs)}] planned download(s) from {self.host}:{remote_src}"
                 )
+                files_to_download = []
+
+            delta_candidates: list[tuple[str, Path]] = []
+            ## Local directories already known to exist
+            created_dirs: set[Path] = set()
+
+            assert transfer_protocol in [*transfer.VALID_PROTOCOLS, "auto"], ValueError(
+                f"Invalid transfer_protocol: '{transfer_protocol}'. Must be one of {[*transfer.VALID_PROTOCOLS, 'auto']}"
+            )
+            if transfer_protocol == "auto" and protocol_selector is None:
+                protocol_selector = transfer.ProtocolSelector()
+
+            def _download(
+                job_sftp_client: paramiko.SFTPClient,
+                job: transfer.TransferJob,
+                callback: t.Callable[[int], None],
+            ) -> None:
+                if transfer_protocol == "auto":
+                    protocol: str = protocol_selector.choose(job.size)
+                else:
+                    protocol: str = transfer_protocol
+
+                if protocol == "scp":
+                    started: float = time.monotonic()
+                    try:
+                        transfer.scp_download(
+                            ssh_client=self.ssh_client,
+                            remote_path=job.remote_path,
+                            local_path=job.temp_path,
+                            callback=callback,
+                            timeout=transfer_timeout,
+                        )
+                    except Exception as exc:
+                        if protocol_selector is None:
+                            raise exc
+
+                        ## Fall through to SFTP for this file & the rest of the run
+                        protocol_selector.disable("scp", reason=f"Details: {exc}")
+                    else:
+                        if protocol_selector is not None:
+                            protocol_selector.record(
+                                "scp", job.size, time.monotonic() - started
+                            )
+
+                        return
+
+                started: float = time.monotonic()
+                _sftp_download(job_sftp_client, job, callback)
+                if protocol_selector is not None:
+                    protocol_selector.record("sftp", job.size, time.monotonic() - started)
+
+            def _sftp_download(
+                job_sftp_client: paramiko.SFTPClient,
+                job: transfer.TransferJob,
+                callback: t.Callable[[int], None],
+            ) -> None:
+                if buffer_size is None:
+                    progress: list[int] = [0]
 
-            for remote_item in files_to_download:
-                local_item = local_dest / Path(os.path.basename(remote_item))
+                    def _get_callback(transferred: int, total: int) -> None:
+                        callback(transferred - progress[0])
+                        progress[0] = transferred
 
-                if not local_item.exists():
-                    with helpers.cli.spinners.simple_spinner(
-                        text=f"Downloading file '{remote_item}' to '{local_item}' ..."
+                    job_sftp_client.get(
+                        job.remote_path, job.temp_path, callback=_get_callback
+                    )
+                else:
+                    writer.download_file(
+                        sftp_client=job_sftp_client,
+                        remote_path=job.remote_path,
+                        local_path=job.temp_path,
+                        buffer_size=buffer_size,
+                        use_mmap=use_mmap,
+                        preallocate=preallocate,
+                        drop_cache=drop_cache,
+                        callback=callback,
+                    )
+
+            def _on_failure(
+                job: transfer.TransferJob, exc: Exception, final: bool
+            ) -> None:
+                if release_space is not None:
+                    release_space(job)
+                if journal is not None:
+                    journal.record_failure(job, exc, final)
+
+            def _on_commit(paths: list[Path]) -> None:
+                if journal is not None:
+                    journal.record_commit(paths)
+                if on_commit is not None:
+                    on_commit(paths)
+
+            with writer.CommitBatch(
+                fsync=durable, max_files=commit_batch_files, on_commit=_on_commit
+            ) as commits:
+                jobs: list[transfer.TransferJob] = []
+
+                for job in resumed_jobs or []:
+                    if job.local_path.exists() or (
+                        already_downloaded is not None
+                        and already_downloaded(job.local_path)
+                    ):
+                        continue
+
+                    if job.local_path.parent not in created_dirs:
+                        commits.mkdir(job.local_path.parent)
+                        created_dirs.add(job.local_path.parent)
+
+                    job.temp_path = commits.temp_path(job.local_path)
+                    jobs.append(job)
+
+                new_jobs: list[transfer.TransferJob] = []
+                ## Existing local files to compare against the remote size
+                existing: list[tuple[str, Path, int]] = []
+                for remote_item, remote_attrs in files_to_download:
+                    local_item: Path = self._local_item_for(
+                        remote_item=remote_item,
+                        local_dest=local_dest,
+                        path_template=path_template,
+                    )
+
+                    if not local_item.exists():
+                        if already_downloaded is not None and already_downloaded(
+                            local_item
+                        ):
+                            continue
+
+                        new_jobs.append(
+                            transfer.TransferJob(
+                                remote_path=remote_item,
+                                local_path=local_item,
+                                size=remote_attrs.st_size or 0,
+                            )
+                        )
+
+                    elif delta_min_size is not None and (
+                        (remote_attrs.st_size or 0) >= delta_min_size
+                        or local_item.stat().st_size >= delta_min_size
+                    ):
+                        delta_candidates.append((remote_item, local_item))
+
+                    elif refresh_truncated:
+                        existing.append(
+                            (remote_item, local_item, remote_attrs.st_size or 0)
+                        )
+
+                new_jobs += self._truncated_jobs(
+                    sftp_client=sftp_client,
+                    candidates=existing,
+                    listing_cache=listing_cache,
+                )
+
+                if stability is not None and (new_jobs or delta_candidates):
+                    new_jobs, delta_candidates = self._defer_unstable(
+                        sftp_client=sftp_client,
+                        stability=stability,
+                        jobs=new_jobs,
+                        delta_candidates=delta_candidates,
+                        on_deferred=on_deferred,
+                    )
+
+                for job in new_jobs:
+                    if job.local_path.parent not in created_dirs:
+                        commits.mkdir(job.local_path.parent)
+                        created_dirs.add(job.local_path.parent)
+
+                    job.temp_path = commits.temp_path(job.local_path)
+                    jobs.append(job)
+
+                if journal is not None and resumed_jobs is None:
+                    journal.record_plan(remote_src=remote_src, jobs=jobs)
+
+                if jobs:
+                    with helpers.simple_spinner(
+                        text=f"Downloading [{len(jobs)}] file(s) from {self.host}:{remote_src} ..."
                     ):
-                        sftp_client.get(remote_item, local_item)
+                        stats: transfer.TransferStats = transfer.run_transfers(
+                            open_sftp=self.get_sftp_client,
+                            jobs=transfer.order_jobs(jobs=jobs, order=transfer_order),
+                            download=_download,
+                            on_complete=lambda job: commits.add(
+                                temp_path=job.temp_path,
+                                final_path=job.local_path,
+                                size=job.size,
+                            ),
+                            controller=controller,
+                            timeout=transfer_timeout,
+                            retries=transfer_retries,
+                            retry_backoff=transfer_retry_backoff,
+                            max_retry_backoff=transfer_max_retry_backoff,
+                            on_start=journal.record_start if journal else None,
+                            on_failure=_on_failure,
+                            reserve=reserve_space,
+                        )
+
+                    log.info(
+                        f"Downloaded [{len(stats.downloaded)}/{len(jobs)}] file(s) at {stats.throughput / 1024 / 1024:.1f} MiB/s"
+                    )
+                    if throughput_history is not None:
+                        throughput_history.record(
+                            nbytes=stats.bytes_transferred, seconds=stats.elapsed
+                        )
+
+                if delta_candidates:
+                    self._sftp_delta_update(
+                        sftp_client=sftp_client,
+                        candidates=delta_candidates,
+                        commits=commits,
+                        download=lambda job: _sftp_download(
+                            sftp_client, job, lambda nbytes: None
+                        ),
+                        block_size=delta_block_size,
+                        python_bin=delta_python_bin,
+                        run_helper=delta_helper_runner,
+                        helper_timeout=delta_helper_timeout,
+                        reserve_space=reserve_space,
+                        release_space=release_space,
+                    )
+
+            downloaded: list[Path] = commits.committed
+
+            if jobs and stats.failed:
+                remote_item, exc = next(iter(stats.failed.items()))
+                if journal is None:
+                    raise Exception(
+                        f"[{len(stats.failed)}] download(s) failed. First error ({remote_item}): {exc}"
+                    ) from exc
+
+                log.error(
+                    f"[{len(stats.failed)}] download(s) from {self.host}:{remote_src} failed every attempt & will be retried by the next run. First error ({remote_item}): {exc}"
+                )
+
+            return downloaded
 
         except Exception as exc:
             msg = Exception(
@@ -4,18 +4,26 @@ from contextlib import contextmanager
 from os import system
 from pathlib import Path
 import sys
+import time
 import typing as t
 
-from core import SSHSettings, ssh_settings
+from .. import keys
+
+from core import SSHSettings, get_ssh_settings
 from core.helpers import get_host_os
 from loguru import logger as log
 import paramiko
 
 @contextmanager
 def get_ssh_client(
-    ssh_settings: SSHSettings = ssh_settings,
+    ssh_settings: SSHSettings | None = None,
 ) -> t.Generator[paramiko.SSHClient, t.Any, None]:
-    """Context manager for building & yielding a Paramiko SSHClient."""
+    """Context manager for building & yielding a Paramiko SSHClient.
+
+    Uses the settings loaded from config/ssh/ when ssh_settings is `None`.
+    """
+    if ssh_settings is None:
+        ssh_settings = get_ssh_settings()
     assert ssh_settings, ValueError("Missing SSH settings.")
     assert isinstance(ssh_settings, SSHSettings), TypeError(
         f"ssh_settings should be an initialized SSHSettings object. Got type: ({type(ssh_settings)})"
@@ -23,8 +31,19 @@ def get_ssh_client(
 
     log.info(f"Getting SSHClient")
     try:
+        try:
+            pkey: paramiko.PKey | None = keys.load_private_key(
+                ssh_settings.privkey, passphrase=ssh_settings.remote_password
+            )
+        except Exception as exc:
+            log.warning(
+                f"Unable to load private key '{ssh_settings.privkey}', leaving it to paramiko. Details: {exc}"
+            )
+            pkey = None
+
         ssh_client: paramiko.SSHClient = paramiko.SSHClient()
-        ssh_client.load_system_host_keys()
+        ## Parsed once per process & shared, see modules.ssh_mod.keys
+        ssh_client._system_host_keys = keys.load_known_hosts()
         ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     except Exception as exc:
         msg = Exception(f"Unhandled exception building SSHClient. Details: {exc}")
@@ -34,16 +53,18 @@ def get_ssh_client(
 
     log.info("Attempting connection")
     try:
+        started: float = time.perf_counter()
         ssh_client.connect(
             hostname=ssh_settings.remote_host,
             username=ssh_settings.remote_user,
             port=ssh_settings.remote_port,
             password=ssh_settings.remote_password,
-            key_filename=f"{ssh_settings.privkey}",
+            pkey=pkey,
+            key_filename=f"{ssh_settings.privkey}" if pkey is None else None,
             timeout=5000,
         )
         log.success(
-            f"Connected to {ssh_settings.remote_user}@{ssh_settings.remote_host}:{ssh_settings.remote_port}"
+            f"Connected to {ssh_settings.remote_user}@{ssh_settings.remote_host}:{ssh_settings.remote_port} (handshake took {time.perf_counter() - started:.3f}s)"
         )
 
         yield ssh_client
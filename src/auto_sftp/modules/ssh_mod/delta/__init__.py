@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from .methods import (
+    DEFAULT_BLOCK_SIZE,
+    DEFAULT_HELPER_TIMEOUT,
+    DEFAULT_MAX_CHANGED_FRACTION,
+    HelperRunner,
+    compute_block_signatures,
+    delta_download,
+    get_helper_command,
+    local_helper_runner,
+    ssh_helper_runner,
+)
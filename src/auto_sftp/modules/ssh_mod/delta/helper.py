@@ -0,0 +1,159 @@
+"""Delta helper run on the remote (via `exec_command`) or locally as an in-process stand-in.
+
+Reads a JSON request from stdin:
+
+    {"path": "/remote/file", "block_size": 65536, "signatures": [[weak, strong], ...],
+     "max_changed_fraction": 0.5}
+
+where `signatures` are the rolling (weak) & strong checksums of each block of the existing
+local copy. Scans the remote file with a rolling checksum & writes a JSON reply to stdout:
+
+    {"size": 123, "digest": "...", "ops": [["copy", block_idx], ["data", offset, length], ...]}
+
+Applying the ops in order rebuilds the remote file: `copy` reuses a block of the local copy,
+`data` is a byte range that must be fetched from the remote. If more than
+`max_changed_fraction` of the file must be fetched, the scan stops early & the reply's
+`digest` & `ops` are `null`: downloading the whole file is cheaper.
+
+This module must only use the standard library, because its source is sent to the remote
+& run with `python3 -c`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from itertools import accumulate
+import json
+import mmap
+import os
+import sys
+
+MOD: int = 1 << 16
+
+
+def weak_checksum(data) -> tuple[int, int]:
+    """rsync-style rolling checksum of a block, returned as its `(a, b)` components.
+
+    `b` is the sum of `(n - i) * data[i]`, which equals the sum of the prefix sums of data.
+    """
+    return sum(data) % MOD, sum(accumulate(data)) % MOD
+
+
+def strong_checksum(data) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def compute_ops(
+    path: str, block_size: int, signatures: list, max_changed_fraction: float = 1.0
+) -> dict:
+    by_weak: dict[int, list[tuple[int, str]]] = {}
+    by_strong: dict[str, int] = {}
+    for idx, (weak, strong) in enumerate(signatures):
+        by_weak.setdefault(weak, []).append((idx, strong))
+        by_strong.setdefault(strong, idx)
+
+    ops: list = []
+    digest = hashlib.blake2b(digest_size=16)
+    size: int = os.path.getsize(path)
+    max_changed: float = max_changed_fraction * size
+    changed: int = 0
+
+    def _emit_data(offset: int, length: int) -> None:
+        if length <= 0:
+            return
+        if ops and ops[-1][0] == "data" and ops[-1][1] + ops[-1][2] == offset:
+            ops[-1][2] += length
+        else:
+            ops.append(["data", offset, length])
+
+    def _match(data, start: int, stop: int, a: int, b: int) -> int | None:
+        candidates = by_weak.get(a | (b << 16))
+        if not candidates:
+            return None
+
+        ## Only copied out of data once the weak checksum matches
+        strong = strong_checksum(data[start:stop])
+        for idx, cand_strong in candidates:
+            if cand_strong == strong:
+                return idx
+
+        return None
+
+    if size == 0:
+        return {"size": 0, "digest": digest.hexdigest(), "ops": ops}
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+
+        def _roll(pos: int, end: int) -> tuple[int, int] | None:
+            """Roll forward at most one block from pos looking for a shifted match.
+
+            The weak checksum of each shifted window is computed from prefix sums, built
+            in C by `accumulate()`, instead of updating it a byte at a time.
+            """
+            n: int = end - pos
+            data = mm[pos : min(end + block_size - 1, size)]
+            sums: list[int] = [0, *accumulate(data)]
+            weighted: list[int] = [0, *accumulate(i * x for i, x in enumerate(data))]
+
+            for shift in range(1, len(data) - n + 1):
+                stop: int = shift + n
+                a: int = sums[stop] - sums[shift]
+                b: int = stop * a - (weighted[stop] - weighted[shift])
+
+                idx = _match(data, shift, stop, a % MOD, b % MOD)
+                if idx is not None:
+                    return shift, idx
+
+            return None
+
+        pos: int = 0
+        ## The byte-by-byte roll runs in Python, so it only runs on the first block of each
+        #  changed region, where inserted or removed bytes shift the data after them.
+        #  Blocks inside a changed region are only compared at their own offset.
+        roll: bool = True
+        while pos < size:
+            end: int = min(pos + block_size, size)
+
+            ## Unchanged & block-shifted data is found with the (fast, C) strong checksum
+            idx = by_strong.get(strong_checksum(mm[pos:end]))
+            if idx is not None:
+                ops.append(["copy", idx])
+                pos = end
+                roll = True
+                continue
+
+            shifted = _roll(pos, end) if roll else None
+            roll = False
+            if shifted is not None:
+                shift, idx = shifted
+                _emit_data(pos, shift)
+                ops.append(["copy", idx])
+                changed += shift
+                pos = end + shift
+                roll = True
+            else:
+                _emit_data(pos, end - pos)
+                changed += end - pos
+                pos = end
+
+            if changed > max_changed:
+                return {"size": size, "digest": None, "ops": None}
+
+        digest.update(mm)
+
+    return {"size": size, "digest": digest.hexdigest(), "ops": ops}
+
+
+def main() -> None:
+    request = json.loads(sys.stdin.buffer.read())
+    reply = compute_ops(
+        path=request["path"],
+        block_size=request["block_size"],
+        signatures=request["signatures"],
+        max_changed_fraction=request.get("max_changed_fraction", 1.0),
+    )
+    sys.stdout.write(json.dumps(reply))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+import shlex
+import subprocess
+import sys
+import typing as t
+
+from . import helper
+
+from loguru import logger as log
+import paramiko
+
+## Runs the delta helper. Receives the command to run & the JSON request, returns stdout.
+HelperRunner = t.Callable[[str, bytes], bytes]
+
+DEFAULT_BLOCK_SIZE: int = 128 * 1024
+## Download the whole file instead when more than this fraction of it changed
+DEFAULT_MAX_CHANGED_FRACTION: float = 0.5
+## Seconds the helper may run without replying before the delta transfer fails & the file
+#  is downloaded in full. The helper replies once it has read the whole remote file.
+DEFAULT_HELPER_TIMEOUT: int = 600
+
+## Source of the helper module, sent to the remote & run with `python3 -c`
+_HELPER_SOURCE: str = inspect.getsource(helper)
+
+
+def get_helper_command(python_bin: str = "python3") -> str:
+    """Return the shell command that runs the delta helper on the remote."""
+    return f"{python_bin} -c {shlex.quote(_HELPER_SOURCE)}"
+
+
+def compute_block_signatures(
+    local_path: t.Union[str, Path] = None, block_size: int = DEFAULT_BLOCK_SIZE
+) -> list[tuple[int, str]]:
+    """Return the rolling (weak) & strong checksum of each block of a local file."""
+    signatures: list[tuple[int, str]] = []
+
+    with open(local_path, "rb") as f:
+        while block := f.read(block_size):
+            a, b = helper.weak_checksum(block)
+            signatures.append((a | (b << 16), helper.strong_checksum(block)))
+
+    return signatures
+
+
+def ssh_helper_runner(
+    ssh_client: paramiko.SSHClient = None, timeout: int = DEFAULT_HELPER_TIMEOUT
+) -> HelperRunner:
+    """Run the delta helper on the remote with `exec_command`."""
+    assert ssh_client, ValueError("Missing an SSH client to run the delta helper with")
+
+    def _run(command: str, request: bytes) -> bytes:
+        stdin, stdout, stderr = ssh_client.exec_command(command, timeout=timeout)
+        stdin.write(request)
+        stdin.channel.shutdown_write()
+
+        reply: bytes = stdout.read()
+        exit_status: int = stdout.channel.recv_exit_status()
+        if exit_status != 0:
+            raise Exception(
+                f"Delta helper exited with status {exit_status}: {stderr.read().decode(errors='replace').strip()}"
+            )
+
+        return reply
+
+    return _run
+
+
+def local_helper_runner(
+    root: t.Union[str, Path] | None = None, timeout: int = DEFAULT_HELPER_TIMEOUT
+) -> HelperRunner:
+    """Run the delta helper locally, as a stand-in for a remote with a local SFTP server.
+
+    Params:
+        root (str | Path | None): Local directory the SFTP server serves as `/`. Remote
+            paths in requests are resolved under it. When `None`, they are used as-is.
+        timeout (int): Seconds the helper may run.
+    """
+
+    def _run(command: str, request: bytes) -> bytes:
+        if root is not None:
+            payload: dict = json.loads(request)
+            payload["path"] = f"{Path(f'{root}') / payload['path'].lstrip('/')}"
+            request = json.dumps(payload).encode()
+
+        proc = subprocess.run(
+            [sys.executable, "-c", _HELPER_SOURCE],
+            input=request,
+            capture_output=True,
+            timeout=timeout,
+            check=False,
+        )
+        if proc.returncode != 0:
+            raise Exception(
+                f"Delta helper exited with status {proc.returncode}: {proc.stderr.decode(errors='replace').strip()}"
+            )
+
+        return proc.stdout
+
+    return _run
+
+
+def _iter_ranges(
+    remote_f: paramiko.SFTPFile,
+    ranges: list[tuple[int, int]],
+    max_batch_bytes: int = 64 * 1024 * 1024,
+) -> t.Iterator[bytes]:
+    """Fetch byte ranges with pipelined `readv()` calls, at most max_batch_bytes at a time.
+
+    paramiko buffers prefetched data in memory, so batching bounds memory use when a large
+    part of the file changed.
+    """
+    batch: list[tuple[int, int]] = []
+    batch_bytes: int = 0
+
+    for offset, length in ranges:
+        batch.append((offset, length))
+        batch_bytes += length
+
+        if batch_bytes >= max_batch_bytes:
+            yield from remote_f.readv(batch)
+            batch, batch_bytes = [], 0
+
+    if batch:
+        yield from remote_f.readv(batch)
+
+
+def delta_download(
+    sftp_client: paramiko.SFTPClient = None,
+    remote_path: str = None,
+    local_path: t.Union[str, Path] = None,
+    run_helper: HelperRunner = None,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    helper_command: str | None = None,
+    dest_path: t.Union[str, Path] | None = None,
+    max_changed_fraction: float = DEFAULT_MAX_CHANGED_FRACTION,
+) -> dict[str, int] | None:
+    """Update local_path to match remote_path, fetching only the byte ranges that changed.
+
+    Description:
+        Computes block signatures of the existing local copy, has the delta helper compare
+        them against the remote file, then rebuilds the file from reused local blocks plus
+        the changed ranges (fetched with pipelined `readv()` calls). The rebuilt file is
+        checked against the remote's digest before it replaces local_path.
+
+        If more than max_changed_fraction of the file changed (i.e. a recompressed
+        archive), nothing is written & `None` is returned, so the caller can download the
+        file in full instead.
+
+    Params:
+        sftp_client (paramiko.SFTPClient): Open SFTP client for the remote.
+        remote_path (str): Remote file to download.
+        local_path (str | Path): Existing local copy of the file.
+        run_helper (HelperRunner): Runs the delta helper, i.e. `ssh_helper_runner(ssh_client)`.
+        block_size (int): Size of the blocks that are compared.
+        helper_command (str | None): Command that runs the helper. Defaults to
+            `get_helper_command()`.
+        dest_path (str | Path | None): Write the rebuilt file here & leave it for the
+            caller to move into place, i.e. a temporary name next to local_path. When
+            `None`, the rebuilt file replaces local_path.
+        max_changed_fraction (float): Give up when more than this fraction of the file
+            changed.
+
+    Returns:
+        (dict[str, int] | None): `size`, `bytes_reused` & `bytes_fetched`, or `None` if too
+            much of the file changed.
+
+    """
+    assert sftp_client, ValueError("Missing an SFTP client")
+    assert remote_path, ValueError("Missing a remote path")
+    assert local_path, ValueError("Missing a local path")
+    assert run_helper, ValueError("Missing a delta helper runner")
+
+    local_path: Path = Path(f"{local_path}")
+    if helper_command is None:
+        helper_command = get_helper_command()
+
+    signatures = compute_block_signatures(local_path=local_path, block_size=block_size)
+    request: bytes = json.dumps(
+        {
+            "path": remote_path,
+            "block_size": block_size,
+            "signatures": signatures,
+            "max_changed_fraction": max_changed_fraction,
+        }
+    ).encode()
+
+    reply: dict = json.loads(run_helper(helper_command, request))
+    ops: list | None = reply["ops"]
+    if ops is None:
+        log.debug(
+            "Over {:.0%} of '{}' changed, not delta updating it",
+            max_changed_fraction,
+            remote_path,
+        )
+
+        return None
+
+    data_ranges: list[tuple[int, int]] = [
+        (op[1], op[2]) for op in ops if op[0] == "data"
+    ]
+    stats: dict[str, int] = {
+        "size": reply["size"],
+        "bytes_fetched": sum(length for _, length in data_ranges),
+    }
+    stats["bytes_reused"] = stats["size"] - stats["bytes_fetched"]
+
+    if dest_path is not None:
+        tmp_path: Path = Path(f"{dest_path}")
+    else:
+        tmp_path: Path = local_path.with_name(f".{local_path.name}.delta")
+    digest = hashlib.blake2b(digest_size=16)
+
+    try:
+        with sftp_client.open(remote_path, "rb") as remote_f:
+            fetched = _iter_ranges(remote_f, data_ranges)
+
+            with open(local_path, "rb") as old_f, open(tmp_path, "wb") as new_f:
+                for op in ops:
+                    if op[0] == "copy":
+                        old_f.seek(op[1] * block_size)
+                        chunk = old_f.read(block_size)
+                    else:
+                        chunk = next(fetched)
+
+                    digest.update(chunk)
+                    new_f.write(chunk)
+
+        if digest.hexdigest() != reply["digest"]:
+            raise Exception(
+                f"Rebuilt file does not match remote file '{remote_path}' (digest mismatch)"
+            )
+
+        if dest_path is None:
+            os.replace(tmp_path, local_path)
+    except Exception as exc:
+        tmp_path.unlink(missing_ok=True)
+
+        msg = Exception(
+            f"Unhandled exception applying delta from remote file '{remote_path}' to '{local_path}'. Details: {exc}"
+        )
+        log.error(msg)
+
+        raise exc
+
+    log.debug(
+        "Delta updated '{}': reused {} byte(s), fetched {} byte(s)",
+        local_path,
+        stats["bytes_reused"],
+        stats["bytes_fetched"],
+    )
+
+    return stats
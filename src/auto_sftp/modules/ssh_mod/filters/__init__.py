@@ -0,0 +1,3 @@
+from __future__ import annotations
+
+from .classes import REGEX_PREFIX, WalkFilter
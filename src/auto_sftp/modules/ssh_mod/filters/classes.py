@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import fnmatch
+import re
+import time
+
+from loguru import logger as log
+import paramiko
+
+## Rules starting with this prefix are regular expressions, all others are globs
+REGEX_PREFIX: str = "re:"
+
+
+def _compile_rules(rules: list[str]) -> tuple[re.Pattern | None, re.Pattern | None]:
+    """Compile rules into one pattern matched against names & one matched against paths.
+
+    Globs without a `/` match a file or directory name anywhere in the tree, i.e. `*.tmp`.
+    Globs with a `/`, & all regexes, match the path relative to the walk's root.
+    """
+    name_parts: list[str] = []
+    path_parts: list[str] = []
+
+    for rule in rules:
+        if rule.startswith(REGEX_PREFIX):
+            path_parts.append(f"(?:{rule[len(REGEX_PREFIX):]})")
+        elif "/" in rule:
+            path_parts.append(fnmatch.translate(rule.strip("/")))
+        else:
+            name_parts.append(fnmatch.translate(rule))
+
+    name_re = re.compile("|".join(name_parts)) if name_parts else None
+    path_re = re.compile("|".join(path_parts)) if path_parts else None
+
+    return name_re, path_re
+
+
+class WalkFilter:
+    r"""Include/exclude rules & size/age bounds applied while walking the remote.
+
+    Description:
+        Rules are globs (i.e. `*.tar.gz`, `logs/*`) or regexes prefixed with `re:`
+        (i.e. `re:^\d{4}-\d{2}-\d{2}_`). A directory matching an exclude rule is never
+        listed. Include rules & size/age bounds only apply to files, so `*.tar.gz` does not
+        stop the walk from descending into directories.
+
+        A file is kept if it matches no exclude rule, matches any include rule (or there are
+        none), & is within the size & age bounds. Ages are seconds since the file's mtime.
+
+    Params:
+        include (list[str] | None): Rules a file must match one of.
+        exclude (list[str] | None): Rules excluding matching files & directories.
+        min_size (int | None): Smallest file size, in bytes.
+        max_size (int | None): Largest file size, in bytes.
+        min_age (int | None): Skip files modified less than this many seconds ago.
+        max_age (int | None): Skip files modified more than this many seconds ago.
+    """
+
+    def __init__(
+        self,
+        include: list[str] | None = None,
+        exclude: list[str] | None = None,
+        min_size: int | None = None,
+        max_size: int | None = None,
+        min_age: int | None = None,
+        max_age: int | None = None,
+    ):
+        self.include: list[str] = list(include or [])
+        self.exclude: list[str] = list(exclude or [])
+        self.min_size: int | None = min_size
+        self.max_size: int | None = max_size
+        self.min_age: int | None = min_age
+        self.max_age: int | None = max_age
+
+        try:
+            self._include_name, self._include_path = _compile_rules(self.include)
+            self._exclude_name, self._exclude_path = _compile_rules(self.exclude)
+        except re.error as exc:
+            msg = ValueError(f"Invalid walk filter rule. Details: {exc}")
+            log.error(msg)
+
+            raise msg
+
+        self.skipped_files: int = 0
+        self.pruned_dirs: int = 0
+
+    def __repr__(self) -> str:
+        return f"WalkFilter(include={self.include}, exclude={self.exclude}, min_size={self.min_size}, max_size={self.max_size}, min_age={self.min_age}, max_age={self.max_age})"
+
+    @property
+    def is_empty(self) -> bool:
+        return not (
+            self.include
+            or self.exclude
+            or self.min_size is not None
+            or self.max_size is not None
+            or self.min_age is not None
+            or self.max_age is not None
+        )
+
+    @staticmethod
+    def _matches(
+        name_re: re.Pattern | None, path_re: re.Pattern | None, rel_path: str
+    ) -> bool:
+        if name_re is not None and name_re.match(rel_path.rsplit("/", 1)[-1]):
+            return True
+
+        return path_re is not None and path_re.match(rel_path) is not None
+
+    def allow_dir(self, rel_path: str) -> bool:
+        """Whether to descend into the directory at rel_path (relative to the walk's root)."""
+        if self._matches(self._exclude_name, self._exclude_path, rel_path):
+            self.pruned_dirs += 1
+
+            return False
+
+        return True
+
+    def allow_file(self, rel_path: str, attrs: paramiko.SFTPAttributes) -> bool:
+        """Whether to keep the file at rel_path (relative to the walk's root)."""
+        allowed: bool = self._allow_file(rel_path, attrs)
+        if not allowed:
+            self.skipped_files += 1
+
+        return allowed
+
+    def _allow_file(self, rel_path: str, attrs: paramiko.SFTPAttributes) -> bool:
+        if self._matches(self._exclude_name, self._exclude_path, rel_path):
+            return False
+
+        if self.include and not self._matches(
+            self._include_name, self._include_path, rel_path
+        ):
+            return False
+
+        size: int = attrs.st_size or 0
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+
+        if self.min_age is not None or self.max_age is not None:
+            age: float = time.time() - (attrs.st_mtime or 0)
+            if self.min_age is not None and age < self.min_age:
+                return False
+            if self.max_age is not None and age > self.max_age:
+                return False
+
+        return True
@@ -0,0 +1,8 @@
+from __future__ import annotations
+
+from .methods import (
+    DEFAULT_KNOWN_HOSTS_FILE,
+    clear_key_cache,
+    load_known_hosts,
+    load_private_key,
+)
@@ -0,0 +1,110 @@
+"""Process-wide caches of parsed private keys & known_hosts files.
+
+Parsing a (4096-bit RSA) private key or a large known_hosts file is repeated by paramiko on
+every `SSHClient.connect(key_filename=...)` & `load_system_host_keys()`. These helpers parse
+each file once & hand the same object to every connection. A file is parsed again if its
+mtime or size changes.
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import threading
+import typing as t
+
+from loguru import logger as log
+import paramiko
+
+DEFAULT_KNOWN_HOSTS_FILE: Path = Path("~/.ssh/known_hosts").expanduser()
+
+## (resolved path, mtime_ns, size) -> parsed object
+_pkeys: dict[tuple[str, int, int], paramiko.PKey] = {}
+_known_hosts: dict[tuple[str, int, int], paramiko.HostKeys] = {}
+_lock = threading.Lock()
+
+
+def _cache_key(path: t.Union[str, Path]) -> tuple[str, int, int]:
+    path: Path = Path(f"{path}").expanduser().resolve()
+    stat: os.stat_result = path.stat()
+
+    return f"{path}", stat.st_mtime_ns, stat.st_size
+
+
+def load_private_key(
+    keyfile: t.Union[str, Path] = None, passphrase: str | None = None
+) -> paramiko.PKey:
+    """Return the private key in keyfile, parsing it only the first time it is requested.
+
+    Params:
+        keyfile (str | Path): Private key file, of any type paramiko supports.
+        passphrase (str | None): Passphrase, only used if the key is encrypted.
+
+    Returns:
+        (paramiko.PKey): The parsed key, shared by every caller.
+
+    """
+    assert keyfile, ValueError("Missing a private key file")
+    key: tuple[str, int, int] = _cache_key(keyfile)
+
+    with _lock:
+        pkey: paramiko.PKey | None = _pkeys.get(key)
+        if pkey is not None:
+            return pkey
+
+        try:
+            try:
+                pkey = paramiko.PKey.from_path(key[0])
+            ## cryptography raises TypeError for encrypted OpenSSH-format keys
+            except (paramiko.PasswordRequiredException, TypeError):
+                if not passphrase:
+                    raise
+                pkey = paramiko.PKey.from_path(key[0], password=passphrase.encode())
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception loading private key '{key[0]}'. Details: {exc}"
+            )
+            log.error(msg)
+
+            raise exc
+
+        ## Drop stale entries for this file
+        for stale in [k for k in _pkeys if k[0] == key[0]]:
+            del _pkeys[stale]
+        _pkeys[key] = pkey
+
+    log.debug(f"Loaded {pkey.get_name()} private key '{key[0]}'")
+
+    return pkey
+
+
+def load_known_hosts(
+    known_hosts_file: t.Union[str, Path] = DEFAULT_KNOWN_HOSTS_FILE,
+) -> paramiko.HostKeys:
+    """Return the parsed known_hosts_file, parsing it only the first time it is requested.
+
+    Returns an empty `HostKeys` if the file does not exist. The returned object is shared;
+    use it read-only (i.e. as an `SSHClient`'s system host keys).
+    """
+    try:
+        key: tuple[str, int, int] = _cache_key(known_hosts_file)
+    except FileNotFoundError:
+        return paramiko.HostKeys()
+
+    with _lock:
+        host_keys: paramiko.HostKeys | None = _known_hosts.get(key)
+        if host_keys is None:
+            host_keys = paramiko.HostKeys(filename=key[0])
+
+            for stale in [k for k in _known_hosts if k[0] == key[0]]:
+                del _known_hosts[stale]
+            _known_hosts[key] = host_keys
+
+    return host_keys
+
+
+def clear_key_cache() -> None:
+    """Forget every cached key & known_hosts file."""
+    with _lock:
+        _pkeys.clear()
+        _known_hosts.clear()
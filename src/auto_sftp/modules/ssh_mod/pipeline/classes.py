@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import typing as t
+
+from loguru import logger as log
+import paramiko
+from paramiko.sftp import (
+    CMD_ATTRS,
+    CMD_LSTAT,
+    CMD_REMOVE,
+    CMD_RENAME,
+    CMD_STAT,
+    CMD_STATUS,
+)
+from paramiko.sftp_attr import SFTPAttributes
+
+class PipelineResult:
+    """Results of a pipelined batch of SFTP requests.
+
+    Description:
+        Successful replies are stored in `results`, keyed by the path (or `(src, dest)` pair)
+        the request was issued for. Failed requests are stored in `errors` with the exception
+        paramiko would have raised for the equivalent blocking call.
+    """
+
+    def __init__(self):
+        self.results: dict[t.Any, t.Any] = {}
+        self.errors: dict[t.Any, Exception] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def raise_for_errors(self) -> None:
+        if self.errors:
+            key, exc = next(iter(self.errors.items()))
+            raise Exception(
+                f"[{len(self.errors)}] pipelined SFTP request(s) failed. First error ({key}): {exc}"
+            ) from exc
+
+    def __len__(self) -> int:
+        return len(self.results) + len(self.errors)
+
+    def __repr__(self) -> str:
+        return f"PipelineResult(results={len(self.results)}, errors={len(self.errors)})"
+
+
+class SFTPPipeline:
+    """Issue many SFTP metadata requests back to back and collect the replies as they arrive.
+
+    Description:
+        paramiko's public `stat()`, `remove()` & `rename()` send one request and block until
+        its reply comes back. This class writes up to `max_in_flight` requests to the channel
+        before reading any replies, tracking each request by its SFTP request id, so a batch
+        costs roughly one round trip per window instead of one per item.
+
+        The pipeline reads replies directly off the `SFTPClient`, so the client should not be
+        used from another thread (i.e. for a prefetching download) while a batch is running.
+
+    Params:
+        sftp_client (paramiko.SFTPClient): An open SFTP client.
+        max_in_flight (int): Maximum number of requests awaiting a reply at once.
+    """
+
+    def __init__(self, sftp_client: paramiko.SFTPClient, max_in_flight: int = 64):
+        assert sftp_client, ValueError("Missing an SFTP client")
+        assert isinstance(sftp_client, paramiko.SFTPClient), TypeError(
+            f"sftp_client must be a paramiko.SFTPClient. Got type: ({type(sftp_client)})"
+        )
+        assert isinstance(max_in_flight, int) and max_in_flight > 0, ValueError(
+            f"max_in_flight must be a positive integer. Got: {max_in_flight}"
+        )
+
+        self.sftp_client: paramiko.SFTPClient = sftp_client
+        self.max_in_flight: int = max_in_flight
+
+        ## Map of SFTP request id -> (key, expected reply handler)
+        self._pending: dict[int, tuple[t.Any, t.Callable]] = {}
+        self._result: PipelineResult | None = None
+
+    def _async_response(self, t_: int, msg: paramiko.Message, num: int) -> None:
+        """Handle a reply `SFTPClient._read_response()` read for a request this pipeline registered."""
+        entry = self._pending.pop(num, None)
+        if entry is None or self._result is None:
+            ## Late reply for a batch that was aborted
+            return
+
+        key, handler = entry
+
+        try:
+            self._result.results[key] = handler(t_, msg)
+        except Exception as exc:
+            self._result.errors[key] = exc
+
+    def _handle_attrs(self, t_: int, msg: paramiko.Message) -> SFTPAttributes:
+        if t_ == CMD_STATUS:
+            ## Raises the same IOError/OSError paramiko uses for blocking calls
+            self.sftp_client._convert_status(msg)
+        if t_ != CMD_ATTRS:
+            raise paramiko.SFTPError(f"Expected attributes, got response type {t_}")
+
+        return SFTPAttributes._from_msg(msg)
+
+    def _handle_status(self, t_: int, msg: paramiko.Message) -> bool:
+        if t_ != CMD_STATUS:
+            raise paramiko.SFTPError(f"Expected status, got response type {t_}")
+        self.sftp_client._convert_status(msg)
+
+        return True
+
+    def _run(
+        self, requests: t.Iterable[tuple[t.Any, int, tuple, t.Callable]]
+    ) -> PipelineResult:
+        self._result = PipelineResult()
+        self._pending = {}
+
+        try:
+            for key, cmd, args, handler in requests:
+                ## Keep the window full, draining one reply at a time once it is
+                while len(self._pending) >= self.max_in_flight:
+                    self.sftp_client._read_response()
+
+                num: int = self.sftp_client._async_request(self, cmd, *args)
+                self._pending[num] = (key, handler)
+
+            while self._pending:
+                self.sftp_client._read_response()
+
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception running pipelined SFTP requests. [{len(self._pending)}] request(s) still pending. Details: {exc}"
+            )
+            log.error(msg)
+
+            raise exc
+
+        result: PipelineResult = self._result
+        self._result = None
+
+        return result
+
+    def stat_many(self, paths: t.Iterable[str], follow_symlinks: bool = True) -> PipelineResult:
+        """Stat many remote paths. Results map path -> `paramiko.SFTPAttributes`."""
+        cmd: int = CMD_STAT if follow_symlinks else CMD_LSTAT
+
+        return self._run(
+            (path, cmd, (self.sftp_client._adjust_cwd(path),), self._handle_attrs)
+            for path in paths
+        )
+
+    def remove_many(self, paths: t.Iterable[str]) -> PipelineResult:
+        """Remove many remote files. Results map path -> `True`."""
+        return self._run(
+            (path, CMD_REMOVE, (self.sftp_client._adjust_cwd(path),), self._handle_status)
+            for path in paths
+        )
+
+    def rename_many(self, pairs: t.Iterable[tuple[str, str]]) -> PipelineResult:
+        """Rename many remote paths. Results map `(src, dest)` -> `True`."""
+        return self._run(
+            (
+                (src, dest),
+                CMD_RENAME,
+                (self.sftp_client._adjust_cwd(src), self.sftp_client._adjust_cwd(dest)),
+                self._handle_status,
+            )
+            for src, dest in pairs
+        )
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import time
+import typing as t
+
+from ..pipeline import PipelineResult
+
+from loguru import logger as log
+import paramiko
+
+## Stats a batch of remote paths, i.e. `SSHManager.stat_many()`
+StatMany = t.Callable[[list[str]], PipelineResult]
+
+
+class StabilityCheck:
+    """Decide which remote files have finished being written.
+
+    Description:
+        Files are stat'ed in one pipelined batch. A file modified less than quiet_period
+        seconds ago is deferred. The rest are stat'ed again recheck_interval seconds after
+        the first batch was sent, & deferred if their size or mtime changed in between.
+        Deferred files are left for the next run to pick up.
+
+        The quiet period compares the remote mtime with the local clock, so clock skew
+        between the hosts shortens or lengthens it. The second stat only compares remote
+        values, which catches writers that do not update the mtime as they go.
+
+    Params:
+        quiet_period (float): Seconds a file must go unmodified. 0 disables the check.
+        recheck_interval (float): Seconds between the two stats. 0 disables the second stat.
+        clock (Callable[[], float]): Returns the current time as a UNIX timestamp.
+    """
+
+    def __init__(
+        self,
+        quiet_period: float = 60.0,
+        recheck_interval: float = 2.0,
+        clock: t.Callable[[], float] = time.time,
+    ):
+        assert quiet_period >= 0, ValueError(
+            f"quiet_period must be >= 0. Got: {quiet_period}"
+        )
+        assert recheck_interval >= 0, ValueError(
+            f"recheck_interval must be >= 0. Got: {recheck_interval}"
+        )
+
+        self.quiet_period: float = quiet_period
+        self.recheck_interval: float = recheck_interval
+        self.clock: t.Callable[[], float] = clock
+
+    def split(
+        self, stat_many: StatMany = None, remote_paths: list[str] = None
+    ) -> tuple[dict[str, paramiko.SFTPAttributes], dict[str, str]]:
+        """Split remote_paths into finished & still changing files.
+
+        Params:
+            stat_many (Callable[[list[str]], PipelineResult]): Stats a batch of remote paths,
+                i.e. `SSHManager.stat_many()` bound to an open SFTP client.
+            remote_paths (list[str]): Remote files to check.
+
+        Returns:
+            (tuple[dict[str, SFTPAttributes], dict[str, str]]): Map of stable remote path ->
+                its latest attributes, & map of deferred remote path -> the reason.
+
+        """
+        assert stat_many, ValueError("Missing a function to stat remote paths with")
+
+        stable: dict[str, paramiko.SFTPAttributes] = {}
+        deferred: dict[str, str] = {}
+        if not remote_paths:
+            return stable, deferred
+
+        sent: float = time.monotonic()
+        first: PipelineResult = stat_many(list(remote_paths))
+        now: float = self.clock()
+
+        for remote_path in remote_paths:
+            attrs = first.results.get(remote_path)
+            if attrs is None:
+                ## Usually a temporary file the writer renamed or removed since the walk
+                deferred[remote_path] = f"stat failed: {first.errors.get(remote_path)}"
+            elif self.quiet_period and now - (attrs.st_mtime or 0) < self.quiet_period:
+                deferred[remote_path] = (
+                    f"modified {max(now - (attrs.st_mtime or 0), 0):.0f}s ago"
+                )
+            else:
+                stable[remote_path] = attrs
+
+        if self.recheck_interval and stable:
+            if (wait := self.recheck_interval - (time.monotonic() - sent)) > 0:
+                time.sleep(wait)
+
+            second: PipelineResult = stat_many(list(stable))
+            for remote_path, attrs in list(stable.items()):
+                latest = second.results.get(remote_path)
+                if latest is None:
+                    deferred[remote_path] = (
+                        f"stat failed: {second.errors.get(remote_path)}"
+                    )
+                elif latest.st_size != attrs.st_size or latest.st_mtime != attrs.st_mtime:
+                    deferred[remote_path] = (
+                        f"size changed {attrs.st_size} -> {latest.st_size} while checked"
+                    )
+                else:
+                    stable[remote_path] = latest
+                    continue
+
+                del stable[remote_path]
+
+        if deferred:
+            log.info(
+                f"Deferred [{len(deferred)}/{len(remote_paths)}] file(s) still being written on the remote"
+            )
+
+        return stable, deferred
+
+    def __repr__(self) -> str:
+        return f"StabilityCheck(quiet_period={self.quiet_period}, recheck_interval={self.recheck_interval})"
@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+from .classes import (
+    DEFAULT_RUN_JOURNAL_FILE,
+    DEFAULT_SIZE_CLASSES,
+    DEFAULT_THROUGHPUT_HISTORY_FILE,
+    VALID_PROTOCOLS,
+    AIMDController,
+    ProtocolSelector,
+    RunJournal,
+    ThroughputHistory,
+    TransferJob,
+    TransferStats,
+)
+from .methods import VALID_TRANSFER_ORDERS, order_jobs, run_transfers, scp_download
@@ -0,0 +1,600 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+import threading
+import time
+import typing as t
+
+from core.paths import DATA_DIR
+from loguru import logger as log
+
+DEFAULT_THROUGHPUT_HISTORY_FILE: Path = Path(f"{DATA_DIR}/throughput_history.json")
+DEFAULT_RUN_JOURNAL_FILE: Path = Path(f"{DATA_DIR}/run_journal.jsonl")
+
+
+class TransferJob:
+    """A remote file to download to temp_path, then commit to local_path."""
+
+    def __init__(
+        self,
+        remote_path: str = None,
+        local_path: Path = None,
+        temp_path: Path = None,
+        size: int = 0,
+    ):
+        self.remote_path: str = remote_path
+        self.local_path: Path = local_path
+        self.temp_path: Path = temp_path
+        self.size: int = size
+        ## Failed attempts so far
+        self.attempts: int = 0
+
+    def __repr__(self) -> str:
+        return f"TransferJob(remote_path='{self.remote_path}', size={self.size})"
+
+
+class TransferStats:
+    """Results of a batch of transfers."""
+
+    def __init__(self):
+        self.downloaded: list[Path] = []
+        ## Remote path -> exception that failed its last download attempt
+        self.failed: dict[str, Exception] = {}
+        self.retried: int = 0
+        self.bytes_transferred: int = 0
+        self.elapsed: float = 0.0
+        self.peak_in_flight: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """Average bytes/second over the whole transfer."""
+        return self.bytes_transferred / self.elapsed if self.elapsed else 0.0
+
+
+class AIMDController:
+    """Tune the number of in-flight transfers from measured throughput.
+
+    Description:
+        Throughput is sampled over windows of `window` seconds while the transfer engine is
+        saturated (every allowed slot is busy). If throughput rose by more than tolerance
+        since the previous window, the limit grows by `increase` (additive increase). If it
+        fell by more than tolerance, or a transfer timed out or failed, the limit is
+        multiplied by decrease_factor (multiplicative decrease). The limit always stays
+        between min_limit & max_limit.
+
+    Params:
+        min_limit (int): Fewest transfers allowed in flight.
+        max_limit (int): Most transfers allowed in flight.
+        initial_limit (int | None): Starting limit. Defaults to min_limit.
+        increase (int): Transfers added when throughput rises.
+        decrease_factor (float): Multiplier applied to the limit on a decrease.
+        window (float): Seconds of transfer measured before each adjustment.
+        tolerance (float): Relative change in throughput treated as noise.
+    """
+
+    def __init__(
+        self,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        initial_limit: int | None = None,
+        increase: int = 1,
+        decrease_factor: float = 0.5,
+        window: float = 2.0,
+        tolerance: float = 0.05,
+    ):
+        assert isinstance(min_limit, int) and min_limit > 0, ValueError(
+            f"min_limit must be a positive integer. Got: {min_limit}"
+        )
+        assert isinstance(max_limit, int) and max_limit >= min_limit, ValueError(
+            f"max_limit must be an integer >= min_limit. Got: {max_limit}"
+        )
+        assert 0 < decrease_factor < 1, ValueError(
+            f"decrease_factor must be between 0 & 1. Got: {decrease_factor}"
+        )
+
+        self.min_limit: int = min_limit
+        self.max_limit: int = max_limit
+        self.increase: int = increase
+        self.decrease_factor: float = decrease_factor
+        self.window: float = window
+        self.tolerance: float = tolerance
+
+        self.limit: int = min(max(initial_limit or min_limit, min_limit), max_limit)
+
+        self._lock = threading.Lock()
+        self._window_bytes: int = 0
+        self._window_started: float = time.monotonic()
+        self._last_throughput: float | None = None
+
+    def add_bytes(self, n: int) -> None:
+        """Record n bytes transferred. Safe to call from any thread."""
+        with self._lock:
+            self._window_bytes += n
+
+    def _reset_window(self, now: float) -> None:
+        self._window_bytes = 0
+        self._window_started = now
+
+    def _decrease(self, reason: str) -> None:
+        new_limit: int = max(self.min_limit, int(self.limit * self.decrease_factor))
+        if new_limit != self.limit:
+            log.debug(f"Transfer limit {self.limit} -> {new_limit} ({reason})")
+        self.limit = new_limit
+        ## Measure the new limit from scratch
+        self._last_throughput = None
+
+    def record_error(self) -> None:
+        """Back off after a transfer timed out or failed."""
+        with self._lock:
+            self._decrease(reason="transfer error")
+            self._reset_window(time.monotonic())
+
+    def tick(self, saturated: bool = True) -> None:
+        """Adjust the limit if the current window has elapsed.
+
+        Params:
+            saturated (bool): Whether every allowed slot was busy. Throughput measured with
+                idle slots (i.e. while the last few files finish) does not reflect the limit,
+                so the window is discarded.
+        """
+        now: float = time.monotonic()
+
+        with self._lock:
+            elapsed: float = now - self._window_started
+            if elapsed < self.window:
+                return
+
+            throughput: float = self._window_bytes / elapsed
+            self._reset_window(now)
+
+            if not saturated:
+                return
+
+            last: float | None = self._last_throughput
+            if last is None or throughput > last * (1 + self.tolerance):
+                if self.limit < self.max_limit:
+                    new_limit: int = min(self.limit + self.increase, self.max_limit)
+                    log.debug(
+                        f"Transfer limit {self.limit} -> {new_limit} ({throughput / 1024 / 1024:.1f} MiB/s)"
+                    )
+                    self.limit = new_limit
+                self._last_throughput = throughput
+
+            elif throughput < last * (1 - self.tolerance):
+                self._decrease(
+                    reason=f"throughput fell to {throughput / 1024 / 1024:.1f} MiB/s"
+                )
+
+
+VALID_PROTOCOLS: list[str] = ["sftp", "scp"]
+
+## Upper bounds (bytes) of the size classes calibrated separately. Larger files fall in a
+#  final, unbounded class.
+DEFAULT_SIZE_CLASSES: list[int] = [
+    1024 * 1024,
+    64 * 1024 * 1024,
+    1024 * 1024 * 1024,
+]
+
+
+class ProtocolSelector:
+    """Pick SFTP or SCP per file, by whichever measured faster for files of its size.
+
+    Description:
+        Calibrates on the run's own downloads: the first samples_per_class files of each size
+        class alternate between the protocols, so no data is transferred twice. Once both
+        protocols have been sampled in a class, the one with the higher throughput
+        (total bytes / total seconds) is used for the rest of that class.
+
+        SCP is dropped for the rest of the run if it fails, i.e. when the remote has no
+        `scp` binary.
+
+    Params:
+        samples_per_class (int): Downloads measured per protocol in each size class.
+        size_classes (list[int]): Upper bounds, in bytes, of each size class.
+    """
+
+    def __init__(
+        self,
+        samples_per_class: int = 2,
+        size_classes: list[int] = DEFAULT_SIZE_CLASSES,
+    ):
+        assert isinstance(samples_per_class, int) and samples_per_class > 0, ValueError(
+            f"samples_per_class must be a positive integer. Got: {samples_per_class}"
+        )
+
+        self.samples_per_class: int = samples_per_class
+        self.size_classes: list[int] = sorted(size_classes)
+
+        self._lock = threading.Lock()
+        ## Size class -> protocol -> [samples, bytes, seconds]
+        self._samples: dict[int, dict[str, list[float]]] = {}
+        ## Samples handed out but not yet recorded, so parallel workers do not over-sample
+        self._started: dict[int, dict[str, int]] = {}
+        self._chosen: dict[int, str] = {}
+        self.available: set[str] = set(VALID_PROTOCOLS)
+
+    def _size_class(self, size: int) -> int:
+        for idx, bound in enumerate(self.size_classes):
+            if size <= bound:
+                return idx
+
+        return len(self.size_classes)
+
+    def choose(self, size: int) -> str:
+        """Return the protocol to download a file of size bytes with."""
+        with self._lock:
+            if len(self.available) == 1:
+                return next(iter(self.available))
+
+            size_class: int = self._size_class(size)
+            if size_class in self._chosen:
+                return self._chosen[size_class]
+
+            started = self._started.setdefault(
+                size_class, {protocol: 0 for protocol in VALID_PROTOCOLS}
+            )
+            ## Calibrate the least-sampled protocol, until both have enough samples
+            protocol: str = min(VALID_PROTOCOLS, key=lambda p: started[p])
+            if started[protocol] >= self.samples_per_class:
+                ## Still waiting on calibration downloads, use the current leader
+                return self._leader(size_class) or "sftp"
+
+            started[protocol] += 1
+
+            return protocol
+
+    def _leader(self, size_class: int) -> str | None:
+        samples = self._samples.get(size_class, {})
+        rates: dict[str, float] = {
+            protocol: nbytes / seconds
+            for protocol, (_, nbytes, seconds) in samples.items()
+            if seconds > 0
+        }
+
+        return max(rates, key=rates.get) if rates else None
+
+    def record(self, protocol: str, size: int, seconds: float) -> None:
+        """Record a completed download's size & duration."""
+        with self._lock:
+            size_class: int = self._size_class(size)
+            if size_class in self._chosen:
+                return
+
+            samples = self._samples.setdefault(size_class, {})
+            entry: list[float] = samples.setdefault(protocol, [0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += size
+            entry[2] += seconds
+
+            if all(
+                samples.get(p, [0])[0] >= self.samples_per_class for p in VALID_PROTOCOLS
+            ):
+                self._chosen[size_class] = self._leader(size_class) or "sftp"
+                rates: str = ", ".join(
+                    f"{p}: {samples[p][1] / samples[p][2] / 1024 / 1024:.1f} MiB/s"
+                    for p in VALID_PROTOCOLS
+                    if samples[p][2] > 0
+                )
+                log.info(
+                    f"Using {self._chosen[size_class]} for size class {self._describe(size_class)} ({rates})"
+                )
+
+    def disable(self, protocol: str, reason: str = "") -> None:
+        """Stop using protocol for the rest of the run."""
+        with self._lock:
+            if protocol in self.available and len(self.available) > 1:
+                log.warning(f"Disabling {protocol} transfers. {reason}".strip())
+                self.available.discard(protocol)
+
+    def _describe(self, size_class: int) -> str:
+        lo: int = self.size_classes[size_class - 1] if size_class > 0 else 0
+        if size_class < len(self.size_classes):
+            return f"{lo}-{self.size_classes[size_class]} bytes"
+
+        return f">{lo} bytes"
+
+
+class ThroughputHistory:
+    """Persisted record of measured download throughput, used to estimate transfer times.
+
+    Params:
+        history_file (str | Path): JSON file the history is persisted to.
+        max_entries (int): Number of recent measurements kept.
+    """
+
+    def __init__(
+        self,
+        history_file: t.Union[str, Path] = DEFAULT_THROUGHPUT_HISTORY_FILE,
+        max_entries: int = 50,
+    ):
+        self.history_file: Path = Path(f"{history_file}")
+        self.max_entries: int = max_entries
+
+        ## [unix timestamp, bytes, seconds]
+        self.entries: list[list[float]] = self._load()
+        self._dirty: bool = False
+
+    def _load(self) -> list[list[float]]:
+        if not self.history_file.exists():
+            return []
+
+        try:
+            with open(self.history_file, "r") as f:
+                return json.load(f)
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception reading throughput history '{self.history_file}'. Starting with an empty history. Details: {exc}"
+            )
+            log.warning(msg)
+
+            return []
+
+    def record(self, nbytes: int, seconds: float) -> None:
+        """Record a transfer of nbytes that took seconds."""
+        if nbytes <= 0 or seconds <= 0:
+            return
+
+        self.entries.append([time.time(), nbytes, seconds])
+        self.entries = self.entries[-self.max_entries :]
+        self._dirty = True
+
+    def estimate(self, recent: int = 10) -> float | None:
+        """Return the throughput (bytes/second) of the most recent transfers, weighted by size.
+
+        Returns `None` if nothing has been recorded.
+        """
+        entries: list[list[float]] = self.entries[-recent:]
+        total_seconds: float = sum(seconds for _, _, seconds in entries)
+        if not total_seconds:
+            return None
+
+        return sum(nbytes for _, nbytes, _ in entries) / total_seconds
+
+    def save(self) -> None:
+        """Write the history to disk, if it changed."""
+        if not self._dirty:
+            return
+
+        self.history_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file: Path = self.history_file.with_name(f"{self.history_file.name}.tmp")
+
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_file, self.history_file)
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception saving throughput history '{self.history_file}'. Details: {exc}"
+            )
+            log.error(msg)
+
+            raise exc
+
+        self._dirty = False
+
+
+class RunJournal:
+    """Append-only journal of a backup run, so an interrupted run resumes where it stopped.
+
+    Description:
+        One JSON record is appended per line as the run progresses:
+
+        - `run`: A run of remote_dir started (or resumed).
+        - `plan`: The files to download from a remote directory, after walking it.
+        - `start` / `fail`: A download started / an attempt failed.
+        - `commit`: Downloaded files were committed to their local paths.
+        - `end`: Every planned file was downloaded.
+
+        `begin()` reads the journal left by the previous run. If that run did not reach its
+        `end` record (it crashed, or some downloads failed every retry), this run resumes
+        it: remote directories it already planned are not walked again, & only the planned
+        files that were not committed are downloaded (see `remaining()`). A run is resumed
+        at most max_resumes times, so a file that can never be downloaded does not stop
+        new files from being found. Otherwise the journal is started over.
+
+        Lines are flushed as they are written. `plan`, `commit` & `end` records are also
+        fsynced, because resuming depends on them. A line torn by a crash is ignored, &
+        cut off before the resumed run appends to the journal.
+
+    Params:
+        journal_file (str | Path): File the journal is written to.
+        fsync (bool): fsync `plan`, `commit` & `end` records.
+        max_resumes (int): Times an unfinished run is resumed before starting over.
+    """
+
+    def __init__(
+        self,
+        journal_file: t.Union[str, Path] = DEFAULT_RUN_JOURNAL_FILE,
+        fsync: bool = True,
+        max_resumes: int = 3,
+    ):
+        self.journal_file: Path = Path(f"{journal_file}")
+        self.fsync: bool = fsync
+        self.max_resumes: int = max_resumes
+
+        self.resumed: bool = False
+        ## Unix timestamp the (first attempt of the) run started at
+        self.started_at: float | None = None
+        ## Remote path -> error of downloads that failed every attempt in this run
+        self.failed: dict[str, str] = {}
+
+        ## Remote directory -> [[remote_path, local_path, size], ...]
+        self._plans: dict[str, list[list]] = {}
+        self._committed: set[str] = set()
+        self._f: t.TextIO | None = None
+        self._lock = threading.Lock()
+
+    def _read(self) -> list[dict]:
+        if not self.journal_file.exists():
+            return []
+
+        records: list[dict] = []
+        with open(self.journal_file, "r") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    ## Torn write from a crash
+                    continue
+
+        return records
+
+    def _truncate_torn_tail(self) -> None:
+        """Drop a last line left half-written by a crash, so the next record starts a line."""
+        if not self.journal_file.exists():
+            return
+
+        with open(self.journal_file, "rb+") as f:
+            size: int = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+
+            ## Find the last complete line, reading back from the end a chunk at a time
+            end: int = size
+            while end > 0:
+                start: int = max(end - 64 * 1024, 0)
+                f.seek(start)
+                newline: int = f.read(end - start).rfind(b"\n")
+                if newline != -1:
+                    end = start + newline + 1
+                    break
+                end = start
+
+            log.warning(
+                f"Dropping [{size - end}] byte(s) of a torn record from the end of run journal '{self.journal_file}'"
+            )
+            f.truncate(end)
+
+    def begin(self, remote_dir: str = None) -> bool:
+        """Start journaling a run of remote_dir, resuming the previous run if it did not finish.
+
+        Returns:
+            (bool): `True` if the previous run is being resumed.
+
+        """
+        assert remote_dir, ValueError("Missing the remote directory being backed up")
+
+        try:
+            records: list[dict] = self._read()
+        except Exception as exc:
+            log.warning(
+                f"Unable to read run journal '{self.journal_file}', starting a new run. Details: {exc}"
+            )
+            records = []
+
+        runs: list[dict] = [r for r in records if r.get("event") == "run"]
+        unfinished: bool = (
+            bool(runs)
+            and runs[0].get("remote_dir") == remote_dir
+            and not any(r.get("event") == "end" for r in records)
+        )
+
+        if unfinished and len(runs) <= self.max_resumes:
+            self.resumed = True
+            self.started_at = runs[0]["started_at"]
+
+            for r in records:
+                if r.get("event") == "plan":
+                    self._plans[r["remote_src"]] = r["jobs"]
+                elif r.get("event") == "commit":
+                    self._committed.update(r["local_paths"])
+
+            self._truncate_torn_tail()
+
+            remaining: int = sum(
+                len(self.remaining(remote_src) or []) for remote_src in self._plans
+            )
+            log.info(
+                f"Resuming unfinished run of '{remote_dir}' (attempt {len(runs) + 1}): [{len(self._plans)}] directory(s) already planned, [{remaining}] file(s) left to download"
+            )
+        else:
+            if unfinished:
+                log.warning(
+                    f"Unfinished run of '{remote_dir}' was resumed [{len(runs) - 1}] time(s) already. Starting a new run."
+                )
+
+            self.started_at = time.time()
+
+            ## Start the journal over
+            self.journal_file.parent.mkdir(parents=True, exist_ok=True)
+            open(self.journal_file, "w").close()
+
+        self._append(
+            {"event": "run", "remote_dir": remote_dir, "started_at": self.started_at},
+            sync=True,
+        )
+
+        return self.resumed
+
+    def _append(self, record: dict, sync: bool = False) -> None:
+        assert self.started_at is not None, ValueError("Run journal has not begun")
+
+        with self._lock:
+            if self._f is None:
+                self._f = open(self.journal_file, "a")
+
+            self._f.write(json.dumps(record) + "\n")
+            self._f.flush()
+            if sync and self.fsync:
+                os.fsync(self._f.fileno())
+
+    def remaining(self, remote_src: str = None) -> list[TransferJob] | None:
+        """Return the planned files of remote_src that were not committed yet.
+
+        Returns `None` if remote_src was not planned by the run being resumed, meaning it
+        must be walked.
+        """
+        if remote_src not in self._plans:
+            return None
+
+        return [
+            TransferJob(remote_path=remote_path, local_path=Path(local_path), size=size)
+            for remote_path, local_path, size in self._plans[remote_src]
+            if local_path not in self._committed
+        ]
+
+    def record_plan(self, remote_src: str = None, jobs: list[TransferJob] = None) -> None:
+        plan: list[list] = [
+            [job.remote_path, f"{job.local_path}", job.size] for job in jobs or []
+        ]
+        self._plans[remote_src] = plan
+        self._append({"event": "plan", "remote_src": remote_src, "jobs": plan}, sync=True)
+
+    def record_start(self, job: TransferJob) -> None:
+        self._append({"event": "start", "remote_path": job.remote_path})
+
+    def record_failure(self, job: TransferJob, exc: Exception, final: bool) -> None:
+        if final:
+            self.failed[job.remote_path] = f"{exc}"
+
+        self._append(
+            {
+                "event": "fail",
+                "remote_path": job.remote_path,
+                "attempt": job.attempts,
+                "final": final,
+                "error": f"{exc}",
+            }
+        )
+
+    def record_commit(self, local_paths: list[Path]) -> None:
+        paths: list[str] = [f"{p}" for p in local_paths]
+        self._committed.update(paths)
+        self._append({"event": "commit", "local_paths": paths}, sync=True)
+
+    def finish(self) -> None:
+        """Mark the run as complete, so the next run starts over."""
+        self._append({"event": "end"}, sync=True)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
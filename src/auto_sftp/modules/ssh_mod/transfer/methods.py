@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import heapq
+from pathlib import Path
+import threading
+import time
+import typing as t
+
+from .classes import AIMDController, TransferJob, TransferStats
+
+from core.helpers import SampledLog
+from loguru import logger as log
+import paramiko
+from scp import SCPClient
+
+## Downloads job with the SFTP client, reporting progress in bytes to the callback
+DownloadFn = t.Callable[[paramiko.SFTPClient, TransferJob, t.Callable[[int], None]], None]
+
+VALID_TRANSFER_ORDERS: list[str] = ["largest_first", "smallest_first", "walk"]
+
+
+def scp_download(
+    ssh_client: paramiko.SSHClient = None,
+    remote_path: str = None,
+    local_path: t.Union[str, Path] = None,
+    callback: t.Callable[[int], None] | None = None,
+    timeout: float | None = None,
+) -> None:
+    """Download a file with SCP, which streams the file instead of SFTP's request/reply reads.
+
+    Params:
+        ssh_client (paramiko.SSHClient): Connected SSH client. SCP runs on a new channel.
+        remote_path (str): Remote file to download.
+        local_path (str | Path): Local path to write the file to.
+        callback (Callable[[int], None] | None): Called with the number of bytes received
+            since the previous call.
+        timeout (float | None): Seconds a read may block before the transfer fails.
+    """
+    assert ssh_client, ValueError("Missing an SSH client")
+    assert remote_path, ValueError("Missing a remote path")
+    assert local_path, ValueError("Missing a local path")
+
+    progress: list[int] = [0]
+
+    def _progress(filename: bytes, size: int, sent: int) -> None:
+        if callback is not None:
+            callback(sent - progress[0])
+        progress[0] = sent
+
+    with SCPClient(
+        ssh_client.get_transport(),
+        buff_size=1024 * 1024,
+        socket_timeout=timeout,
+        progress=_progress,
+    ) as scp_client:
+        scp_client.get(remote_path, local_path=f"{local_path}")
+
+
+def order_jobs(
+    jobs: t.Iterable[TransferJob] = None, order: str = "largest_first"
+) -> list[TransferJob]:
+    """Return jobs in the order they should be started.
+
+    Description:
+        - `largest_first`: Longest-processing-time-first scheduling. The largest files start
+          first, so one big archive never starts last & sets the finish time of the whole
+          run; the small files left at the end fill the gaps as workers free up. Minimizes
+          total transfer time.
+        - `smallest_first`: Many small files become available locally as soon as possible,
+          at the cost of total transfer time.
+        - `walk`: The order the remote was walked in.
+    """
+    assert order in VALID_TRANSFER_ORDERS, ValueError(
+        f"Invalid transfer order: '{order}'. Must be one of {VALID_TRANSFER_ORDERS}"
+    )
+
+    if order == "walk":
+        return list(jobs)
+
+    ## sorted() is stable, so equal sizes keep walk order
+    return sorted(jobs, key=lambda job: job.size, reverse=order == "largest_first")
+
+
+def run_transfers(
+    open_sftp: t.Callable[[], paramiko.SFTPClient] = None,
+    jobs: t.Iterable[TransferJob] = None,
+    download: DownloadFn = None,
+    on_complete: t.Callable[[TransferJob], None] | None = None,
+    controller: AIMDController | None = None,
+    timeout: float | None = None,
+    retries: int = 0,
+    retry_backoff: float = 2.0,
+    max_retry_backoff: float = 60.0,
+    on_start: t.Callable[[TransferJob], None] | None = None,
+    on_failure: t.Callable[[TransferJob, Exception, bool], None] | None = None,
+    reserve: t.Callable[[TransferJob], None] | None = None,
+) -> TransferStats:
+    """Run downloads in parallel, with the number in flight tuned by an AIMDController.
+
+    Description:
+        Each worker thread opens its own SFTP session with open_sftp, so transfers run on
+        separate channels of the same SSH connection. Jobs are started in order as the
+        controller allows. When a job fails or times out, its temporary file is removed &
+        the controller backs off. The job is retried up to `retries` times, after waiting
+        retry_backoff seconds (doubled after each attempt, up to max_retry_backoff) while
+        the other jobs carry on. A job that fails every attempt is recorded in
+        `TransferStats.failed`.
+
+        on_start, on_complete & on_failure are called in the calling thread, so they do not
+        need to be thread-safe.
+
+        reserve is called before each attempt starts, i.e. to make room on disk. If it
+        raises, the job fails without being retried.
+
+    Params:
+        open_sftp (Callable[[], SFTPClient]): Opens an SFTP session, i.e.
+            `SSHManager.get_sftp_client`.
+        jobs (Iterable[TransferJob]): Files to download, started in this order.
+        download (DownloadFn): Downloads a job to its `temp_path`.
+        on_complete (Callable[[TransferJob], None] | None): Called with each completed job.
+        controller (AIMDController | None): Tunes concurrency. Defaults to `AIMDController()`.
+        timeout (float | None): Seconds an SFTP read may block before the transfer fails.
+        retries (int): Times a failed job is retried.
+        retry_backoff (float): Seconds to wait before the first retry of a job.
+        max_retry_backoff (float): Longest wait between retries of a job.
+        on_start (Callable[[TransferJob], None] | None): Called with each job as it starts.
+        on_failure (Callable[[TransferJob, Exception, bool], None] | None): Called with each
+            failed attempt, its exception & whether it was the job's last attempt.
+        reserve (Callable[[TransferJob], None] | None): Called before each attempt starts.
+
+    Returns:
+        (TransferStats): Downloaded paths, failures & throughput.
+
+    """
+    assert open_sftp, ValueError("Missing a function to open SFTP sessions")
+    assert jobs is not None, ValueError("Missing jobs to transfer")
+    assert download, ValueError("Missing a download function")
+
+    controller = controller or AIMDController()
+    stats = TransferStats()
+    events = SampledLog(name="transfer.file")
+    pending: deque[TransferJob] = deque(jobs)
+    ## (ready_at, sequence, job) of failed jobs waiting to be retried
+    retry_queue: list[tuple[float, int, TransferJob]] = []
+
+    local = threading.local()
+    opened: list[paramiko.SFTPClient] = []
+    opened_lock = threading.Lock()
+
+    def _get_sftp() -> paramiko.SFTPClient:
+        sftp_client: paramiko.SFTPClient | None = getattr(local, "sftp_client", None)
+        if sftp_client is None:
+            sftp_client = open_sftp()
+            if timeout:
+                sftp_client.get_channel().settimeout(timeout)
+
+            local.sftp_client = sftp_client
+            with opened_lock:
+                opened.append(sftp_client)
+
+        return sftp_client
+
+    def _run(job: TransferJob) -> TransferJob:
+        try:
+            download(_get_sftp(), job, controller.add_bytes)
+        except Exception as exc:
+            job.temp_path.unlink(missing_ok=True)
+
+            ## The session may be broken (i.e. after a timeout), open a new one for the next job
+            sftp_client = getattr(local, "sftp_client", None)
+            if sftp_client is not None:
+                sftp_client.close()
+                local.sftp_client = None
+
+            raise exc
+
+        return job
+
+    started_at: float = time.monotonic()
+    in_flight: dict[Future, TransferJob] = {}
+
+    try:
+        with ThreadPoolExecutor(max_workers=controller.max_limit) as executor:
+            while pending or in_flight or retry_queue:
+                ## Retries go ahead of jobs that have not started yet
+                now: float = time.monotonic()
+                while retry_queue and retry_queue[0][0] <= now:
+                    pending.appendleft(heapq.heappop(retry_queue)[2])
+
+                while pending and len(in_flight) < controller.limit:
+                    job: TransferJob = pending.popleft()
+                    if reserve is not None:
+                        try:
+                            reserve(job)
+                        except Exception as exc:
+                            log.warning(
+                                f"Not downloading '{job.remote_path}'. Details: {exc}"
+                            )
+                            job.attempts += 1
+                            stats.failed[job.remote_path] = exc
+                            if on_failure is not None:
+                                on_failure(job, exc, True)
+
+                            continue
+
+                    if on_start is not None:
+                        on_start(job)
+                    in_flight[executor.submit(_run, job)] = job
+
+                stats.peak_in_flight = max(stats.peak_in_flight, len(in_flight))
+                saturated: bool = len(in_flight) >= controller.limit
+
+                wait_for: float = controller.window
+                if retry_queue:
+                    wait_for = max(0.0, min(wait_for, retry_queue[0][0] - now))
+                if not in_flight:
+                    time.sleep(wait_for)
+                    continue
+
+                done, _ = wait(
+                    list(in_flight), timeout=wait_for, return_when=FIRST_COMPLETED
+                )
+
+                for future in done:
+                    job = in_flight.pop(future)
+                    try:
+                        future.result()
+                    except Exception as exc:
+                        controller.record_error()
+                        job.attempts += 1
+                        final: bool = job.attempts > retries
+
+                        if final:
+                            log.warning(
+                                f"Failed downloading '{job.remote_path}' after [{job.attempts}] attempt(s). Details: {exc}"
+                            )
+                            stats.failed[job.remote_path] = exc
+                        else:
+                            delay: float = min(
+                                retry_backoff * 2 ** (job.attempts - 1), max_retry_backoff
+                            )
+                            log.warning(
+                                f"Failed downloading '{job.remote_path}' (attempt {job.attempts}/{retries + 1}), retrying in {delay:.1f}s. Details: {exc}"
+                            )
+                            stats.retried += 1
+                            heapq.heappush(
+                                retry_queue, (time.monotonic() + delay, id(job), job)
+                            )
+
+                        if on_failure is not None:
+                            on_failure(job, exc, final)
+
+                        continue
+
+                    stats.bytes_transferred += job.size
+                    events.event(
+                        "Downloaded '{}' ({} bytes)",
+                        job.remote_path,
+                        job.size,
+                        remote_path=job.remote_path,
+                        size=job.size,
+                    )
+                    if on_complete is not None:
+                        on_complete(job)
+                    stats.downloaded.append(job.local_path)
+
+                controller.tick(saturated=saturated)
+
+    finally:
+        for sftp_client in opened:
+            sftp_client.close()
+
+    stats.elapsed = time.monotonic() - started_at
+    events.summary(
+        f"Transferred [{len(stats.downloaded)}] file(s), {stats.bytes_transferred} byte(s) in {stats.elapsed:.1f}s (peak in flight: {stats.peak_in_flight}, retried: {stats.retried}, failed: {len(stats.failed)})",
+        level="DEBUG",
+        downloaded=len(stats.downloaded),
+        bytes=stats.bytes_transferred,
+        elapsed=stats.elapsed,
+        peak_in_flight=stats.peak_in_flight,
+        retried=stats.retried,
+        failed=len(stats.failed),
+    )
+
+    return stats
@@ -0,0 +1,4 @@
+from __future__ import annotations
+
+from .classes import PARTIAL_SUFFIX, CommitBatch
+from .methods import DEFAULT_BUFFER_SIZE, download_file, remove_partial_files
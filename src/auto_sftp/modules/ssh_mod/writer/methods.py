@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import errno
+import mmap
+import os
+from pathlib import Path
+import typing as t
+
+from .classes import PARTIAL_SUFFIX
+
+from core.helpers import SampledLog
+from loguru import logger as log
+import paramiko
+
+DEFAULT_BUFFER_SIZE: int = 8 * 1024 * 1024
+
+## Prefetched data arrives in blocks of this size. Reading larger amounts at once makes
+#  paramiko concatenate blocks into a growing bytes object, which is quadratic.
+_REMOTE_READ_SIZE: int = paramiko.SFTPFile.MAX_REQUEST_SIZE
+
+
+def _preallocate(fd: int, size: int) -> bool:
+    """Reserve size bytes for fd up front, so the filesystem can lay the file out contiguously.
+
+    Returns `False` if the platform or filesystem does not support preallocation.
+    """
+    if size <= 0 or not hasattr(os, "posix_fallocate"):
+        return False
+
+    try:
+        os.posix_fallocate(fd, 0, size)
+
+        return True
+    except OSError as exc:
+        if exc.errno in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL):
+            log.debug(f"Preallocation not supported. Details: {exc}")
+
+            return False
+
+        raise exc
+
+
+def _fadvise(fd: int, advice_name: str, offset: int = 0, length: int = 0) -> None:
+    ## posix_fadvise is a hint, skip it where the platform does not have it
+    if not hasattr(os, "posix_fadvise"):
+        return
+
+    try:
+        os.posix_fadvise(fd, offset, length, getattr(os, advice_name))
+    except OSError as exc:
+        log.debug(f"posix_fadvise({advice_name}) failed. Details: {exc}")
+
+
+def _write_all(fd: int, data: memoryview) -> None:
+    while data:
+        data = data[os.write(fd, data) :]
+
+
+def _write_buffered(
+    remote_f: paramiko.SFTPFile,
+    fd: int,
+    buffer_size: int,
+    callback: t.Callable[[int], None] | None = None,
+) -> int:
+    written: int = 0
+    buffer_size = max(buffer_size, _REMOTE_READ_SIZE)
+    buffer = memoryview(bytearray(buffer_size))
+    filled: int = 0
+
+    while chunk := remote_f.read(_REMOTE_READ_SIZE):
+        if filled + len(chunk) > buffer_size:
+            _write_all(fd, buffer[:filled])
+            filled = 0
+
+        buffer[filled : filled + len(chunk)] = chunk
+        filled += len(chunk)
+        written += len(chunk)
+        if callback is not None:
+            callback(len(chunk))
+
+    _write_all(fd, buffer[:filled])
+
+    return written
+
+
+def _write_mmap(
+    remote_f: paramiko.SFTPFile,
+    fd: int,
+    size: int,
+    callback: t.Callable[[int], None] | None = None,
+) -> int:
+    written: int = 0
+
+    ## A mapping cannot extend the file, so it must already be size bytes long
+    if os.fstat(fd).st_size < size:
+        os.ftruncate(fd, size)
+
+    with mmap.mmap(fd, size, access=mmap.ACCESS_WRITE) as mm:
+        while written < size:
+            chunk = remote_f.read(min(_REMOTE_READ_SIZE, size - written))
+            if not chunk:
+                break
+
+            mm[written : written + len(chunk)] = chunk
+            written += len(chunk)
+            if callback is not None:
+                callback(len(chunk))
+
+    return written
+
+
+def download_file(
+    sftp_client: paramiko.SFTPClient = None,
+    remote_path: str = None,
+    local_path: t.Union[str, Path] = None,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    use_mmap: bool = False,
+    preallocate: bool = True,
+    drop_cache: bool = False,
+    callback: t.Callable[[int], None] | None = None,
+) -> int:
+    """Download a remote file, writing it locally through a large buffer.
+
+    Description:
+        A replacement for `SFTPClient.get()`, which writes in 32 KiB chunks. The local file
+        is preallocated from the remote size with `posix_fallocate`, so large archives are
+        not fragmented, then written either in buffer_size `write()` calls or through an mmap
+        of the file. Reads are prefetched (pipelined) like `get()`.
+
+        The kernel is told the file is written sequentially. With drop_cache the file is
+        flushed & its pages dropped from the page cache once written, so a large download
+        does not evict more useful cached data, at the cost of a sync per file.
+
+    Params:
+        sftp_client (paramiko.SFTPClient): Open SFTP client for the remote.
+        remote_path (str): Remote file to download.
+        local_path (str | Path): Local path to write the file to.
+        buffer_size (int): Bytes written locally per `write()` call. Unused with use_mmap.
+        use_mmap (bool): Write through an mmap of the local file instead of `write()` calls.
+        preallocate (bool): Reserve the file's full size before writing.
+        drop_cache (bool): Drop the file's pages from the page cache once it is written.
+        callback (Callable[[int], None] | None): Called with the number of bytes in each
+            chunk as it is received.
+
+    Returns:
+        (int): Number of bytes written.
+
+    """
+    assert sftp_client, ValueError("Missing an SFTP client")
+    assert remote_path, ValueError("Missing a remote path")
+    assert local_path, ValueError("Missing a local path")
+    assert isinstance(buffer_size, int) and buffer_size > 0, ValueError(
+        f"buffer_size must be a positive integer. Got: {buffer_size}"
+    )
+
+    local_path: Path = Path(f"{local_path}")
+
+    with sftp_client.open(remote_path, "rb") as remote_f:
+        size: int = remote_f.stat().st_size
+        remote_f.prefetch(size)
+
+        ## A writable mmap needs the file opened for reading too
+        flags: int = (os.O_RDWR if use_mmap else os.O_WRONLY) | os.O_CREAT | os.O_TRUNC
+        fd: int = os.open(local_path, flags, 0o644)
+        try:
+            if preallocate:
+                _preallocate(fd, size)
+            _fadvise(fd, "POSIX_FADV_SEQUENTIAL")
+
+            if use_mmap and size > 0:
+                written: int = _write_mmap(remote_f, fd, size, callback)
+            else:
+                written: int = _write_buffered(remote_f, fd, buffer_size, callback)
+
+            ## Preallocation sets the file size, trim it if the remote file came up short
+            if os.fstat(fd).st_size != written:
+                os.ftruncate(fd, written)
+
+            if written != size:
+                raise IOError(f"size mismatch in download! {written} != {size}")
+
+            if drop_cache:
+                if hasattr(os, "fdatasync"):
+                    os.fdatasync(fd)
+                else:
+                    os.fsync(fd)
+                _fadvise(fd, "POSIX_FADV_DONTNEED")
+
+        except Exception as exc:
+            os.close(fd)
+            local_path.unlink(missing_ok=True)
+
+            msg = Exception(
+                f"Unhandled exception downloading remote file '{remote_path}' to '{local_path}'. Details: {exc}"
+            )
+            log.error(msg)
+
+            raise exc
+
+        os.close(fd)
+
+    return written
+
+
+def remove_partial_files(root: t.Union[str, Path] = None) -> int:
+    """Remove files left under root by downloads that were interrupted before being committed.
+
+    Must not run while downloads into root are in progress.
+
+    Returns:
+        (int): Number of files removed.
+
+    """
+    assert root, ValueError("Missing a root directory to clean")
+
+    events = SampledLog(name="writer.partial_removed")
+    removed: int = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.startswith(".") and name.endswith(PARTIAL_SUFFIX):
+                partial: Path = Path(dirpath) / name
+                events.event("Removing partial download '{}'", partial, path=f"{partial}")
+                partial.unlink(missing_ok=True)
+                removed += 1
+
+    if removed:
+        events.summary(
+            f"Removed [{removed}] partial download(s) from '{root}'", root=f"{root}"
+        )
+
+    return removed
@@ -4,5 +4,8 @@ from .methods import (
     get_file_dicts,
     delete_oldest,
     run_local_cleanup,
+    scan_local_backups,
+    start_local_cleanup,
+    finish_local_cleanup,
 )
-from .classes import File
+from .classes import CleanupScan, DiskBudget, File
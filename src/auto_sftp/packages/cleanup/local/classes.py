@@ -1,6 +1,12 @@
+import errno
+import heapq
+import os
+import threading
 import typing as t
 from pathlib import Path
 
+from loguru import logger as log
+from modules import sort, ssh_mod
 from pydantic import BaseModel, Field, ValidationError, field_validator, ConfigDict
 import pendulum
 
@@ -15,3 +21,261 @@ class File(BaseModel):
     created_at: pendulum.DateTime = Field(default=None)
     modified_at: pendulum.DateTime = Field(default=None)
     size_in_bytes: int = Field(default=0)
+
+
+def _logical_age(name: str, mtime: float) -> float:
+    """Return a backup's age: the timestamp in its filename if there is one, otherwise its mtime."""
+    try:
+        return sort.extract_dt_from_filename(filename=name).timestamp()
+    except ValueError:
+        return mtime
+
+
+class DiskBudget:
+    """Cap the bytes stored in local_dest, evicting the oldest backups to make room.
+
+    Description:
+        `scan()` indexes local_dest once. After that the index is kept in memory & updated
+        as downloads are reserved, committed & evicted, so checking the budget before each
+        download never walks the disk again.
+
+        Bytes are counted once per inode, so backups hardlinked by dedupe only count once,
+        & evicting one path of a hardlinked backup frees nothing until the last is gone.
+        Files committed during this run, & files a download in flight will replace, are
+        never evicted. Downloads in flight count against the budget at their full size.
+
+    Params:
+        local_dest (str | Path): Directory the budget applies to.
+        max_bytes (int): Maximum bytes stored in local_dest.
+    """
+
+    def __init__(self, local_dest: t.Union[str, Path] = None, max_bytes: int = None):
+        assert local_dest, ValueError("Missing a local directory to budget")
+        assert isinstance(max_bytes, int) and max_bytes > 0, ValueError(
+            f"max_bytes must be a positive integer. Got: {max_bytes}"
+        )
+
+        self.local_dest: Path = Path(f"{local_dest}").expanduser()
+        self.max_bytes: int = max_bytes
+
+        ## Path -> (logical age, inode key)
+        self._paths: dict[Path, tuple[float, tuple[int, int]]] = {}
+        ## Inode key -> [size, indexed paths linked to it]
+        self._inodes: dict[tuple[int, int], list[int]] = {}
+        ## Min-heap of (logical age, path). Stale entries are skipped when popped
+        self._by_age: list[tuple[float, str]] = []
+        ## Local path -> bytes reserved by a download in flight
+        self._reserved: dict[Path, int] = {}
+        self._protected: set[Path] = set()
+        self._lock = threading.Lock()
+
+        self.used_bytes: int = 0
+        self.evicted: list[Path] = []
+        self.evicted_bytes: int = 0
+
+    @property
+    def reserved_bytes(self) -> int:
+        return sum(self._reserved.values())
+
+    @property
+    def free_bytes(self) -> int:
+        """Bytes left in the budget, after downloads in flight."""
+        return self.max_bytes - self.used_bytes - self.reserved_bytes
+
+    def _index(self, path: Path, stat: os.stat_result) -> None:
+        self._unindex(path)
+
+        key: tuple[int, int] = (stat.st_dev, stat.st_ino)
+        age: float = _logical_age(path.name, stat.st_mtime)
+        self._paths[path] = (age, key)
+        heapq.heappush(self._by_age, (age, f"{path}"))
+
+        if key in self._inodes:
+            self._inodes[key][1] += 1
+        else:
+            self._inodes[key] = [stat.st_size, 1]
+            self.used_bytes += stat.st_size
+
+    def _unindex(self, path: Path) -> None:
+        entry = self._paths.pop(path, None)
+        if entry is None:
+            return
+
+        inode = self._inodes[entry[1]]
+        inode[1] -= 1
+        if inode[1] == 0:
+            del self._inodes[entry[1]]
+            self.used_bytes -= inode[0]
+
+    def scan(self) -> t.Self:
+        """Index every backup in local_dest, skipping partial downloads."""
+        with self._lock:
+            self._paths.clear()
+            self._inodes.clear()
+            self._by_age = []
+            self.used_bytes = 0
+
+            if self.local_dest.exists():
+                for f in sort.crawl_files(src_dir=self.local_dest):
+                    if f.name.startswith(".") and f.name.endswith(
+                        ssh_mod.writer.PARTIAL_SUFFIX
+                    ):
+                        continue
+                    try:
+                        self._index(f, f.stat())
+                    except OSError:
+                        continue
+
+        log.info(
+            f"Disk budget: [{len(self._paths)}] backup(s) use {self.used_bytes} of {self.max_bytes} byte(s) in '{self.local_dest}'"
+        )
+
+        return self
+
+    def _evictable_bytes(self) -> int:
+        """Bytes eviction could free: inodes with no protected or reserved path."""
+        pinned: set[tuple[int, int]] = {
+            self._paths[path][1]
+            for path in (*self._protected, *self._reserved)
+            if path in self._paths
+        }
+
+        return sum(inode[0] for key, inode in self._inodes.items() if key not in pinned)
+
+    def _evict_until(self, needed: int) -> None:
+        """Delete the oldest unprotected backups until needed bytes fit. Holds the lock."""
+        skipped: list[tuple[float, str]] = []
+
+        while self.max_bytes - self.used_bytes - self.reserved_bytes < needed and self._by_age:
+            age, path_str = heapq.heappop(self._by_age)
+            path: Path = Path(path_str)
+            entry = self._paths.get(path)
+            if entry is None or entry[0] != age:
+                ## Stale: evicted, or re-indexed with another age
+                continue
+            if path in self._protected or path in self._reserved:
+                skipped.append((age, path_str))
+                continue
+
+            size: int = self._inodes[entry[1]][0]
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as exc:
+                log.warning(f"Disk budget could not evict '{path}'. Details: {exc}")
+                skipped.append((age, path_str))
+                continue
+
+            before: int = self.used_bytes
+            self._unindex(path)
+            self.evicted.append(path)
+            self.evicted_bytes += before - self.used_bytes
+            log.info(
+                f"Disk budget: evicted '{path}' ({size} byte(s), {before - self.used_bytes} freed)"
+            )
+
+        for item in skipped:
+            heapq.heappush(self._by_age, item)
+
+    def enforce(self) -> None:
+        """Evict the oldest backups until local_dest is within the budget."""
+        with self._lock:
+            self._evict_until(0)
+
+    def reserve(self, job: ssh_mod.transfer.TransferJob = None) -> None:
+        """Make room for a download before it starts, evicting the oldest backups.
+
+        Raises:
+            (OSError): If the download would not fit even after evicting every backup that
+                is not protected. Nothing is evicted in that case.
+
+        """
+        with self._lock:
+            self._reserved.pop(job.local_path, None)
+
+            if self.free_bytes < job.size:
+                ## Do not evict anything for a download that would not fit anyway
+                if self.free_bytes + self._evictable_bytes() < job.size:
+                    raise OSError(
+                        errno.ENOSPC,
+                        f"Disk budget of {self.max_bytes} byte(s) exceeded: '{job.remote_path}' needs {job.size} byte(s), {max(self.free_bytes, 0)} free & {self._evictable_bytes()} evictable",
+                    )
+
+                self._evict_until(job.size)
+                if self.free_bytes < job.size:
+                    raise OSError(
+                        errno.ENOSPC,
+                        f"Disk budget of {self.max_bytes} byte(s) exceeded: could not evict enough backups for '{job.remote_path}' ({job.size} byte(s))",
+                    )
+
+            self._reserved[job.local_path] = job.size
+
+    def release(self, job: ssh_mod.transfer.TransferJob = None) -> None:
+        """Return a failed download's reservation to the budget."""
+        with self._lock:
+            self._reserved.pop(job.local_path, None)
+
+    def commit(self, paths: list[Path] = None) -> None:
+        """Index committed downloads, protecting them from eviction for the rest of the run."""
+        with self._lock:
+            for path in paths:
+                path = Path(path)
+                self._reserved.pop(path, None)
+                self._protected.add(path)
+                try:
+                    self._index(path, path.stat())
+                except OSError:
+                    self._unindex(path)
+
+    def replace(
+        self, src: t.Union[str, Path] = None, dest: t.Union[str, Path] = None
+    ) -> None:
+        """Re-index a backup that was rewritten to a new path, i.e. recompressed.
+
+        Description:
+            src's bytes are returned to the budget & dest is indexed at its size on disk.
+            If src was committed this run, dest is protected in its place.
+        """
+        src, dest = Path(src), Path(dest)
+
+        with self._lock:
+            self._unindex(src)
+            if src in self._protected:
+                self._protected.discard(src)
+                self._protected.add(dest)
+
+            try:
+                self._index(dest, dest.stat())
+            except OSError:
+                self._unindex(dest)
+
+    def __repr__(self) -> str:
+        return f"DiskBudget(local_dest='{self.local_dest}', max_bytes={self.max_bytes}, used_bytes={self.used_bytes}, reserved_bytes={self.reserved_bytes}, evicted={len(self.evicted)})"
+
+
+class CleanupScan:
+    """Index of local backups built by a background thread, see `start_local_cleanup()`.
+
+    Params:
+        local_dest (Path): Directory being scanned.
+        threshold (int): Number of newest backups retention keeps.
+    """
+
+    def __init__(self, local_dest: Path = None, threshold: int = 10):
+        self.local_dest: Path = local_dest
+        self.threshold: int = threshold
+
+        ## Path -> File, filled in by the scan thread
+        self.files: dict[Path, File] = {}
+        ## Exception that stopped the scan, re-raised when retention is applied
+        self.error: Exception | None = None
+        self.scan_seconds: float | None = None
+        self.thread: threading.Thread | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.thread is not None and not self.thread.is_alive()
+
+    def __repr__(self) -> str:
+        return f"CleanupScan(local_dest='{self.local_dest}', files={len(self.files)}, done={self.done})"
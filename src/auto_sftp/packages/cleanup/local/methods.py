@@ -1,14 +1,17 @@
+import threading
+import time
 import typing as t
 from pathlib import Path
 
-from core import settings, ssh_settings
+from core import get_ssh_settings
 from core import helpers
 
 from loguru import logger as log
+from modules import sort, ssh_mod
 from red_utils.std import path_utils
 import pendulum
 
-from .classes import File
+from .classes import CleanupScan, DiskBudget, File, _logical_age
 
 
 def list_files(path: t.Union[str, Path] = None):
@@ -81,60 +84,89 @@ def extract_file_ext(path: Path = None) -> str:
         return ""
 
 
+def _get_file_dict(f: Path = None) -> dict:
+    f_stat = f.stat()
+
+    return {
+        "name": f.name,
+        "path": f,
+        "ext": extract_file_ext(f),
+        "parent": f.parent,
+        "created_at": pendulum.from_timestamp(f_stat.st_ctime),
+        "modified_at": pendulum.from_timestamp(f_stat.st_mtime),
+        "size_in_bytes": f_stat.st_size,
+    }
+
+
 def get_file_dicts(files: list[Path] = None) -> list[dict]:
     assert files, ValueError("No files found during scan, skipping conversion to dicts")
     assert isinstance(files, list), TypeError(
         f"files must be a list of Path objects. Got type: ({type(files)})"
     )
 
-    _dicts: list[Path] = []
+    _dicts: list[dict] = []
     dirs: list[Path] = []
-    seen_dirs: list[Path] = []
+    seen_dirs: set[Path] = set()
+    seen_files: set[Path] = set()
 
     for f in files:
+        if f.name.startswith(".") and f.name.endswith(ssh_mod.writer.PARTIAL_SUFFIX):
+            ## Download in progress, or left by an interrupted run
+            continue
+
         if f.is_dir():
             if not f in seen_dirs:
-                log.warning(f"Path '{f}' is a dir and will be scanned at the end.")
+                log.debug("Path '{}' is a dir and will be scanned at the end.", f)
                 dirs.append(f)
-                seen_dirs.append(f)
+                seen_dirs.add(f)
 
-                continue
+            continue
 
         else:
-            f_dict: dict = {
-                "name": f.name,
-                "path": f,
-                "ext": extract_file_ext(f),
-                "parent": f.parent,
-                "created_at": pendulum.from_timestamp(f.stat().st_ctime),
-                "modified_at": pendulum.from_timestamp(f.stat().st_mtime),
-                "size_in_bytes": f.stat().st_size,
-            }
-
-            # log.debug(f"File dict: {f_dict}")
-            if f not in _dicts:
-                _dicts.append(f_dict)
-            else:
+            if f in seen_files:
                 continue
 
+            _dicts.append(_get_file_dict(f))
+            seen_files.add(f)
+
     if dirs:
-        raise NotImplementedError(
-            "Recursively scanning direcetories not yet supported."
-        )
+        ## Date-partitioned backups live in year/month/day subdirectories
         log.info(f"Scanning [{len(dirs)}] dir(s)")
         for d in dirs:
-            _files = ...
+            for f in sort.crawl_files(src_dir=d):
+                if f in seen_files or f.name.endswith(ssh_mod.writer.PARTIAL_SUFFIX):
+                    continue
+
+                _dicts.append(_get_file_dict(f))
+                seen_files.add(f)
 
     return _dicts
 
 
+def _file_age_key(f: File = None) -> float:
+    """Sort key for a file's logical age.
+
+    Description:
+        Uses the timestamp in the filename when there is one, otherwise the file's mtime.
+        A file's ctime is not used, because hardlinking deduplicated backups updates the
+        ctime of every path sharing the data.
+    """
+    return _logical_age(f.name, f.modified_at.timestamp())
+
+
 def delete_oldest(files: list[File] = None, threshold: int = 3):
+    """Delete the oldest files, keeping the newest `threshold` files.
+
+    Files are counted logically: a deduplicated backup hardlinked to another path still
+    counts as its own file, and deleting it only removes that path. Shared data is freed
+    once the last path linked to it is deleted.
+    """
     assert files, ValueError("Missing list of files")
     assert isinstance(files, list), TypeError(
         f"files must be a list of File objects. Got type: ({type(files)})"
     )
 
-    sorted_files: list[File] = sorted(files, key=lambda x: x.path.stat().st_ctime)
+    sorted_files: list[File] = sorted(files, key=_file_age_key)
     delete_count: list[File] = max(0, len(sorted_files) - threshold)
     _deleted: list[File] = []
 
@@ -150,10 +182,10 @@ def delete_oldest(files: list[File] = None, threshold: int = 3):
 
         try:
             log.info(f"Deleting file '{delete_file.path}'.")
-            delete_file.path.unlink()
+            delete_file.path.unlink(missing_ok=True)
             log.success(f"File deleted")
 
-            _deleted.append(f)
+            _deleted.append(delete_file)
         except Exception as exc:
             msg = Exception(
                 f"Unhandled exception deleting file '{delete_file}'. Details: {exc}"
@@ -167,11 +199,18 @@ def delete_oldest(files: list[File] = None, threshold: int = 3):
 
 
 def run_local_cleanup(
-    local_dest: t.Union[str, Path] = Path(
-        f"{ssh_settings.local_dest}{ssh_settings.extra_path_suffix}"
-    ),
+    local_dest: t.Union[str, Path] | None = None,
     threshold: int = 10,
 ) -> list[File]:
+    """Delete all but the newest `threshold` backups in local_dest.
+
+    local_dest defaults to the local destination (& extra path suffix) from the SSH
+    settings loaded from config/ssh/.
+    """
+    if local_dest is None:
+        ssh_settings = get_ssh_settings()
+        local_dest = Path(f"{ssh_settings.local_dest}{ssh_settings.extra_path_suffix}")
+
     assert local_dest, ValueError(f"local_dest cannot be None")
     assert isinstance(local_dest, str) or isinstance(local_dest, Path), TypeError(
         f"local_dest must be a str or Path. Got type: ({type(local_dest)})"
@@ -191,6 +230,22 @@ def run_local_cleanup(
 
     log.info("Running cleanup")
 
+    _files: list[File] = scan_local_backups(local_dest=local_dest)
+
+    # log.info(f"Deleting oldest backups. Threshold: {threshold}")
+    try:
+        _deleted: list[File] = delete_oldest(files=_files, threshold=threshold)
+    except Exception as exc:
+        msg = Exception(f"Unhandled exception deleting oldest file(s). Details: {exc}")
+        log.error(msg)
+
+        raise exc
+
+    return _deleted
+
+
+def scan_local_backups(local_dest: Path = None) -> list[File]:
+    """List the backups in local_dest (recursively), skipping partial downloads."""
     try:
         scanned_files: list[Path] = list_files(path=local_dest)
     except Exception as exc:
@@ -228,13 +283,114 @@ def run_local_cleanup(
 
                 continue
 
-    # log.info(f"Deleting oldest backups. Threshold: {threshold}")
+    return _files
+
+
+def start_local_cleanup(
+    local_dest: t.Union[str, Path] = None, threshold: int = 10
+) -> CleanupScan:
+    """Start scanning local_dest for backups in a background thread.
+
+    Description:
+        Lets the scan (slow on network filesystems) overlap with a backup that is running
+        at the same time. Call `finish_local_cleanup()` once the backup finishes, with
+        the files it downloaded, to apply retention.
+
+    Params:
+        local_dest (str | Path): Directory to clean up.
+        threshold (int): Number of newest backups to keep.
+
+    Returns:
+        (CleanupScan): The scan in progress.
+
+    """
+    assert local_dest, ValueError("local_dest cannot be None")
+    assert threshold and isinstance(threshold, int) and threshold > 0, ValueError(
+        f"threshold must be a non-zero, positive integer. Got type: ({type(threshold)})"
+    )
+
+    scan = CleanupScan(local_dest=Path(f"{local_dest}").expanduser(), threshold=threshold)
+
+    def _scan() -> None:
+        started: float = time.perf_counter()
+        try:
+            if scan.local_dest.exists():
+                for f in scan_local_backups(local_dest=scan.local_dest):
+                    scan.files[Path(f.path)] = f
+        except Exception as exc:
+            scan.error = exc
+        finally:
+            scan.scan_seconds = time.perf_counter() - started
+
+    scan.thread = threading.Thread(target=_scan, name="local-cleanup-scan", daemon=True)
+    scan.thread.start()
+
+    return scan
+
+
+def finish_local_cleanup(
+    scan: CleanupScan = None,
+    new_files: list[Path] | None = None,
+    removed_files: list[Path] | None = None,
+) -> list[File]:
+    """Wait for a scan from `start_local_cleanup()`, then delete the oldest backups.
+
+    Description:
+        Files a backup downloaded or deleted while the scan ran may be missing from (or
+        stale in) the scan. They are merged in from new_files & removed_files, then the
+        newest `threshold` entries are checked on disk before the rest are deleted, so
+        only those need another stat.
+
+    Params:
+        scan (CleanupScan): The scan to finish.
+        new_files (list[Path] | None): Backups downloaded while the scan ran, i.e.
+            `TransferReport.files`.
+        removed_files (list[Path] | None): Backups deleted while the scan ran, i.e.
+            `TransferReport.evicted`.
+
+    Returns:
+        (list[File]): The deleted backups.
+
+    """
+    assert scan, ValueError("Missing a CleanupScan to finish")
+
+    started: float = time.perf_counter()
+    scan.thread.join()
+    log.info(
+        f"Cleanup scan of '{scan.local_dest}' took {scan.scan_seconds:.1f}s, waited {time.perf_counter() - started:.1f}s for it after the backup"
+    )
+    if scan.error is not None:
+        raise scan.error
+
+    files: dict[Path, File] = dict(scan.files)
+    for f in removed_files or []:
+        files.pop(Path(f), None)
+    for f in new_files or []:
+        f = Path(f)
+        try:
+            files[f] = File.model_validate(_get_file_dict(f))
+        except FileNotFoundError:
+            files.pop(f, None)
+
+    ## Newest first, so only the backups that are kept are checked on disk
+    kept: list[File] = []
+    older: list[File] = sorted(files.values(), key=_file_age_key, reverse=True)
+    while older and len(kept) < scan.threshold:
+        f = older.pop(0)
+        if Path(f.path).exists():
+            kept.append(f)
+
+    if not older:
+        log.info(
+            f"[{len(kept)}] backup(s) in '{scan.local_dest}', threshold is [{scan.threshold}]. Nothing to delete."
+        )
+
+        return []
+
     try:
-        _deleted: list[File] = delete_oldest(files=_files, threshold=threshold)
+        return delete_oldest(files=kept + older, threshold=scan.threshold)
     except Exception as exc:
         msg = Exception(f"Unhandled exception deleting oldest file(s). Details: {exc}")
         log.error(msg)
 
         raise exc
-
-    return _deleted
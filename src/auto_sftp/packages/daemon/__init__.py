@@ -0,0 +1,4 @@
+from __future__ import annotations
+
+from .classes import CronSchedule, IntervalSchedule
+from .methods import connect_with_backoff, run_daemon
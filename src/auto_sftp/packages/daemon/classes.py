@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from loguru import logger as log
+import pendulum
+
+## (min, max) of each cron field: minute, hour, day of month, month, day of week
+_CRON_FIELD_RANGES: list[tuple[int, int]] = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+class IntervalSchedule:
+    """Run every `interval` seconds, measured from the start of the previous run."""
+
+    def __init__(self, interval: int = 60):
+        assert isinstance(interval, int) and interval > 0, ValueError(
+            f"interval must be a positive number of seconds. Got: {interval}"
+        )
+
+        self.interval: int = interval
+
+    def __repr__(self) -> str:
+        return f"IntervalSchedule(interval={self.interval})"
+
+    def next_after(self, dt: pendulum.DateTime) -> pendulum.DateTime:
+        return dt.add(seconds=self.interval)
+
+
+class CronSchedule:
+    """Run on a 5-field cron expression (`minute hour day-of-month month day-of-week`).
+
+    Description:
+        Each field supports `*`, values, ranges (`a-b`), lists (`a,b`) & steps (`*/n`, `a-b/n`).
+        Day of week is 0-7, where both 0 & 7 are Sunday. As in cron, when both day of month &
+        day of week are restricted, a day matching either one runs.
+    """
+
+    def __init__(self, expression: str = None):
+        assert expression, ValueError("Missing a cron expression")
+
+        fields: list[str] = expression.split()
+        assert len(fields) == 5, ValueError(
+            f"Cron expression must have 5 fields, got [{len(fields)}]: '{expression}'"
+        )
+
+        self.expression: str = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse_field(field, lo, hi)
+            for field, (lo, hi) in zip(fields, _CRON_FIELD_RANGES)
+        ]
+        self.weekdays: set[int] = {d % 7 for d in weekdays}
+
+        self._days_restricted: bool = fields[2] != "*"
+        self._weekdays_restricted: bool = fields[4] != "*"
+
+    def __repr__(self) -> str:
+        return f"CronSchedule(expression='{self.expression}')"
+
+    @staticmethod
+    def _parse_field(field: str, lo: int, hi: int) -> set[int]:
+        values: set[int] = set()
+
+        for part in field.split(","):
+            step: int = 1
+            if "/" in part:
+                part, _step = part.split("/", 1)
+                step = int(_step)
+                assert step > 0, ValueError(f"Invalid cron step: '{field}'")
+
+            if part == "*":
+                start, end = lo, hi
+            elif "-" in part:
+                start, end = (int(v) for v in part.split("-", 1))
+            else:
+                start = int(part)
+                ## `a/n` means from a to the end of the range
+                end = hi if step > 1 else start
+
+            assert lo <= start <= end <= hi, ValueError(
+                f"Cron field '{field}' out of range [{lo}-{hi}]"
+            )
+            values.update(range(start, end + 1, step))
+
+        return values
+
+    def _day_matches(self, dt: pendulum.DateTime) -> bool:
+        day_ok: bool = dt.day in self.days
+        ## isoweekday(): Monday=1 ... Sunday=7 -> cron's Sunday=0
+        weekday_ok: bool = dt.isoweekday() % 7 in self.weekdays
+
+        if self._days_restricted and self._weekdays_restricted:
+            return day_ok or weekday_ok
+
+        return day_ok and weekday_ok
+
+    def next_after(self, dt: pendulum.DateTime) -> pendulum.DateTime:
+        """Return the first matching minute after dt."""
+        nxt: pendulum.DateTime = dt.start_of("minute").add(minutes=1)
+        ## Bounds the search for expressions that never match, i.e. Feb 30th
+        limit: pendulum.DateTime = nxt.add(years=5)
+
+        while nxt < limit:
+            if nxt.month not in self.months:
+                nxt = nxt.start_of("month").add(months=1)
+            elif not self._day_matches(nxt):
+                nxt = nxt.start_of("day").add(days=1)
+            elif nxt.hour not in self.hours:
+                nxt = nxt.start_of("hour").add(hours=1)
+            elif nxt.minute not in self.minutes:
+                nxt = nxt.add(minutes=1)
+            else:
+                return nxt
+
+        msg = ValueError(f"Cron expression '{self.expression}' never matches")
+        log.error(msg)
+
+        raise msg
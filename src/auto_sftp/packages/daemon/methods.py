@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import signal
+import threading
+import typing as t
+
+from .classes import CronSchedule, IntervalSchedule
+
+from core import SSHSettings
+from loguru import logger as log
+from modules import ssh_mod
+import pendulum
+
+def connect_with_backoff(
+    ssh_manager: ssh_mod.SSHManager = None,
+    stop: threading.Event | None = None,
+    initial_backoff: float = 1.0,
+    max_backoff: float = 300.0,
+) -> bool:
+    """Connect ssh_manager, retrying with exponential backoff until it connects.
+
+    Returns:
+        (bool): `True` once connected, `False` if stop was set before a connection succeeded.
+
+    """
+    assert ssh_manager, ValueError("Missing an SSHManager to connect")
+    stop = stop or threading.Event()
+
+    backoff: float = initial_backoff
+    while not stop.is_set():
+        try:
+            ssh_manager.connect()
+            log.info(f"Connected to {ssh_manager.user}@{ssh_manager.host}:{ssh_manager.port}")
+
+            return True
+        except Exception as exc:
+            log.warning(
+                f"Unable to connect to {ssh_manager.host}, retrying in {backoff:.0f}s. Details: {exc}"
+            )
+
+        stop.wait(backoff)
+        backoff = min(backoff * 2, max_backoff)
+
+    return False
+
+
+def run_daemon(
+    ssh_settings: SSHSettings = None,
+    job: t.Callable[[ssh_mod.SSHManager], None] = None,
+    interval: int | None = None,
+    cron: str | None = None,
+    max_backoff: float = 300.0,
+    stop: threading.Event | None = None,
+) -> None:
+    """Run job on a schedule, reusing one SSH connection between runs.
+
+    Description:
+        The connection is kept open with keepalives (`ssh_settings.keepalive_interval`), so
+        each run skips the startup, settings & handshake cost of a scheduled task. If the
+        connection drops it is reopened with exponential backoff, up to max_backoff seconds
+        between attempts. A failed run is logged & retried on the next scheduled run.
+
+        Runs until SIGINT/SIGTERM, or until stop is set.
+
+    Params:
+        ssh_settings (SSHSettings): Settings for the SSH connection.
+        job (Callable[[SSHManager], None]): Run on each tick with the connected SSHManager.
+        interval (int | None): Seconds between the start of each run.
+        cron (str | None): 5-field cron expression to run on instead of an interval.
+        max_backoff (float): Maximum seconds between reconnect attempts.
+        stop (threading.Event | None): Set to stop the daemon.
+    """
+    assert ssh_settings, ValueError("Missing SSHSettings to connect with")
+    assert job, ValueError("Missing a job to run")
+    assert interval or cron, ValueError("Missing an interval or cron expression")
+
+    schedule = CronSchedule(expression=cron) if cron else IntervalSchedule(interval=interval)
+    stop = stop or threading.Event()
+
+    def _handle_signal(signum, frame) -> None:
+        log.info(f"Received signal {signum}, stopping after the current run")
+        stop.set()
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, _handle_signal)
+        signal.signal(signal.SIGTERM, _handle_signal)
+
+    ssh_manager = ssh_mod.SSHManager(
+        host=ssh_settings.remote_host,
+        port=ssh_settings.remote_port,
+        user=ssh_settings.remote_user,
+        password=ssh_settings.remote_password,
+        ssh_keyfile=ssh_settings.privkey,
+        timeout=5000,
+        keepalive=ssh_settings.keepalive_interval,
+    )
+
+    log.info(f"Starting daemon, schedule: {schedule}")
+    try:
+        while not stop.is_set():
+            if isinstance(schedule, CronSchedule):
+                ## Cron runs on the schedule itself, not immediately at startup
+                next_run: pendulum.DateTime = schedule.next_after(pendulum.now())
+                log.info(f"Next run at {next_run.to_iso8601_string()}")
+                if stop.wait(max((next_run - pendulum.now()).total_seconds(), 0)):
+                    break
+
+            run_started_at: pendulum.DateTime = pendulum.now()
+
+            if not ssh_manager.is_connected:
+                if not connect_with_backoff(
+                    ssh_manager=ssh_manager, stop=stop, max_backoff=max_backoff
+                ):
+                    break
+
+            try:
+                job(ssh_manager)
+            except Exception as exc:
+                msg = Exception(f"Unhandled exception in scheduled run. Details: {exc}")
+                log.error(msg)
+
+                if not ssh_manager.is_connected:
+                    log.warning("SSH connection dropped, reconnecting on the next run")
+                    ssh_manager.close()
+
+            if isinstance(schedule, IntervalSchedule):
+                next_run = schedule.next_after(run_started_at)
+                stop.wait(max((next_run - pendulum.now()).total_seconds(), 0))
+    finally:
+        ssh_manager.close()
+        log.info("Daemon stopped")
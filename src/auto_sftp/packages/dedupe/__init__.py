@@ -0,0 +1,4 @@
+from __future__ import annotations
+
+from .classes import DEFAULT_CONTENT_INDEX_FILE, ContentIndex
+from .methods import dedupe_files, hash_file, link_duplicate
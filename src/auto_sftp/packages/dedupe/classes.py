@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+import typing as t
+
+from core.paths import DATA_DIR
+from loguru import logger as log
+
+DEFAULT_CONTENT_INDEX_FILE: Path = Path(f"{DATA_DIR}/content_index.json")
+
+
+class ContentIndex:
+    """Persisted index of local file contents, used to find byte-identical files.
+
+    Description:
+        Maps content digest -> local paths holding that content, and path -> digest so a
+        path can be dropped when it is deleted. Paths that no longer exist are dropped
+        lazily the next time their digest is looked up.
+
+    Params:
+        index_file (str | Path): JSON file the index is persisted to.
+    """
+
+    def __init__(self, index_file: t.Union[str, Path] = DEFAULT_CONTENT_INDEX_FILE):
+        self.index_file: Path = Path(f"{index_file}")
+
+        self.digests: dict[str, list[str]] = {}
+        self.paths: dict[str, str] = {}
+        self._dirty: bool = False
+
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __contains__(self, path: t.Union[str, Path]) -> bool:
+        return f"{path}" in self.paths
+
+    def _load(self) -> None:
+        if not self.index_file.exists():
+            return
+
+        try:
+            with open(self.index_file, "r") as f:
+                self.digests = json.load(f)
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception reading content index '{self.index_file}'. Starting with an empty index. Details: {exc}"
+            )
+            log.warning(msg)
+
+            self.digests = {}
+
+        self.paths = {
+            path: digest for digest, paths in self.digests.items() for path in paths
+        }
+
+    def lookup(self, digest: str = None) -> Path | None:
+        """Return an existing local path with the given content digest, if any."""
+        for path in list(self.digests.get(digest, [])):
+            if os.path.exists(path):
+                return Path(path)
+
+            self.discard(path)
+
+        return None
+
+    def add(self, path: t.Union[str, Path] = None, digest: str = None) -> None:
+        path: str = f"{path}"
+        if self.paths.get(path) == digest:
+            return
+
+        self.discard(path)
+        self.digests.setdefault(digest, []).append(path)
+        self.paths[path] = digest
+        self._dirty = True
+
+    def discard(self, path: t.Union[str, Path] = None) -> None:
+        path: str = f"{path}"
+        digest: str | None = self.paths.pop(path, None)
+        if digest is None:
+            return
+
+        paths = self.digests.get(digest, [])
+        if path in paths:
+            paths.remove(path)
+        if not paths:
+            self.digests.pop(digest, None)
+
+        self._dirty = True
+
+    def save(self) -> None:
+        """Write the index to disk, if it changed."""
+        if not self._dirty:
+            return
+
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file: Path = self.index_file.with_name(f"{self.index_file.name}.tmp")
+
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump(self.digests, f)
+            os.replace(tmp_file, self.index_file)
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception saving content index '{self.index_file}'. Details: {exc}"
+            )
+            log.error(msg)
+
+            raise exc
+
+        self._dirty = False
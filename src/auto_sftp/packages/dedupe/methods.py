@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+import sys
+import typing as t
+
+from .classes import ContentIndex
+
+from core.helpers import SampledLog
+from loguru import logger as log
+from modules import sort
+
+VALID_LINK_MODES: list[str] = ["hardlink", "reflink"]
+
+## Linux FICLONE ioctl request number, clones src's extents into dest (copy-on-write)
+_FICLONE: int = 0x40049409
+
+
+def hash_file(path: t.Union[str, Path] = None, chunk_size: int = 1024 * 1024) -> str:
+    """Return the hex BLAKE2b digest of a file's contents."""
+    digest = hashlib.blake2b(digest_size=32)
+
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _reflink(src: Path, dest: Path) -> None:
+    if not sys.platform.startswith("linux"):
+        raise OSError(f"Reflinks are not supported on platform '{sys.platform}'")
+
+    import fcntl
+
+    with open(src, "rb") as src_f, open(dest, "wb") as dest_f:
+        fcntl.ioctl(dest_f.fileno(), _FICLONE, src_f.fileno())
+
+
+def link_duplicate(
+    original: Path = None, duplicate: Path = None, link_mode: str = "hardlink"
+) -> str:
+    """Replace duplicate with a link to original's data.
+
+    Description:
+        The link is created under a temporary name next to duplicate, then renamed over it,
+        so duplicate is never missing. With `link_mode="reflink"` a copy-on-write clone is
+        tried first, falling back to a hardlink if the filesystem does not support it.
+
+    Returns:
+        (str): `"reflink"`, `"hardlink"` or `"skipped"` if both paths are already the same file.
+
+    """
+    assert link_mode in VALID_LINK_MODES, ValueError(
+        f"Invalid link_mode: '{link_mode}'. Must be one of {VALID_LINK_MODES}"
+    )
+
+    orig_stat = original.stat()
+    dup_stat = duplicate.stat()
+    if (orig_stat.st_dev, orig_stat.st_ino) == (dup_stat.st_dev, dup_stat.st_ino):
+        return "skipped"
+    if orig_stat.st_dev != dup_stat.st_dev:
+        raise OSError(
+            f"Cannot link '{duplicate}' to '{original}', they are on different filesystems"
+        )
+
+    tmp_path: Path = duplicate.with_name(f".{duplicate.name}.dedupe")
+    tmp_path.unlink(missing_ok=True)
+
+    try:
+        if link_mode == "reflink":
+            try:
+                _reflink(original, tmp_path)
+                os.replace(tmp_path, duplicate)
+
+                return "reflink"
+            except OSError as exc:
+                log.debug(f"Reflink not supported, falling back to hardlink. Details: {exc}")
+                tmp_path.unlink(missing_ok=True)
+
+        os.link(original, tmp_path)
+        os.replace(tmp_path, duplicate)
+    except Exception as exc:
+        tmp_path.unlink(missing_ok=True)
+        raise exc
+
+    return "hardlink"
+
+
+def dedupe_files(
+    files: list[Path] = None,
+    content_index: ContentIndex | None = None,
+    link_mode: str = "hardlink",
+    seed_root: t.Union[str, Path] | None = None,
+) -> dict[str, int]:
+    """Hash files & replace any whose contents are already stored locally with links.
+
+    Params:
+        files (list[Path]): Newly downloaded files to dedupe.
+        content_index (ContentIndex | None): Index of local file contents. Defaults to the
+            index in `.data/`.
+        link_mode (str): `"hardlink"` or `"reflink"`.
+        seed_root (str | Path | None): If the index is empty, hash every file under this
+            path first, so new files can be deduped against existing backups.
+
+    Returns:
+        (dict[str, int]): Counts of `indexed`, `hardlink`, `reflink`, `failed` files &
+            `bytes_saved`.
+
+    """
+    assert files is not None, ValueError("Missing list of files to dedupe")
+    if content_index is None:
+        content_index = ContentIndex()
+
+    results: dict[str, int] = {
+        "indexed": 0,
+        "hardlink": 0,
+        "reflink": 0,
+        "failed": 0,
+        "bytes_saved": 0,
+    }
+    events = SampledLog(name="dedupe.file")
+    new_files: set[Path] = {Path(f) for f in files}
+
+    if seed_root is not None and len(content_index) == 0:
+        seed_files = [
+            f for f in sort.crawl_files(src_dir=seed_root) if f not in new_files
+        ]
+        log.info(f"Seeding content index with [{len(seed_files)}] existing file(s)")
+        for f in seed_files:
+            try:
+                content_index.add(path=f, digest=hash_file(f))
+            except Exception as exc:
+                log.warning(f"Unable to hash file '{f}'. Details: {exc}")
+
+    for f in files:
+        f = Path(f)
+        try:
+            digest: str = hash_file(f)
+            original: Path | None = content_index.lookup(digest=digest)
+
+            if original is None or original == f:
+                content_index.add(path=f, digest=digest)
+                results["indexed"] += 1
+
+                continue
+
+            size: int = f.stat().st_size
+            outcome: str = link_duplicate(
+                original=original, duplicate=f, link_mode=link_mode
+            )
+            content_index.add(path=f, digest=digest)
+
+            if outcome != "skipped":
+                events.event(
+                    "Replaced duplicate '{}' with {} to '{}'",
+                    f,
+                    outcome,
+                    original,
+                    path=f"{f}",
+                    outcome=outcome,
+                )
+                results[outcome] += 1
+                results["bytes_saved"] += size
+
+        except Exception as exc:
+            msg = Exception(f"Unhandled exception deduping file '{f}'. Details: {exc}")
+            log.error(msg)
+
+            results["failed"] += 1
+
+            continue
+
+    try:
+        content_index.save()
+    except Exception as exc:
+        log.warning(f"Unable to save content index. Details: {exc}")
+
+    events.summary(f"Dedupe results: {results}", **results)
+
+    return results
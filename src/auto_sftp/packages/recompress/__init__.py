@@ -0,0 +1,4 @@
+from __future__ import annotations
+
+from .classes import Recompressor
+from .methods import is_recompressible, recompress_file, recompressed_path
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import AbstractContextManager
+from pathlib import Path
+import threading
+import typing as t
+
+from .methods import is_recompressible, recompress_file, zstandard
+
+from core.helpers import SampledLog
+from loguru import logger as log
+
+class Recompressor(AbstractContextManager):
+    """Recompress newly downloaded gzip files as zstd in a pool of worker processes.
+
+    Description:
+        Files are submitted as they are committed, so recompression runs on every core
+        while later files are still downloading. `submit()` blocks while more than
+        max_in_flight_bytes of files are queued or being recompressed, which bounds the
+        extra disk space a run can use & keeps the pool from falling far behind.
+
+        Files linked to other paths (i.e. deduplicated backups) are skipped, because
+        replacing them would un-share their data. Use `resolve()` to map a submitted path
+        to where its data lives now.
+
+    Params:
+        level (int): zstd compression level.
+        max_workers (int | None): Worker processes. Defaults to the number of CPUs.
+        max_in_flight_bytes (int): Most bytes of source files queued or in progress at once.
+        on_replaced (Callable[[Path, Path], None] | None): Called with `(src, dest)` once a
+            file has been recompressed & the gzip file removed, i.e. to update a
+            `DiskBudget`. Runs on the pool's callback thread.
+    """
+
+    def __init__(
+        self,
+        level: int = 10,
+        max_workers: int | None = None,
+        max_in_flight_bytes: int = 2 * 1024 * 1024 * 1024,
+        on_replaced: t.Callable[[Path, Path], None] | None = None,
+    ):
+        if zstandard is None:
+            raise ImportError(
+                "Recompressing files requires the 'zstandard' package. Install it with: pip install zstandard"
+            )
+
+        self.level: int = level
+        self.max_in_flight_bytes: int = max_in_flight_bytes
+        self.on_replaced: t.Callable[[Path, Path], None] | None = on_replaced
+
+        ## Source path -> recompressed path
+        self.recompressed: dict[Path, Path] = {}
+        self.failed: dict[Path, Exception] = {}
+        self.bytes_saved: int = 0
+
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        self._cond = threading.Condition()
+        self._in_flight_bytes: int = 0
+        self._futures: list[Future] = []
+        self._events = SampledLog(name="recompress.file")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+        return None
+
+    def submit(self, paths: t.Iterable[t.Union[str, Path]] = None) -> None:
+        """Queue files for recompression. Files that are not gzip are ignored."""
+        for path in paths:
+            path: Path = Path(f"{path}")
+            if not is_recompressible(path):
+                continue
+
+            path_stat = path.stat()
+            if path_stat.st_nlink > 1:
+                log.debug("Not recompressing '{}', it is linked to other paths", path)
+                continue
+
+            size: int = path_stat.st_size
+            with self._cond:
+                ## A single file larger than the limit still runs, once nothing else is queued
+                self._cond.wait_for(
+                    lambda: self._in_flight_bytes == 0
+                    or self._in_flight_bytes + size <= self.max_in_flight_bytes
+                )
+                self._in_flight_bytes += size
+
+            future: Future = self._executor.submit(recompress_file, path, self.level)
+            future.add_done_callback(
+                lambda f, path=path, size=size: self._on_done(f, path, size)
+            )
+            self._futures.append(future)
+
+    def _on_done(self, future: Future, path: Path, size: int) -> None:
+        with self._cond:
+            self._in_flight_bytes -= size
+            self._cond.notify_all()
+
+            try:
+                _, dest, src_size, dest_size = future.result()
+            except Exception as exc:
+                log.warning(f"Unable to recompress '{path}'. Details: {exc}")
+                self.failed[path] = exc
+
+                return
+
+            self.recompressed[path] = Path(dest)
+            self.bytes_saved += src_size - dest_size
+
+        if self.on_replaced is not None:
+            try:
+                self.on_replaced(path, Path(dest))
+            except Exception as exc:
+                log.warning(
+                    f"Error handling recompressed file '{path}' -> '{dest}'. Details: {exc}"
+                )
+
+        self._events.event(
+            "Recompressed '{}' -> '{}' ({} -> {} bytes)",
+            path,
+            dest,
+            src_size,
+            dest_size,
+            path=f"{path}",
+            bytes_saved=src_size - dest_size,
+        )
+
+    def resolve(self, path: t.Union[str, Path] = None) -> Path:
+        """Return where path's data is stored now, after any recompression."""
+        path: Path = Path(f"{path}")
+
+        return self.recompressed.get(path, path)
+
+    def close(self) -> None:
+        """Wait for queued files to finish recompressing & stop the worker processes."""
+        self._executor.shutdown(wait=True)
+
+        if self._futures:
+            self._events.summary(
+                f"Recompressed [{len(self.recompressed)}] file(s), saved {self.bytes_saved} byte(s) ({len(self.failed)} failed)",
+                recompressed=len(self.recompressed),
+                failed=len(self.failed),
+                bytes_saved=self.bytes_saved,
+            )
+        self._futures = []
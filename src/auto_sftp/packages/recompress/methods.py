@@ -0,0 +1,107 @@
+"""Recompress gzip files as zstd.
+
+`recompress_file()` runs in worker processes. It writes to a temporary name with the
+writer's `PARTIAL_SUFFIX`, so partial output is ignored by cleanup & removed by the next run.
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+from pathlib import Path
+import typing as t
+
+from modules.ssh_mod.writer import PARTIAL_SUFFIX
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def is_recompressible(path: t.Union[str, Path] = None) -> bool:
+    name: str = Path(f"{path}").name
+
+    return name.endswith(".gz") or name.endswith(".tgz")
+
+
+def recompressed_path(path: t.Union[str, Path] = None) -> Path:
+    """Return the path a gzip file is stored at once recompressed.
+
+    i.e. `backup.tar.gz` -> `backup.tar.zst`, `backup.tgz` -> `backup.tar.zst`
+    """
+    path: Path = Path(f"{path}")
+
+    if path.name.endswith(".tgz"):
+        return path.with_name(f"{path.name[: -len('.tgz')]}.tar.zst")
+
+    return path.with_name(f"{path.name[: -len('.gz')]}.zst")
+
+
+def _fsync_dir(path: Path) -> None:
+    ## Directories cannot be opened on Windows, where renames are durable once they return
+    if os.name == "nt":
+        return
+
+    fd: int = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def recompress_file(
+    src: t.Union[str, Path] = None,
+    level: int = 10,
+    threads: int = 0,
+    chunk_size: int = 1024 * 1024,
+) -> tuple[str, str, int, int]:
+    """Recompress a gzip file as zstd, replacing it.
+
+    Description:
+        The zstd file is written under a temporary name, flushed to disk & renamed into
+        place before the gzip file is removed, so a crash never loses the data. The original
+        file's timestamps are kept.
+
+    Params:
+        src (str | Path): gzip file to recompress.
+        level (int): zstd compression level.
+        threads (int): zstd worker threads per file. 0 compresses on the calling thread.
+        chunk_size (int): Bytes decompressed & compressed at a time.
+
+    Returns:
+        (tuple[str, str, int, int]): Source path, recompressed path, source size &
+            recompressed size.
+
+    """
+    if zstandard is None:
+        raise ImportError(
+            "Recompressing files requires the 'zstandard' package. Install it with: pip install zstandard"
+        )
+
+    src: Path = Path(f"{src}")
+    dest: Path = recompressed_path(src)
+    tmp_path: Path = dest.with_name(f".{dest.name}{PARTIAL_SUFFIX}")
+
+    src_stat = os.stat(src)
+    compressor = zstandard.ZstdCompressor(level=level, threads=threads)
+
+    try:
+        with gzip.open(src, "rb") as src_f, open(tmp_path, "wb") as dest_f:
+            with compressor.stream_writer(dest_f, closefd=False) as writer:
+                while chunk := src_f.read(chunk_size):
+                    writer.write(chunk)
+
+            dest_f.flush()
+            os.fsync(dest_f.fileno())
+
+        os.utime(tmp_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+        os.replace(tmp_path, dest)
+        _fsync_dir(dest.parent)
+    except BaseException as exc:
+        tmp_path.unlink(missing_ok=True)
+        raise exc
+
+    src.unlink()
+
+    return f"{src}", f"{dest}", src_stat.st_size, dest.stat().st_size
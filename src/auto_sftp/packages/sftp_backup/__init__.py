@@ -1,4 +1,5 @@
 from __future__ import annotations
 
-from .methods import run_sftp_backup
+from .classes import TransferPlan, TransferReport
+from .methods import plan_sftp_backup, run_sftp_backup
 from . import helpers
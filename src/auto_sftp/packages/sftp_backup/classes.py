@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+from pathlib import Path
+import typing as t
+
+from modules import ssh_mod
+import pendulum
+
+def _fmt_bytes(nbytes: float) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+        if abs(nbytes) < 1024 or unit == "TiB":
+            return f"{nbytes:.1f} {unit}" if unit != "B" else f"{int(nbytes)} B"
+        nbytes /= 1024
+
+
+def _fmt_seconds(seconds: float) -> str:
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return f"{hours}h{minutes:02d}m{secs:02d}s" if hours else f"{minutes}m{secs:02d}s"
+
+
+class TransferPlan:
+    """Result of a dry run: the files a backup would download, their size & an ETA.
+
+    Params:
+        partitions (list[str]): Remote partition directories that were checked.
+        jobs (list[TransferJob]): Files that would be downloaded.
+        throughput (float | None): Recently measured throughput (bytes/second), if any.
+        deferred (dict[str, str]): Remote files still being written, with the reason.
+    """
+
+    def __init__(
+        self,
+        partitions: list[str] = None,
+        jobs: list[ssh_mod.transfer.TransferJob] = None,
+        throughput: float | None = None,
+        deferred: dict[str, str] = None,
+    ):
+        self.partitions: list[str] = partitions or []
+        self.jobs: list[ssh_mod.transfer.TransferJob] = jobs or []
+        self.throughput: float | None = throughput
+        self.deferred: dict[str, str] = deferred or {}
+
+    @property
+    def file_count(self) -> int:
+        return len(self.jobs)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(job.size for job in self.jobs)
+
+    @property
+    def eta_seconds(self) -> float | None:
+        """Estimated transfer time, or `None` if no throughput has been measured yet."""
+        if not self.throughput:
+            return None
+
+        return self.total_bytes / self.throughput
+
+    def largest(self, n: int = 10) -> list[ssh_mod.transfer.TransferJob]:
+        return sorted(self.jobs, key=lambda job: job.size, reverse=True)[:n]
+
+    def summary(self, top: int = 10) -> str:
+        """Human-readable report of the plan."""
+        lines: list[str] = [
+            f"Checked [{len(self.partitions)}] partition(s). [{self.file_count}] file(s) to download, {_fmt_bytes(self.total_bytes)} total."
+        ]
+
+        if self.eta_seconds is None:
+            lines.append("ETA: unknown (no throughput measured by a previous run yet)")
+        else:
+            lines.append(
+                f"ETA: {_fmt_seconds(self.eta_seconds)} at {_fmt_bytes(self.throughput)}/s (recent runs)"
+            )
+
+        if self.jobs:
+            lines.append("Largest file(s):")
+            for job in self.largest(n=top):
+                lines.append(f"  {_fmt_bytes(job.size):>12}  {job.remote_path}")
+
+        if self.deferred:
+            lines.append(
+                f"Deferred [{len(self.deferred)}] file(s) still being written on the remote:"
+            )
+            for remote_path, reason in list(self.deferred.items())[:top]:
+                lines.append(f"  {remote_path} ({reason})")
+
+        return "\n".join(lines)
+
+    def __repr__(self) -> str:
+        return f"TransferPlan(file_count={self.file_count}, total_bytes={self.total_bytes}, eta_seconds={self.eta_seconds})"
+
+
+class TransferReport:
+    """Result of a backup run: what was downloaded, how long it took & what went wrong.
+
+    Params:
+        remote_dir (str): Remote directory that was backed up.
+        local_backup_path (str | Path): Local directory it was backed up to.
+        started_at (pendulum.DateTime | None): When the run started.
+    """
+
+    def __init__(
+        self,
+        remote_dir: str = None,
+        local_backup_path: t.Union[str, Path] = None,
+        started_at: pendulum.DateTime | None = None,
+    ):
+        self.remote_dir: str = remote_dir
+        self.local_backup_path: Path | None = (
+            Path(f"{local_backup_path}") if local_backup_path else None
+        )
+        self.started_at: pendulum.DateTime | None = started_at
+        self.finished_at: pendulum.DateTime | None = None
+
+        self.partitions: list[str] = []
+        ## Local paths of the files downloaded (or delta updated) by this run
+        self.files: list[Path] = []
+        self.bytes_transferred: int = 0
+        self.handshake_seconds: float = 0.0
+        ## Remote path -> error, for files that failed every retry
+        self.failed: dict[str, str] = {}
+        ## Remote path -> reason, for files left for the next run because the remote was
+        #  still writing them
+        self.deferred: dict[str, str] = {}
+        ## Local backups deleted to keep within the disk budget
+        self.evicted: list[Path] = []
+        ## Error that stopped the run, if any
+        self.error: str | None = None
+        self.resumed: bool = False
+        self.watermark_advanced: bool = False
+
+    @property
+    def duration(self) -> float | None:
+        """Seconds the run took, or `None` if it has not finished."""
+        if self.started_at is None or self.finished_at is None:
+            return None
+
+        return (self.finished_at - self.started_at).total_seconds()
+
+    @property
+    def ok(self) -> bool:
+        """`True` if the run finished & every file was downloaded."""
+        return self.error is None and not self.failed
+
+    def to_dict(self) -> dict[str, t.Any]:
+        """JSON-serializable representation of the report."""
+        return {
+            "remote_dir": self.remote_dir,
+            "local_backup_path": (
+                f"{self.local_backup_path}" if self.local_backup_path else None
+            ),
+            "started_at": self.started_at.to_iso8601_string() if self.started_at else None,
+            "finished_at": (
+                self.finished_at.to_iso8601_string() if self.finished_at else None
+            ),
+            "duration": self.duration,
+            "partitions": self.partitions,
+            "files": [f"{f}" for f in self.files],
+            "bytes_transferred": self.bytes_transferred,
+            "handshake_seconds": self.handshake_seconds,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "evicted": [f"{f}" for f in self.evicted],
+            "error": self.error,
+            "resumed": self.resumed,
+            "watermark_advanced": self.watermark_advanced,
+            "ok": self.ok,
+        }
+
+    def __repr__(self) -> str:
+        duration: str = _fmt_seconds(self.duration) if self.duration is not None else "?"
+
+        return f"TransferReport(remote_dir='{self.remote_dir}', files={len(self.files)}, bytes={self.bytes_transferred}, duration={duration}, failed={len(self.failed)}, deferred={len(self.deferred)}, ok={self.ok})"
@@ -1 +1 @@
-from . import _str
+from . import _str, watermark
@@ -1 +1 @@
-from .methods import get_year_month_str
+from .methods import get_year_month_str, get_year_month_strs
@@ -8,3 +8,27 @@ def get_year_month_str() -> str:
     _month: str = f"{_month:02d}"
 
     return f"{_year}/{_month}"
+
+
+def get_year_month_strs(
+    since: pendulum.DateTime = None, until: pendulum.DateTime | None = None
+) -> list[str]:
+    """Return `YYYY/MM` strings for every month from since to until, inclusive.
+
+    Params:
+        since (pendulum.DateTime): First month to include.
+        until (pendulum.DateTime | None): Last month to include. Defaults to now.
+    """
+    assert since, ValueError("Missing a start date")
+    if until is None:
+        until = pendulum.now()
+
+    _month = pendulum.datetime(since.year, since.month, 1)
+    _last = pendulum.datetime(until.year, until.month, 1)
+
+    y_m_strs: list[str] = []
+    while _month <= _last:
+        y_m_strs.append(f"{_month.year}/{_month.month:02d}")
+        _month = _month.add(months=1)
+
+    return y_m_strs
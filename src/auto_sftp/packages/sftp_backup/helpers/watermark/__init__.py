@@ -0,0 +1,3 @@
+from __future__ import annotations
+
+from .methods import DEFAULT_WATERMARK_FILE, load_watermark, save_watermark
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+import typing as t
+
+from core.paths import DATA_DIR
+from loguru import logger as log
+import pendulum
+
+DEFAULT_WATERMARK_FILE: Path = Path(f"{DATA_DIR}/sync_watermark.json")
+
+
+def _read_watermarks(watermark_file: t.Union[str, Path]) -> dict[str, str]:
+    watermark_file: Path = Path(f"{watermark_file}")
+    if not watermark_file.exists():
+        return {}
+
+    try:
+        with open(watermark_file, "r") as f:
+            return json.load(f)
+    except Exception as exc:
+        msg = Exception(
+            f"Unhandled exception reading watermark file '{watermark_file}'. Ignoring saved watermarks. Details: {exc}"
+        )
+        log.warning(msg)
+
+        return {}
+
+
+def load_watermark(
+    remote_dir: str = None,
+    watermark_file: t.Union[str, Path] = DEFAULT_WATERMARK_FILE,
+) -> pendulum.DateTime | None:
+    """Load the "last synced" watermark for a remote directory.
+
+    Returns `None` if remote_dir has never been synced successfully.
+    """
+    assert remote_dir, ValueError("Missing remote directory to load watermark for")
+
+    watermark: str | None = _read_watermarks(watermark_file).get(remote_dir)
+    if watermark is None:
+        return None
+
+    return pendulum.parse(watermark)
+
+
+def save_watermark(
+    remote_dir: str = None,
+    synced_at: pendulum.DateTime = None,
+    watermark_file: t.Union[str, Path] = DEFAULT_WATERMARK_FILE,
+) -> None:
+    """Persist the "last synced" watermark for a remote directory.
+
+    The file is written to a temporary name & renamed into place, so a crash can't leave a
+    truncated watermark file behind.
+    """
+    assert remote_dir, ValueError("Missing remote directory to save watermark for")
+    assert synced_at, ValueError("Missing watermark timestamp")
+
+    watermark_file: Path = Path(f"{watermark_file}")
+    watermarks: dict[str, str] = _read_watermarks(watermark_file)
+    watermarks[remote_dir] = synced_at.to_iso8601_string()
+
+    watermark_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file: Path = watermark_file.with_name(f"{watermark_file.name}.tmp")
+
+    try:
+        with open(tmp_file, "w") as f:
+            json.dump(watermarks, f, indent=2)
+        os.replace(tmp_file, watermark_file)
+    except Exception as exc:
+        msg = Exception(
+            f"Unhandled exception saving watermark to file '{watermark_file}'. Details: {exc}"
+        )
+        log.error(msg)
+
+        raise exc
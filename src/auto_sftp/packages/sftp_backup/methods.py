@@ -1,20 +1,228 @@
 from __future__ import annotations
 
+from contextlib import nullcontext
 from pathlib import Path
 import typing as t
 
-from core import SSHSettings, ssh_settings
+from core import SSHSettings
 from loguru import logger as log
-from modules import ssh_mod
+from modules import sort, ssh_mod
+from packages import cleanup, dedupe, recompress
+import pendulum
 
-from .helpers import _str
+from .classes import TransferPlan, TransferReport
+from .helpers import _str, watermark
 
 
-def run_sftp_backup(
+def _get_partition_dirs(
+    remote_dir: str,
+    watermark_file: t.Union[str, Path],
+    now: pendulum.DateTime,
+) -> list[str]:
+    """Return the remote year/month partitions to sync, from the last synced watermark."""
+    last_synced: pendulum.DateTime | None = watermark.load_watermark(
+        remote_dir=remote_dir, watermark_file=watermark_file
+    )
+
+    if last_synced is None:
+        y_m_strs: list[str] = [_str.get_year_month_str()]
+    else:
+        ## Catch up on every month partition since the last successful sync
+        y_m_strs: list[str] = _str.get_year_month_strs(since=last_synced, until=now)
+        log.info(
+            f"Last synced {last_synced.to_iso8601_string()}. Checking [{len(y_m_strs)}] month partition(s): {y_m_strs}"
+        )
+
+    return [f"{remote_dir}/{y_m_str}" for y_m_str in y_m_strs]
+
+
+def _state_file(
+    data_dir: t.Union[str, Path] | None, default_file: t.Union[str, Path]
+) -> Path:
+    """Return where a state file (watermark, caches, journal) lives for this run.
+
+    Files live in `core.paths.DATA_DIR` by default. Pass a data_dir per target when running
+    several targets in one process, so they do not share state.
+    """
+    if data_dir is None:
+        return Path(f"{default_file}")
+
+    return Path(f"{data_dir}").expanduser() / Path(f"{default_file}").name
+
+
+def _get_listing_cache(
+    ssh_settings: SSHSettings, data_dir: t.Union[str, Path] | None = None
+) -> ssh_mod.RemoteListingCache | None:
+    if not ssh_settings.use_listing_cache:
+        return None
+
+    return ssh_mod.RemoteListingCache(
+        namespace=f"{ssh_settings.remote_user}@{ssh_settings.remote_host}:{ssh_settings.remote_port}",
+        cache_file=_state_file(data_dir, ssh_mod.cache.DEFAULT_LISTING_CACHE_FILE),
+    )
+
+
+def _get_walk_filter(ssh_settings: SSHSettings) -> ssh_mod.WalkFilter:
+    return ssh_mod.WalkFilter(
+        include=ssh_settings.walk_include,
+        exclude=ssh_settings.walk_exclude,
+        min_size=ssh_settings.walk_min_size,
+        max_size=ssh_settings.walk_max_size,
+        min_age=ssh_settings.walk_min_age,
+        max_age=ssh_settings.walk_max_age,
+    )
+
+
+def _get_stability(ssh_settings: SSHSettings) -> ssh_mod.StabilityCheck | None:
+    if not ssh_settings.stable_quiet_period and not ssh_settings.stable_recheck_interval:
+        return None
+
+    return ssh_mod.StabilityCheck(
+        quiet_period=ssh_settings.stable_quiet_period,
+        recheck_interval=ssh_settings.stable_recheck_interval,
+    )
+
+
+def _get_session(
+    ssh_settings: SSHSettings, ssh_manager: ssh_mod.SSHManager | None = None
+) -> t.ContextManager[ssh_mod.SSHManager]:
+    """Reuse ssh_manager's connection if one was passed, otherwise open one for this run."""
+    if ssh_manager is not None:
+        return nullcontext(ssh_manager)
+
+    return ssh_mod.SSHManager(
+        host=ssh_settings.remote_host,
+        port=ssh_settings.remote_port,
+        user=ssh_settings.remote_user,
+        password=ssh_settings.remote_password,
+        ssh_keyfile=ssh_settings.privkey,
+        timeout=5000,
+    )
+
+
+def _is_recompressed(local_item: Path) -> bool:
+    """Whether local_item is already stored recompressed (see `packages.recompress`)."""
+    return (
+        recompress.is_recompressible(local_item)
+        and recompress.recompressed_path(local_item).exists()
+    )
+
+
+def _normalize_local_path(local_backup_path: t.Union[str, Path]) -> Path:
+    assert local_backup_path, ValueError("Missing local backup destination path")
+    assert isinstance(local_backup_path, str) or isinstance(
+        local_backup_path, Path
+    ), TypeError(
+        f"local_backup_path should be a string or Path. Got type: ({type(local_backup_path)})"
+    )
+
+    return Path(f"{local_backup_path}").expanduser()
+
+
+def plan_sftp_backup(
     ssh_settings: SSHSettings = None,
     remote_dir: str = None,
     local_backup_path: t.Union[str, Path] = None,
-):
+    watermark_file: t.Union[str, Path] | None = None,
+    ssh_manager: ssh_mod.SSHManager | None = None,
+    throughput_history: ssh_mod.transfer.ThroughputHistory | None = None,
+    data_dir: t.Union[str, Path] | None = None,
+) -> TransferPlan:
+    """Dry run of `run_sftp_backup()`: report what it would download, without downloading.
+
+    Description:
+        Lists the same partitions a run would (reusing cached listings when
+        `ssh_settings.use_listing_cache` is enabled), applies the same filters & compares
+        the result against local_backup_path. No remote or local file is opened, & the
+        watermark is not changed. The ETA is based on the throughput measured by recent runs.
+        Files the remote is still writing are reported as deferred, like a run would.
+
+        State files are read from data_dir, see `run_sftp_backup()`.
+
+    Returns:
+        (TransferPlan): Files that would be downloaded, their total size & an ETA.
+
+    """
+    assert ssh_settings, ValueError(
+        "Missing SSHSettings object to configure SSH client."
+    )
+    assert remote_dir, ValueError("Missing remote directory to scan")
+    local_backup_path: Path = _normalize_local_path(local_backup_path)
+    if watermark_file is None:
+        watermark_file = _state_file(data_dir, watermark.DEFAULT_WATERMARK_FILE)
+
+    partition_dirs: list[str] = _get_partition_dirs(
+        remote_dir=remote_dir, watermark_file=watermark_file, now=pendulum.now()
+    )
+    if ssh_settings.partition_by_date:
+        path_template = sort.date_partition_template(dest_root=local_backup_path)
+    else:
+        path_template = None
+    listing_cache = _get_listing_cache(ssh_settings, data_dir=data_dir)
+    walk_filter = _get_walk_filter(ssh_settings)
+    if throughput_history is None:
+        throughput_history = ssh_mod.transfer.ThroughputHistory(
+            history_file=_state_file(
+                data_dir, ssh_mod.transfer.DEFAULT_THROUGHPUT_HISTORY_FILE
+            )
+        )
+
+    stability = _get_stability(ssh_settings)
+
+    jobs: list[ssh_mod.transfer.TransferJob] = []
+    deferred: dict[str, str] = {}
+    try:
+        with _get_session(ssh_settings, ssh_manager) as ssh_manager:
+            partition_files: dict[str, list[str]] = ssh_manager.sftp_list_partitions(
+                remote_paths=partition_dirs
+            )
+
+            for partition_dir, files in partition_files.items():
+                if not files:
+                    continue
+
+                jobs += ssh_manager.plan_download(
+                    remote_src=partition_dir,
+                    local_dest=local_backup_path,
+                    path_template=path_template,
+                    listing_cache=listing_cache,
+                    walk_filter=walk_filter,
+                    already_downloaded=(
+                        _is_recompressed if ssh_settings.recompress else None
+                    ),
+                    refresh_truncated=ssh_settings.refresh_truncated,
+                    stability=stability,
+                    on_deferred=deferred.update,
+                )
+    except Exception as exc:
+        msg = Exception(f"Unhandled exception planning SFTP backup. Details: {exc}")
+        log.error(msg)
+
+        raise exc
+    finally:
+        if listing_cache is not None:
+            try:
+                listing_cache.save()
+            except Exception as exc:
+                log.warning(f"Unable to save remote listing cache. Details: {exc}")
+
+    return TransferPlan(
+        partitions=partition_dirs,
+        jobs=jobs,
+        throughput=throughput_history.estimate(),
+        deferred=deferred,
+    )
+
+
+def _run_sftp_backup(
+    ssh_settings: SSHSettings,
+    remote_dir: str,
+    local_backup_path: t.Union[str, Path],
+    watermark_file: t.Union[str, Path],
+    ssh_manager: ssh_mod.SSHManager | None,
+    data_dir: t.Union[str, Path] | None,
+    report: TransferReport,
+) -> TransferReport:
     assert ssh_settings, ValueError(
         "Missing SSHSettings object to configure SSH client."
     )
@@ -27,39 +235,98 @@ def run_sftp_backup(
         f"remote_dir should be a string. Got type: ({type(remote_dir)})"
     )
 
-    assert local_backup_path, ValueError("Missing local backup destination path")
-    assert isinstance(local_backup_path, str) or isinstance(
-        local_backup_path, Path
-    ), TypeError(
-        f"local_backup_path should be a string or Path. Got type: ({type(local_backup_path)})"
+    local_backup_path: Path = _normalize_local_path(local_backup_path)
+    if watermark_file is None:
+        watermark_file = _state_file(data_dir, watermark.DEFAULT_WATERMARK_FILE)
+
+    sync_started_at: pendulum.DateTime = report.started_at
+
+    if ssh_settings.use_run_journal:
+        journal = ssh_mod.transfer.RunJournal(
+            journal_file=_state_file(data_dir, ssh_mod.transfer.DEFAULT_RUN_JOURNAL_FILE),
+            fsync=ssh_settings.durable_commits,
+        )
+        if journal.begin(remote_dir=remote_dir):
+            report.resumed = True
+            ## Files added after the interrupted run started are found by the next run
+            sync_started_at = pendulum.from_timestamp(journal.started_at).in_tz(
+                sync_started_at.timezone
+            )
+    else:
+        journal = None
+
+    partition_dirs: list[str] = _get_partition_dirs(
+        remote_dir=remote_dir, watermark_file=watermark_file, now=sync_started_at
+    )
+    report.partitions = partition_dirs
+    downloaded: list[Path] = []
+
+    if ssh_settings.partition_by_date:
+        path_template = sort.date_partition_template(dest_root=local_backup_path)
+    else:
+        path_template = None
+
+    listing_cache = _get_listing_cache(ssh_settings, data_dir=data_dir)
+    throughput_history = ssh_mod.transfer.ThroughputHistory(
+        history_file=_state_file(data_dir, ssh_mod.transfer.DEFAULT_THROUGHPUT_HISTORY_FILE)
+    )
+
+    ## Shared by every partition, so concurrency learned on one carries over to the next
+    controller = ssh_mod.transfer.AIMDController(
+        min_limit=ssh_settings.transfer_min_workers,
+        max_limit=ssh_settings.transfer_max_workers,
     )
-    if isinstance(local_backup_path, Path):
-        if "~" in f"{local_backup_path}":
-            local_backup_path: Path = local_backup_path.expanduser()
-    if isinstance(local_backup_path, str):
-        if "~" in local_backup_path:
-            local_backup_path: Path = Path(local_backup_path).expanduser()
-        else:
-            local_backup_path: Path = Path(local_backup_path)
 
-    y_m_str = _str.get_year_month_str()
-    remote_dir: str = f"{remote_dir}/{y_m_str}"
+    walk_filter = _get_walk_filter(ssh_settings)
+    stability = _get_stability(ssh_settings)
+
+    if ssh_settings.transfer_protocol == "auto":
+        protocol_selector = ssh_mod.transfer.ProtocolSelector()
+    else:
+        protocol_selector = None
+
+    if ssh_settings.local_backup_max_bytes:
+        disk_budget = cleanup.local.DiskBudget(
+            local_dest=local_backup_path, max_bytes=ssh_settings.local_backup_max_bytes
+        ).scan()
+        disk_budget.enforce()
+    else:
+        disk_budget = None
+
+    if ssh_settings.recompress:
+        recompressor = recompress.Recompressor(
+            level=ssh_settings.recompress_level,
+            max_workers=ssh_settings.recompress_workers or None,
+            max_in_flight_bytes=ssh_settings.recompress_max_in_flight_bytes,
+            ## Recompressed files take less of the budget than the gzip files they replace
+            on_replaced=disk_budget.replace if disk_budget else None,
+        )
+    else:
+        recompressor = None
+
+    def _on_commit(paths: list[Path]) -> None:
+        ## Sizes are read before recompression replaces the files
+        report.bytes_transferred += sum(p.stat().st_size for p in paths)
+        if disk_budget is not None:
+            disk_budget.commit(paths)
+        if recompressor is not None:
+            recompressor.submit(paths)
+
+    handshakes_before: int = (
+        len(ssh_manager.handshake_seconds) if ssh_manager is not None else 0
+    )
+
+    if local_backup_path.exists():
+        ## Files a previous, interrupted run did not finish downloading
+        ssh_mod.writer.remove_partial_files(root=local_backup_path)
 
     try:
-        with ssh_mod.SSHManager(
-            host=ssh_settings.remote_host,
-            port=ssh_settings.remote_port,
-            user=ssh_settings.remote_user,
-            password=ssh_settings.remote_password,
-            ssh_keyfile=ssh_settings.privkey,
-            timeout=5000,
-        ) as ssh_manager:
+        with _get_session(ssh_settings, ssh_manager) as ssh_manager:
 
             try:
-                files: list[str] = ssh_manager.sftp_list_files(remote_path=remote_dir)
-                if not files:
-                    log.warning(f"No files found in remote path '{remote_dir}'")
-                    return
+                partition_files: dict[str, list[str]] = (
+                    ssh_manager.sftp_list_partitions(remote_paths=partition_dirs)
+                )
             except Exception as exc:
                 msg = Exception(
                     f"Unhandled exception getting files from remote. Details: {exc}"
@@ -68,25 +335,226 @@ def run_sftp_backup(
 
                 raise exc
 
-            try:
-                ssh_manager.sftp_download_all(
-                    remote_src=remote_dir,
-                    local_dest=local_backup_path,
-                )
-                # log.success(
-                #     f"Downloaded [{len(files)}] file(s) to path '{local_backup_path}'."
-                # )
+            for partition_dir, files in partition_files.items():
+                if not files:
+                    log.warning(f"No files found in remote path '{partition_dir}'")
+                    continue
 
-            except Exception as exc:
-                msg = Exception(
-                    f"Unhandled exception downloading [{len(files)}] file(s) from remote path '{remote_dir}'. Details: {exc}"
-                )
-                log.error(msg)
+                try:
+                    downloaded += ssh_manager.sftp_download_all(
+                        remote_src=partition_dir,
+                        local_dest=local_backup_path,
+                        path_template=path_template,
+                        listing_cache=listing_cache,
+                        delta_min_size=(
+                            ssh_settings.delta_min_size
+                            if ssh_settings.delta_transfer
+                            else None
+                        ),
+                        delta_block_size=ssh_settings.delta_block_size,
+                        delta_python_bin=ssh_settings.delta_python_bin,
+                        delta_helper_timeout=ssh_settings.delta_helper_timeout,
+                        buffer_size=ssh_settings.download_buffer_size or None,
+                        use_mmap=ssh_settings.download_use_mmap,
+                        preallocate=ssh_settings.download_preallocate,
+                        drop_cache=ssh_settings.download_drop_cache,
+                        durable=ssh_settings.durable_commits,
+                        commit_batch_files=ssh_settings.commit_batch_files,
+                        controller=controller,
+                        transfer_timeout=ssh_settings.transfer_timeout or None,
+                        transfer_order=ssh_settings.transfer_order,
+                        transfer_protocol=ssh_settings.transfer_protocol,
+                        protocol_selector=protocol_selector,
+                        already_downloaded=(
+                            _is_recompressed if recompressor is not None else None
+                        ),
+                        on_commit=_on_commit,
+                        walk_filter=walk_filter,
+                        throughput_history=throughput_history,
+                        transfer_retries=ssh_settings.transfer_retries,
+                        transfer_retry_backoff=ssh_settings.transfer_retry_backoff,
+                        transfer_max_retry_backoff=ssh_settings.transfer_max_retry_backoff,
+                        journal=journal,
+                        refresh_truncated=ssh_settings.refresh_truncated,
+                        stability=stability,
+                        on_deferred=report.deferred.update,
+                        reserve_space=disk_budget.reserve if disk_budget else None,
+                        release_space=disk_budget.release if disk_budget else None,
+                    )
+                    # log.success(
+                    #     f"Downloaded [{len(files)}] file(s) to path '{local_backup_path}'."
+                    # )
 
-                raise exc
+                except Exception as exc:
+                    msg = Exception(
+                        f"Unhandled exception downloading [{len(files)}] file(s) from remote path '{partition_dir}'. Details: {exc}"
+                    )
+                    log.error(msg)
+
+                    raise exc
+
+            handshakes: list[float] = ssh_manager.handshake_seconds[handshakes_before:]
+            report.handshake_seconds = sum(handshakes)
+            if handshakes:
+                log.info(
+                    f"SSH handshake: {report.handshake_seconds:.3f}s over [{len(handshakes)}] connection(s), key loading: {ssh_manager.key_load_seconds:.3f}s"
+                )
 
     except Exception as exc:
         msg = Exception(f"Unhandled exception getting SSHManager. Details: {exc}")
         log.error(msg)
 
         raise exc
+    finally:
+        if journal is not None:
+            journal.close()
+
+        if listing_cache is not None:
+            try:
+                listing_cache.save()
+            except Exception as exc:
+                log.warning(f"Unable to save remote listing cache. Details: {exc}")
+
+        try:
+            throughput_history.save()
+        except Exception as exc:
+            log.warning(f"Unable to save throughput history. Details: {exc}")
+
+        if recompressor is not None:
+            recompressor.close()
+            downloaded = [recompressor.resolve(f) for f in downloaded]
+
+        report.files = downloaded
+        if disk_budget is not None:
+            report.evicted = list(disk_budget.evicted)
+
+    if ssh_settings.dedupe and downloaded:
+        try:
+            dedupe.dedupe_files(
+                files=downloaded,
+                content_index=dedupe.ContentIndex(
+                    index_file=_state_file(data_dir, dedupe.DEFAULT_CONTENT_INDEX_FILE)
+                ),
+                link_mode=ssh_settings.dedupe_link_mode,
+                seed_root=local_backup_path,
+            )
+        except Exception as exc:
+            msg = Exception(f"Unhandled exception deduping downloaded files. Details: {exc}")
+            log.error(msg)
+
+    if journal is not None and journal.failed:
+        report.failed = dict(journal.failed)
+        log.warning(
+            f"[{len(journal.failed)}] file(s) failed to download. They will be retried by the next run, the watermark was not advanced."
+        )
+
+        return report
+
+    if journal is not None:
+        journal.finish()
+        journal.close()
+
+    if report.deferred:
+        ## The next run lists these partitions again & downloads them once finished
+        log.warning(
+            f"[{len(report.deferred)}] file(s) were still being written on the remote & were deferred to the next run, the watermark was not advanced."
+        )
+
+        return report
+
+    ## Only move the watermark forward once every partition synced successfully
+    watermark.save_watermark(
+        remote_dir=remote_dir,
+        synced_at=sync_started_at,
+        watermark_file=watermark_file,
+    )
+    report.watermark_advanced = True
+
+    return report
+
+
+def run_sftp_backup(
+    ssh_settings: SSHSettings = None,
+    remote_dir: str = None,
+    local_backup_path: t.Union[str, Path] = None,
+    watermark_file: t.Union[str, Path] | None = None,
+    ssh_manager: ssh_mod.SSHManager | None = None,
+    data_dir: t.Union[str, Path] | None = None,
+    raise_on_error: bool = True,
+) -> TransferReport:
+    """Download new files from the remote's year/month partitions to local_backup_path.
+
+    Description:
+        Partitions are laid out as `remote_dir/YYYY/MM`. The first run only syncs the current
+        month. After that, every month from the last successful sync up to now is listed
+        (concurrently), so a missed run at a month boundary is caught up on the next run.
+        The "last synced" watermark is only advanced once every partition synced.
+
+        When `ssh_settings.dedupe` is enabled, downloaded files that are byte-identical to an
+        existing local backup are replaced with links to it.
+
+        When `ssh_settings.recompress` is enabled, downloaded gzip files are recompressed as
+        zstd in a process pool while the rest of the run downloads. Files already stored
+        recompressed are not downloaded again.
+
+        Failed downloads are retried `ssh_settings.transfer_retries` times without stopping
+        the other downloads. When `ssh_settings.use_run_journal` is enabled, progress is
+        journaled (see `ssh_mod.transfer.RunJournal`): files that still failed, or were not
+        reached because the run crashed, are downloaded by the next run without walking
+        the remote again, & the watermark is only advanced once nothing is left.
+
+        Files the remote is still writing (see `ssh_mod.StabilityCheck`) are deferred: the
+        watermark is not advanced, so the next run lists their partition again. When
+        `ssh_settings.refresh_truncated` is enabled, local copies whose size differs from
+        the remote file are downloaded again.
+
+        When `ssh_settings.local_backup_max_bytes` is set, the oldest local backups are
+        evicted before each download starts to keep local_backup_path within that many
+        bytes (see `cleanup.local.DiskBudget`). A download that cannot fit fails & is
+        retried by the next run.
+
+        Pass a connected ssh_manager to reuse its connection (i.e. in daemon mode). It is left
+        open when the backup finishes. Otherwise a connection is opened for this run only.
+
+        Only the arguments are used, no settings are loaded from config/, so one process can
+        back up many targets (i.e. a long-lived worker). State (the watermark, listing cache,
+        run journal, throughput history & content index) is kept in `core.paths.DATA_DIR`,
+        unless a data_dir is passed. Give each target its own data_dir.
+
+    Params:
+        watermark_file (str | Path | None): Overrides where the watermark is stored.
+        data_dir (str | Path | None): Directory this target's state files are kept in.
+        raise_on_error (bool): When `False`, an error that stops the run is logged &
+            returned in `TransferReport.error` instead of raised.
+
+    Returns:
+        (TransferReport): Files downloaded during this run, bytes, duration & errors.
+
+    """
+    report = TransferReport(
+        remote_dir=remote_dir,
+        local_backup_path=local_backup_path,
+        started_at=pendulum.now(),
+    )
+
+    try:
+        _run_sftp_backup(
+            ssh_settings=ssh_settings,
+            remote_dir=remote_dir,
+            local_backup_path=local_backup_path,
+            watermark_file=watermark_file,
+            ssh_manager=ssh_manager,
+            data_dir=data_dir,
+            report=report,
+        )
+    except Exception as exc:
+        report.error = f"{exc}"
+
+        if raise_on_error:
+            raise exc
+    finally:
+        report.finished_at = pendulum.now()
+
+    log.info(f"{report}")
+
+    return report
@@ -1,13 +1,197 @@
 from loguru import logger as log
 import typing as t
 from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import errno
+import os
+import shutil
 
 from core.paths import DATA_DIR
-from core import SSHSettings, ssh_settings, AppSettings, settings
+from core import SSHSettings, AppSettings
 
 from modules import sort as _sort
 
+## Bytes copied per read when a move falls back to copying
+COPY_BUFFER_SIZE: int = 1024 * 1024
 
-def sort_local_backups(local_backups_dir: t.Union[str, Path] = None):
-    _sort.sort_into_date_dirs(src_dir=local_backups_dir)
-    raise NotImplementedError("Sorting local backed up files is not fully implemented")
+
+def _group_moves_by_dir(
+    file_sort_meta: list[dict] = None,
+) -> tuple[dict[Path, list[tuple[Path, Path]]], list[tuple[Path, Path]]]:
+    """Group planned moves by destination directory.
+
+    Description:
+        Files already at their destination are dropped from the plan. When several files
+        map to the same destination (i.e. the same filename in different source
+        directories), only the first is moved & the rest are returned as clashes.
+
+    Returns:
+        (tuple[dict[Path, list[tuple[Path, Path]]], list[tuple[Path, Path]]]): Moves per
+            destination directory, & `(src, dest)` moves dropped because of a clash.
+
+    """
+    grouped: dict[Path, list[tuple[Path, Path]]] = {}
+    clashes: list[tuple[Path, Path]] = []
+    ## Destination -> source planned to move there
+    planned: dict[Path, Path] = {}
+
+    for meta in file_sort_meta:
+        src: Path = meta["src_path"] / meta["filename"]
+        dest: Path = meta["dest_path"]
+
+        if src == dest:
+            continue
+
+        if dest in planned:
+            log.warning(
+                f"'{src}' & '{planned[dest]}' both sort to '{dest}'. Skipping '{src}'."
+            )
+            clashes.append((src, dest))
+            continue
+
+        planned[dest] = src
+        grouped.setdefault(dest.parent, []).append((src, dest))
+
+    return grouped, clashes
+
+
+def _ensure_dest_dir(dest_dir: Path = None, created_dirs: set[Path] = None) -> None:
+    """Create dest_dir once, remembering directories that already exist."""
+    if dest_dir in created_dirs:
+        return
+
+    os.makedirs(dest_dir, exist_ok=True)
+    created_dirs.add(dest_dir)
+
+
+def _move_file(src: Path = None, dest: Path = None) -> str:
+    """Move src to dest, returning how the file was moved.
+
+    Description:
+        Hardlinks src to dest, then unlinks src. Creating the link fails if dest exists, so
+        an existing dest is never overwritten, even by a move running at the same time. If
+        src & dest are on different devices (or the filesystem has no hardlinks, i.e. exFAT
+        or some network mounts), dest is created exclusively & src is copied into it, then
+        src is unlinked.
+
+    Returns:
+        (str): One of `"renamed"`, `"copied"` or `"skipped"`.
+
+    """
+    try:
+        os.link(src, dest)
+    except FileExistsError:
+        log.warning(f"Destination '{dest}' already exists. Skipping '{src}'.")
+        return "skipped"
+    except OSError as exc:
+        if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP):
+            raise exc
+    else:
+        src.unlink()
+        return "renamed"
+
+    try:
+        fd: int = os.open(dest, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        log.warning(f"Destination '{dest}' already exists. Skipping '{src}'.")
+        return "skipped"
+
+    try:
+        with open(src, "rb") as src_file, os.fdopen(fd, "wb") as dest_file:
+            shutil.copyfileobj(src_file, dest_file, COPY_BUFFER_SIZE)
+        shutil.copystat(src, dest)
+    except BaseException:
+        ## Never leave a partial copy where the next run would skip it as sorted
+        dest.unlink(missing_ok=True)
+        raise
+
+    src.unlink()
+
+    return "copied"
+
+
+def sort_local_backups(
+    local_backups_dir: t.Union[str, Path] = None,
+    dest_root: t.Union[str, Path] = None,
+    filetype_filters: list[str] | None = [".tar.gz", ".tar.zst"],
+    max_workers: int = 8,
+) -> dict[str, int]:
+    """Sort local backups into year/month/day directories.
+
+    Description:
+        Plans every move with `sort_into_date_dirs()`, groups the moves by destination
+        directory so each directory is created once, then runs the moves in a bounded
+        thread pool.
+
+    Params:
+        local_backups_dir (str | Path): Directory of backups to sort.
+        dest_root (str | Path): Root of the year/month/day tree. Defaults to local_backups_dir.
+        filetype_filters (list[str] | None): File suffixes to sort.
+        max_workers (int): Maximum number of moves to run at once.
+
+    Returns:
+        (dict[str, int]): Count of files per outcome (`renamed`, `copied`, `skipped`, `failed`).
+
+    """
+    assert local_backups_dir, ValueError("Missing local backups directory to sort")
+    assert isinstance(max_workers, int) and max_workers > 0, ValueError(
+        f"max_workers must be a positive integer. Got: {max_workers}"
+    )
+    if dest_root is None:
+        dest_root = local_backups_dir
+
+    file_sort_meta: list[dict] = _sort.sort_into_date_dirs(
+        src_dir=local_backups_dir,
+        filetype_filters=filetype_filters,
+        dest_root=Path(f"{dest_root}").expanduser(),
+    )
+
+    results: dict[str, int] = {"renamed": 0, "copied": 0, "skipped": 0, "failed": 0}
+    if not file_sort_meta:
+        log.warning(f"No files to sort in path '{local_backups_dir}'")
+        return results
+
+    grouped_moves, clashes = _group_moves_by_dir(file_sort_meta=file_sort_meta)
+    results["skipped"] += len(clashes)
+    log.info(
+        f"Sorting [{sum(len(m) for m in grouped_moves.values())}] file(s) into [{len(grouped_moves)}] director(ies)"
+    )
+
+    created_dirs: set[Path] = set()
+    ## Bound queued moves so huge directories don't build a future per file up front
+    max_pending: int = max_workers * 4
+    pending: dict[Future, Path] = {}
+
+    def _collect(done: t.Iterable[Future]) -> None:
+        for fut in done:
+            src = pending.pop(fut)
+            try:
+                results[fut.result()] += 1
+            except Exception as exc:
+                log.error(f"Unhandled exception moving file '{src}'. Details: {exc}")
+                results["failed"] += 1
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for dest_dir, moves in grouped_moves.items():
+            try:
+                _ensure_dest_dir(dest_dir=dest_dir, created_dirs=created_dirs)
+            except Exception as exc:
+                log.error(
+                    f"Unhandled exception creating directory '{dest_dir}'. Skipping [{len(moves)}] file(s). Details: {exc}"
+                )
+                results["failed"] += len(moves)
+
+                continue
+
+            for src, dest in moves:
+                if len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    _collect(done)
+
+                pending[executor.submit(_move_file, src, dest)] = src
+
+        _collect(list(pending))
+
+    log.info(f"Sort results: {results}")
+
+    return results
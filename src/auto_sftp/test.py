@@ -56,6 +56,6 @@ if __name__ == "__main__":
 
     try:
         sort_local.sort_local_backups(local_backups_dir=ssh_settings.local_dest)
-    except NotImplementedError as notimpl:
-        msg = Exception(f"[NotImplemented] {notimpl}")
-        log.warning(msg)
+    except Exception as exc:
+        msg = Exception(f"Unhandled exception sorting local backups. Details: {exc}")
+        log.error(msg)
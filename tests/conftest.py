@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+import typing as t
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "auto_sftp"))
+
+from tests import wan_emulator  # noqa: E402
+
+from modules import ssh_mod  # noqa: E402
+
+WAN_USER: str = "backup"
+WAN_PASSWORD: str = "backup"
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--link-profile",
+        default="wan_50ms",
+        choices=list(wan_emulator.LINK_PROFILES),
+        help="Emulated link the wan_sftp fixture runs over (default: wan_50ms)",
+    )
+
+
+@pytest.fixture
+def link_profile(request: pytest.FixtureRequest) -> wan_emulator.LinkProfile:
+    """Return the link profile to emulate.
+
+    Defaults to `--link-profile`. Override per test with
+    `@pytest.mark.parametrize("link_profile", ["wan_50ms", "wan_200ms"], indirect=True)`,
+    passing profile names or `LinkProfile`s.
+    """
+    profile = getattr(request, "param", None) or request.config.getoption("--link-profile")
+    if isinstance(profile, wan_emulator.LinkProfile):
+        return profile
+
+    return wan_emulator.get_link_profile(profile, seed=0)
+
+
+@pytest.fixture
+def sftp_root(tmp_path: Path) -> Path:
+    """Directory served as the remote's `/` by wan_sftp. Put the remote's files here."""
+    root: Path = tmp_path / "remote"
+    root.mkdir()
+
+    return root
+
+
+@pytest.fixture
+def wan_sftp(
+    sftp_root: Path, link_profile: wan_emulator.LinkProfile
+) -> t.Generator[wan_emulator.EmulatedLink, t.Any, None]:
+    """Serve sftp_root over a local SFTP server reached through the emulated link_profile."""
+    with wan_emulator.emulated_sftp(
+        root=sftp_root, profile=link_profile, username=WAN_USER, password=WAN_PASSWORD
+    ) as link:
+        yield link
+
+
+@pytest.fixture
+def wan_ssh_manager(
+    wan_sftp: wan_emulator.EmulatedLink,
+) -> t.Generator[ssh_mod.SSHManager, t.Any, None]:
+    """Yield an `SSHManager` connected to wan_sftp."""
+    with ssh_mod.SSHManager(
+        host=wan_sftp.host, port=wan_sftp.port, user=WAN_USER, password=WAN_PASSWORD
+    ) as ssh_manager:
+        yield ssh_manager
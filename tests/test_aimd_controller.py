@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+from modules.ssh_mod.transfer import (
+    AIMDController,
+    classes as transfer_classes,
+)
+import pytest
+
+WINDOW: float = 2.0
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    """Replace the controller's monotonic clock with one the test advances."""
+    now: list[float] = [0.0]
+    monkeypatch.setattr(
+        transfer_classes, "time", SimpleNamespace(monotonic=lambda: now[0])
+    )
+
+    return now
+
+
+def _window(
+    controller: AIMDController,
+    clock: list[float],
+    n_bytes: int,
+    saturated: bool = True,
+) -> int:
+    """Transfer n_bytes over one window & return the resulting limit."""
+    controller.add_bytes(n_bytes)
+    clock[0] += WINDOW
+    controller.tick(saturated=saturated)
+
+    return controller.limit
+
+
+def test_limit_grows_while_throughput_rises(clock: list[float]):
+    controller = AIMDController(min_limit=1, max_limit=4, window=WINDOW)
+
+    assert [_window(controller, clock, n) for n in (100, 200, 300, 400, 500)] == [
+        2,
+        3,
+        4,
+        4,
+        4,
+    ]
+
+
+def test_limit_holds_on_flat_throughput(clock: list[float]):
+    controller = AIMDController(min_limit=1, max_limit=8, window=WINDOW)
+    _window(controller, clock, 1000)
+
+    ## Within tolerance of the last window
+    assert _window(controller, clock, 1020) == 2
+    assert _window(controller, clock, 990) == 2
+
+
+def test_limit_halves_when_throughput_falls(clock: list[float]):
+    controller = AIMDController(
+        min_limit=1, max_limit=8, initial_limit=8, window=WINDOW
+    )
+    _window(controller, clock, 1000)
+
+    assert _window(controller, clock, 500) == 4
+    ## The new limit is measured from scratch, so the next window grows it
+    assert _window(controller, clock, 100) == 5
+
+
+def test_limit_never_drops_below_min_limit(clock: list[float]):
+    controller = AIMDController(min_limit=2, max_limit=8, initial_limit=3)
+
+    controller.record_error()
+    controller.record_error()
+
+    assert controller.limit == 2
+
+
+def test_partial_window_does_not_adjust(clock: list[float]):
+    controller = AIMDController(min_limit=1, max_limit=8, window=WINDOW)
+    controller.add_bytes(1000)
+    clock[0] += WINDOW / 2
+    controller.tick()
+
+    assert controller.limit == 1
+
+
+def test_unsaturated_window_is_discarded(clock: list[float]):
+    controller = AIMDController(min_limit=1, max_limit=8, window=WINDOW)
+
+    assert _window(controller, clock, 1000, saturated=False) == 1
+    assert controller._window_bytes == 0
+
+
+@pytest.mark.parametrize(
+    ("kwargs", "limit"),
+    [({}, 1), ({"initial_limit": 5}, 5), ({"initial_limit": 50}, 8)],
+)
+def test_initial_limit_is_clamped(kwargs: dict, limit: int):
+    assert AIMDController(min_limit=1, max_limit=8, **kwargs).limit == limit
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{"min_limit": 0}, {"min_limit": 4, "max_limit": 2}, {"decrease_factor": 1.0}],
+)
+def test_invalid_limits_are_rejected(kwargs: dict):
+    with pytest.raises(AssertionError):
+        AIMDController(**kwargs)
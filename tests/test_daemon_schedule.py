@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from packages.daemon import CronSchedule, IntervalSchedule
+import pendulum
+import pytest
+
+## A Wednesday
+START: pendulum.DateTime = pendulum.datetime(2024, 1, 3, 10, 7, 30)
+
+
+def test_interval_schedule_adds_interval():
+    assert IntervalSchedule(interval=90).next_after(START) == START.add(seconds=90)
+
+
+@pytest.mark.parametrize("interval", [0, -1, 1.5])
+def test_interval_schedule_rejects_invalid_interval(interval):
+    with pytest.raises(AssertionError):
+        IntervalSchedule(interval=interval)
+
+
+@pytest.mark.parametrize(
+    ("expression", "expected"),
+    [
+        ("* * * * *", pendulum.datetime(2024, 1, 3, 10, 8)),
+        ("*/5 * * * *", pendulum.datetime(2024, 1, 3, 10, 10)),
+        ("0 * * * *", pendulum.datetime(2024, 1, 3, 11, 0)),
+        ("30 2 * * *", pendulum.datetime(2024, 1, 4, 2, 30)),
+        ("0 9-17/4 * * *", pendulum.datetime(2024, 1, 3, 13, 0)),
+        ("15,45 10 * * *", pendulum.datetime(2024, 1, 3, 10, 15)),
+        ("0 0 1 * *", pendulum.datetime(2024, 2, 1, 0, 0)),
+        ("0 0 * 3 *", pendulum.datetime(2024, 3, 1, 0, 0)),
+        ("0 0 29 2 *", pendulum.datetime(2024, 2, 29, 0, 0)),
+        ## Sunday, as 0 & as 7
+        ("0 0 * * 0", pendulum.datetime(2024, 1, 7, 0, 0)),
+        ("0 0 * * 7", pendulum.datetime(2024, 1, 7, 0, 0)),
+        ("0 0 * * 1-5", pendulum.datetime(2024, 1, 4, 0, 0)),
+        ## Day of month & day of week both restricted: either one matches
+        ("0 0 10 * 5", pendulum.datetime(2024, 1, 5, 0, 0)),
+    ],
+)
+def test_cron_schedule_next_after(expression: str, expected: pendulum.DateTime):
+    assert CronSchedule(expression=expression).next_after(START) == expected
+
+
+def test_cron_schedule_is_strictly_after():
+    on_the_minute: pendulum.DateTime = pendulum.datetime(2024, 1, 3, 10, 10)
+
+    assert CronSchedule("*/5 * * * *").next_after(on_the_minute) == on_the_minute.add(
+        minutes=5
+    )
+
+
+@pytest.mark.parametrize(
+    "expression",
+    ["", "* * * *", "60 * * * *", "* 24 * * *", "*/0 * * * *", "5-1 * * * *"],
+)
+def test_cron_schedule_rejects_invalid_expression(expression: str):
+    with pytest.raises(AssertionError):
+        CronSchedule(expression=expression)
+
+
+def test_cron_schedule_that_never_matches_raises():
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 30 2 *").next_after(START)
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import random
+
+from modules import ssh_mod
+from modules.ssh_mod.delta import helper
+import pytest
+
+BLOCK_SIZE: int = 4096
+
+
+def _random_bytes(n: int, seed: int) -> bytes:
+    return random.Random(seed).randbytes(n)
+
+
+def _ops(old: bytes, new: bytes, tmp_path: Path, max_changed_fraction: float = 1.0) -> dict:
+    (tmp_path / "old").write_bytes(old)
+    (tmp_path / "new").write_bytes(new)
+
+    return helper.compute_ops(
+        path=f"{tmp_path / 'new'}",
+        block_size=BLOCK_SIZE,
+        signatures=ssh_mod.delta.compute_block_signatures(
+            local_path=tmp_path / "old", block_size=BLOCK_SIZE
+        ),
+        max_changed_fraction=max_changed_fraction,
+    )
+
+
+def _fetched(reply: dict) -> int:
+    return sum(op[2] for op in reply["ops"] if op[0] == "data")
+
+
+def test_compute_ops_appended_file_fetches_only_the_tail(tmp_path: Path):
+    old: bytes = _random_bytes(16 * BLOCK_SIZE, seed=1)
+
+    reply: dict = _ops(old, old + b"tail", tmp_path)
+
+    assert _fetched(reply) == len(b"tail")
+    assert reply["size"] == len(old) + len(b"tail")
+
+
+def test_compute_ops_finds_shifted_blocks(tmp_path: Path):
+    old: bytes = _random_bytes(16 * BLOCK_SIZE, seed=2)
+    new: bytes = old[: 4 * BLOCK_SIZE] + b"inserted" + old[4 * BLOCK_SIZE :]
+
+    reply: dict = _ops(old, new, tmp_path)
+
+    ## The block after the insertion & every block after it are reused
+    assert _fetched(reply) < 2 * BLOCK_SIZE
+
+
+def test_compute_ops_gives_up_when_most_of_the_file_changed(tmp_path: Path):
+    old: bytes = _random_bytes(64 * BLOCK_SIZE, seed=3)
+    new: bytes = _random_bytes(64 * BLOCK_SIZE, seed=4)
+
+    assert _ops(old, new, tmp_path, max_changed_fraction=0.5)["ops"] is None
+    assert _fetched(_ops(old, new, tmp_path)) == len(new)
+
+
+@pytest.mark.parametrize("link_profile", ["localhost"], indirect=True)
+@pytest.mark.parametrize(
+    "make_remote",
+    [
+        pytest.param(
+            lambda old: old[: 8 * BLOCK_SIZE] + b"changed" + old[8 * BLOCK_SIZE + 7 :],
+            id="delta",
+        ),
+        pytest.param(lambda old: _random_bytes(len(old), seed=6), id="full-fallback"),
+    ],
+)
+def test_sftp_download_all_delta_updates_through_commit(
+    wan_ssh_manager: ssh_mod.SSHManager, sftp_root: Path, tmp_path: Path, make_remote
+):
+    old: bytes = _random_bytes(32 * BLOCK_SIZE, seed=5)
+    new: bytes = make_remote(old)
+
+    remote_file: Path = sftp_root / "backups" / "backup_2024-01-01_00-00.tar.gz"
+    remote_file.parent.mkdir()
+    remote_file.write_bytes(new)
+
+    local_file: Path = tmp_path / "local" / remote_file.name
+    local_file.parent.mkdir()
+    local_file.write_bytes(old)
+    ## Older than the remote file, so it is checked for changes
+    os.utime(local_file, (0, 0))
+
+    committed: list[Path] = []
+    downloaded: list[Path] = wan_ssh_manager.sftp_download_all(
+        remote_src="/backups",
+        local_dest=local_file.parent,
+        delta_min_size=1,
+        delta_block_size=BLOCK_SIZE,
+        delta_helper_runner=ssh_mod.delta.local_helper_runner(root=sftp_root),
+        on_commit=committed.extend,
+    )
+
+    assert downloaded == [local_file]
+    assert committed == [local_file]
+    assert local_file.read_bytes() == new
+    assert local_file.stat().st_mtime == int(remote_file.stat().st_mtime)
+    assert [p.name for p in local_file.parent.iterdir()] == [local_file.name]
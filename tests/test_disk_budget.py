@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import errno
+import os
+from pathlib import Path
+
+from modules import ssh_mod
+from packages.cleanup.local import DiskBudget
+import pytest
+
+def _backup(root: Path, day: int, size: int, ext: str = "tar.gz") -> Path:
+    path: Path = root / f"backup_2024-01-{day:02d}_00-00.{ext}"
+    path.write_bytes(b"x" * size)
+
+    return path
+
+
+def _job(root: Path, day: int, size: int) -> ssh_mod.transfer.TransferJob:
+    name: str = f"backup_2024-01-{day:02d}_00-00.tar.gz"
+
+    return ssh_mod.transfer.TransferJob(
+        remote_path=f"/backups/{name}", local_path=root / name, size=size
+    )
+
+
+def test_scan_counts_hardlinks_once(tmp_path: Path):
+    original: Path = _backup(tmp_path, 1, 100)
+    os.link(original, tmp_path / "backup_2024-01-02_00-00.tar.gz")
+    _backup(tmp_path, 3, 50)
+
+    budget = DiskBudget(local_dest=tmp_path, max_bytes=1000).scan()
+
+    assert budget.used_bytes == 150
+
+
+def test_scan_skips_partial_downloads(tmp_path: Path):
+    _backup(tmp_path, 1, 100)
+    (tmp_path / f".backup_2024-01-02_00-00.tar.gz{ssh_mod.writer.PARTIAL_SUFFIX}").write_bytes(
+        b"x" * 500
+    )
+
+    budget = DiskBudget(local_dest=tmp_path, max_bytes=1000).scan()
+
+    assert budget.used_bytes == 100
+
+
+def test_enforce_evicts_oldest_first(tmp_path: Path):
+    oldest: Path = _backup(tmp_path, 1, 100)
+    middle: Path = _backup(tmp_path, 2, 100)
+    newest: Path = _backup(tmp_path, 3, 100)
+
+    budget = DiskBudget(local_dest=tmp_path, max_bytes=250).scan()
+    budget.enforce()
+
+    assert budget.evicted == [oldest]
+    assert not oldest.exists()
+    assert middle.exists() and newest.exists()
+    assert budget.used_bytes == 200
+
+
+def test_reserve_evicts_only_what_it_needs(tmp_path: Path):
+    oldest: Path = _backup(tmp_path, 1, 100)
+    middle: Path = _backup(tmp_path, 2, 100)
+    newest: Path = _backup(tmp_path, 3, 100)
+
+    budget = DiskBudget(local_dest=tmp_path, max_bytes=400).scan()
+    budget.reserve(_job(tmp_path, 4, 150))
+
+    assert budget.evicted == [oldest]
+    assert middle.exists() and newest.exists()
+    assert budget.reserved_bytes == 150
+    assert budget.free_bytes == 50
+
+
+def test_reserve_hardlinked_backup_frees_nothing_until_last_path(tmp_path: Path):
+    first: Path = _backup(tmp_path, 1, 100)
+    second: Path = tmp_path / "backup_2024-01-02_00-00.tar.gz"
+    os.link(first, second)
+    newest: Path = _backup(tmp_path, 3, 100)
+
+    budget = DiskBudget(local_dest=tmp_path, max_bytes=250).scan()
+    budget.reserve(_job(tmp_path, 4, 100))
+
+    ## Both paths must go before the shared inode's 100 bytes are freed
+    assert budget.evicted == [first, second]
+    assert budget.evicted_bytes == 100
+    assert newest.exists()
+
+
+def test_reserve_too_large_evicts_nothing(tmp_path: Path):
+    backups: list[Path] = [_backup(tmp_path, day, 100) for day in (1, 2, 3)]
+
+    budget = DiskBudget(local_dest=tmp_path, max_bytes=300).scan()
+    with pytest.raises(OSError) as exc_info:
+        budget.reserve(_job(tmp_path, 4, 301))
+
+    assert exc_info.value.errno == errno.ENOSPC
+    assert budget.evicted == []
+    assert all(path.exists() for path in backups)
+
+
+def test_release_returns_reservation(tmp_path: Path):
+    budget = DiskBudget(local_dest=tmp_path, max_bytes=300).scan()
+    job = _job(tmp_path, 1, 200)
+
+    budget.reserve(job)
+    assert budget.free_bytes == 100
+
+    budget.release(job)
+    assert budget.free_bytes == 300
+
+
+def test_committed_downloads_are_not_evicted(tmp_path: Path):
+    older: Path = _backup(tmp_path, 1, 100)
+
+    budget = DiskBudget(local_dest=tmp_path, max_bytes=300).scan()
+    job = _job(tmp_path, 2, 100)
+    budget.reserve(job)
+    job.local_path.write_bytes(b"x" * 100)
+    budget.commit([job.local_path])
+
+    assert budget.reserved_bytes == 0
+    assert budget.used_bytes == 200
+
+    ## The committed download is newer, but only older is evictable
+    with pytest.raises(OSError):
+        budget.reserve(_job(tmp_path, 3, 250))
+    budget.reserve(_job(tmp_path, 3, 200))
+
+    assert budget.evicted == [older]
+    assert job.local_path.exists()
+
+
+def test_replace_updates_used_bytes(tmp_path: Path):
+    older: Path = _backup(tmp_path, 1, 100)
+    newer: Path = _backup(tmp_path, 2, 100)
+
+    budget = DiskBudget(local_dest=tmp_path, max_bytes=400).scan()
+    job = _job(tmp_path, 3, 150)
+    budget.reserve(job)
+    job.local_path.write_bytes(b"x" * 150)
+    budget.commit([job.local_path])
+    assert budget.used_bytes == 350
+
+    ## Recompressed: the .gz is replaced by a smaller .zst
+    recompressed: Path = _backup(tmp_path, 3, 20, ext="tar.zst")
+    job.local_path.unlink()
+    budget.replace(job.local_path, recompressed)
+
+    assert budget.used_bytes == 220
+
+    budget.reserve(_job(tmp_path, 4, 250))
+
+    ## Only one old backup needs to go, & the recompressed download is still protected
+    assert budget.evicted == [older]
+    assert newer.exists() and recompressed.exists()
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import time
+
+from modules import ssh_mod
+import pytest
+
+pytestmark = pytest.mark.parametrize("link_profile", ["localhost"], indirect=True)
+
+
+def _append_in_place(path: Path, data: bytes) -> None:
+    """Grow a file without changing its directory's mtime, like an archive being written."""
+    dir_stat = path.parent.stat()
+    with open(path, "ab") as f:
+        f.write(data)
+    os.utime(path.parent, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+
+
+def test_refresh_truncated_ignores_stale_cached_sizes(
+    wan_ssh_manager: ssh_mod.SSHManager, sftp_root: Path, tmp_path: Path
+):
+    remote_file: Path = sftp_root / "backups" / "backup_2024-01-01_00-00.tar.gz"
+    remote_file.parent.mkdir()
+    remote_file.write_bytes(b"x" * 1000)
+    ## Directories modified in the last few seconds are not cached
+    hour_ago: float = time.time() - 3600
+    os.utime(remote_file.parent, (hour_ago, hour_ago))
+
+    local_dest: Path = tmp_path / "local"
+    listing_cache = ssh_mod.RemoteListingCache(
+        namespace="test", cache_file=tmp_path / "listing_cache.json"
+    )
+
+    wan_ssh_manager.sftp_download_all(
+        remote_src="/backups", local_dest=local_dest, listing_cache=listing_cache
+    )
+    local_file: Path = local_dest / remote_file.name
+    assert local_file.stat().st_size == 1000
+
+    ## The cached listing still says 1000 bytes
+    _append_in_place(remote_file, b"y" * 5000)
+    assert listing_cache.get(
+        remote_dir="/backups", mtime=int(remote_file.parent.stat().st_mtime)
+    )[0].st_size == 1000
+
+    assert (
+        wan_ssh_manager.plan_download(
+            remote_src="/backups",
+            local_dest=local_dest,
+            listing_cache=listing_cache,
+            refresh_truncated=True,
+        )[0].size
+        == 6000
+    )
+
+    downloaded: list[Path] = wan_ssh_manager.sftp_download_all(
+        remote_src="/backups",
+        local_dest=local_dest,
+        listing_cache=listing_cache,
+        refresh_truncated=True,
+    )
+
+    assert downloaded == [local_file]
+    assert local_file.stat().st_size == 6000
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from modules import ssh_mod
+from modules.ssh_mod.transfer import RunJournal, TransferJob
+import pytest
+
+REMOTE_DIR: str = "/backups"
+
+
+def _jobs(tmp_path: Path) -> list[TransferJob]:
+    return [
+        TransferJob(
+            remote_path=f"{REMOTE_DIR}/{name}", local_path=tmp_path / name, size=10
+        )
+        for name in ("a.tar.gz", "b.tar.gz")
+    ]
+
+
+def _interrupted_run(journal_file: Path, tmp_path: Path) -> RunJournal:
+    """Plan two files & commit only the first, without finishing the run."""
+    journal = RunJournal(journal_file=journal_file, fsync=False)
+    journal.begin(remote_dir=REMOTE_DIR)
+    jobs: list[TransferJob] = _jobs(tmp_path)
+    journal.record_plan(remote_src=REMOTE_DIR, jobs=jobs)
+    journal.record_commit([jobs[0].local_path])
+    journal.close()
+
+    return journal
+
+
+def test_new_run_is_not_resumed(tmp_path: Path):
+    journal = RunJournal(journal_file=tmp_path / "journal.jsonl", fsync=False)
+
+    assert journal.begin(remote_dir=REMOTE_DIR) is False
+    assert journal.remaining(REMOTE_DIR) is None
+
+
+def test_unfinished_run_resumes_uncommitted_files(tmp_path: Path):
+    journal_file: Path = tmp_path / "journal.jsonl"
+    first: RunJournal = _interrupted_run(journal_file, tmp_path)
+
+    journal = RunJournal(journal_file=journal_file, fsync=False)
+
+    assert journal.begin(remote_dir=REMOTE_DIR) is True
+    assert journal.started_at == first.started_at
+    assert [job.remote_path for job in journal.remaining(REMOTE_DIR)] == [
+        f"{REMOTE_DIR}/b.tar.gz"
+    ]
+
+
+def test_finished_run_starts_over(tmp_path: Path):
+    journal_file: Path = tmp_path / "journal.jsonl"
+    _interrupted_run(journal_file, tmp_path)
+
+    journal = RunJournal(journal_file=journal_file, fsync=False)
+    journal.begin(remote_dir=REMOTE_DIR)
+    journal.finish()
+    journal.close()
+
+    assert RunJournal(journal_file=journal_file).begin(remote_dir=REMOTE_DIR) is False
+
+
+def test_other_remote_dir_starts_over(tmp_path: Path):
+    journal_file: Path = tmp_path / "journal.jsonl"
+    _interrupted_run(journal_file, tmp_path)
+
+    journal = RunJournal(journal_file=journal_file, fsync=False)
+
+    assert journal.begin(remote_dir="/other") is False
+
+
+def test_run_is_resumed_at_most_max_resumes_times(tmp_path: Path):
+    journal_file: Path = tmp_path / "journal.jsonl"
+    _interrupted_run(journal_file, tmp_path)
+
+    resumed: list[bool] = []
+    for _ in range(3):
+        journal = RunJournal(journal_file=journal_file, fsync=False, max_resumes=2)
+        resumed.append(journal.begin(remote_dir=REMOTE_DIR))
+        journal.close()
+
+    assert resumed == [True, True, False]
+
+
+def test_torn_last_line_is_cut_before_resuming(tmp_path: Path):
+    journal_file: Path = tmp_path / "journal.jsonl"
+    _interrupted_run(journal_file, tmp_path)
+    ## Crash in the middle of writing a record
+    with open(journal_file, "a") as f:
+        f.write('{"event": "comm')
+
+    for _ in range(2):
+        journal = RunJournal(journal_file=journal_file, fsync=False, max_resumes=2)
+        assert journal.begin(remote_dir=REMOTE_DIR) is True
+        journal.close()
+
+    ## Every line is whole, so each resume is counted
+    records: list[dict] = [
+        json.loads(line) for line in journal_file.read_text().splitlines()
+    ]
+    assert [r["event"] for r in records].count("run") == 3
+
+    journal = RunJournal(journal_file=journal_file, fsync=False, max_resumes=2)
+    assert journal.begin(remote_dir=REMOTE_DIR) is False
+
+
+class _FakeSFTP:
+    def close(self) -> None:
+        pass
+
+
+@pytest.mark.parametrize(
+    ("failures", "retries", "downloaded", "attempts"),
+    [(2, 2, True, 2), (3, 2, False, 3), (1, 0, False, 1)],
+)
+def test_run_transfers_retries_up_to_the_limit(
+    tmp_path: Path, failures: int, retries: int, downloaded: bool, attempts: int
+):
+    job = TransferJob(
+        remote_path=f"{REMOTE_DIR}/a.tar.gz",
+        local_path=tmp_path / "a.tar.gz",
+        temp_path=tmp_path / ".a.tar.gz.part",
+        size=10,
+    )
+    calls: list[int] = []
+    failed_attempts: list[bool] = []
+
+    def _download(sftp_client, job: TransferJob, callback) -> None:
+        calls.append(1)
+        if len(calls) <= failures:
+            raise OSError("connection reset")
+
+        job.temp_path.write_bytes(b"x" * job.size)
+
+    stats = ssh_mod.transfer.run_transfers(
+        open_sftp=_FakeSFTP,
+        jobs=[job],
+        download=_download,
+        retries=retries,
+        retry_backoff=0.0,
+        on_failure=lambda job, exc, final: failed_attempts.append(final),
+    )
+
+    assert (stats.downloaded == [job.local_path]) is downloaded
+    assert (job.remote_path in stats.failed) is not downloaded
+    assert len(calls) == min(failures + 1, retries + 1)
+    assert job.attempts == attempts
+    ## Only the last failed attempt of a job that never succeeded is final
+    if downloaded:
+        assert failed_attempts == [False] * failures
+    else:
+        assert failed_attempts == [False] * (attempts - 1) + [True]
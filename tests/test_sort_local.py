@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import errno
+import os
+from pathlib import Path
+
+from packages.sort_local import sort_local_backups
+from packages.sort_local.__sort import _group_moves_by_dir, _move_file
+import pytest
+
+NAME: str = "backup_2024-01-02_03-04.tar.gz"
+
+
+def test_sort_moves_into_date_dirs(tmp_path: Path):
+    (tmp_path / NAME).write_bytes(b"backup")
+
+    results: dict[str, int] = sort_local_backups(local_backups_dir=tmp_path)
+
+    assert results["renamed"] == 1
+    assert (tmp_path / "2024" / "1" / "2" / NAME).read_bytes() == b"backup"
+    assert not (tmp_path / NAME).exists()
+
+
+def test_sort_never_overwrites_same_named_backups(tmp_path: Path):
+    for source in ("host_a", "host_b"):
+        (tmp_path / source).mkdir()
+        (tmp_path / source / NAME).write_bytes(source.encode())
+
+    results: dict[str, int] = sort_local_backups(local_backups_dir=tmp_path)
+
+    assert results["renamed"] == 1
+    assert results["skipped"] == 1
+    sorted_file: Path = tmp_path / "2024" / "1" / "2" / NAME
+    left_behind: list[Path] = [
+        tmp_path / source / NAME
+        for source in ("host_a", "host_b")
+        if (tmp_path / source / NAME).exists()
+    ]
+    ## One backup was moved, the other is untouched where it was
+    assert len(left_behind) == 1
+    assert {sorted_file.read_bytes(), left_behind[0].read_bytes()} == {
+        b"host_a",
+        b"host_b",
+    }
+
+
+def test_move_file_skips_existing_dest(tmp_path: Path):
+    src: Path = tmp_path / "src"
+    dest: Path = tmp_path / "dest"
+    src.write_bytes(b"new")
+    dest.write_bytes(b"old")
+
+    assert _move_file(src, dest) == "skipped"
+    assert dest.read_bytes() == b"old"
+    assert src.read_bytes() == b"new"
+
+
+def test_group_moves_drops_clashing_dests(tmp_path: Path):
+    dest: Path = tmp_path / "2024" / "1" / "2" / NAME
+    file_sort_meta: list[dict] = [
+        {"filename": NAME, "src_path": tmp_path / source, "dest_path": dest}
+        for source in ("host_a", "host_b")
+    ]
+
+    grouped, clashes = _group_moves_by_dir(file_sort_meta=file_sort_meta)
+
+    assert grouped == {dest.parent: [(tmp_path / "host_a" / NAME, dest)]}
+    assert clashes == [(tmp_path / "host_b" / NAME, dest)]
+
+
+@pytest.mark.parametrize("link_errno", [errno.EPERM, errno.EOPNOTSUPP, errno.EXDEV])
+def test_move_file_copies_when_hardlinks_fail(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, link_errno: int
+):
+    src: Path = tmp_path / "src"
+    dest: Path = tmp_path / "dest"
+    src.write_bytes(b"backup")
+    os.utime(src, (0, 0))
+
+    def _link(*args, **kwargs):
+        raise OSError(link_errno, os.strerror(link_errno))
+
+    monkeypatch.setattr(os, "link", _link)
+
+    assert _move_file(src, dest) == "copied"
+    assert dest.read_bytes() == b"backup"
+    assert dest.stat().st_mtime == 0
+    assert not src.exists()
+    assert [p.name for p in tmp_path.iterdir()] == ["dest"]
+
+
+def test_move_file_copy_skips_existing_dest(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    src: Path = tmp_path / "src"
+    dest: Path = tmp_path / "dest"
+    src.write_bytes(b"new")
+    dest.write_bytes(b"old")
+
+    def _link(*args, **kwargs):
+        raise OSError(errno.EPERM, os.strerror(errno.EPERM))
+
+    monkeypatch.setattr(os, "link", _link)
+
+    assert _move_file(src, dest) == "skipped"
+    assert dest.read_bytes() == b"old"
+    assert src.read_bytes() == b"new"
@@ -0,0 +1,104 @@
+"""Walk & download timings over the emulated link chosen with `--link-profile`.
+
+Timings are recorded as test properties (i.e. in `--junitxml` output) for comparing runs.
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import random
+import time
+
+from tests import wan_emulator
+
+from loguru import logger as log
+from modules import ssh_mod
+
+N_DIRS: int = 12
+FILES_PER_DIR: int = 4
+FILE_SIZE: int = 64 * 1024
+
+
+def _make_tree(sftp_root: Path) -> list[Path]:
+    """Fill sftp_root with a day directory per partition, with mtimes old enough to cache."""
+    files: list[Path] = []
+    rand = random.Random(0)
+
+    for day in range(1, N_DIRS + 1):
+        day_dir: Path = sftp_root / "backups" / f"{day:02d}"
+        day_dir.mkdir(parents=True)
+        for hour in range(FILES_PER_DIR):
+            path: Path = day_dir / f"backup_2024-01-{day:02d}_{hour:02d}-00.tar.gz"
+            path.write_bytes(rand.randbytes(FILE_SIZE))
+            files.append(path)
+
+    hour_ago: float = time.time() - 3600
+    for d in [sftp_root / "backups", *(sftp_root / "backups").iterdir()]:
+        os.utime(d, (hour_ago, hour_ago))
+
+    return files
+
+
+def test_walk(
+    wan_ssh_manager: ssh_mod.SSHManager,
+    sftp_root: Path,
+    link_profile: wan_emulator.LinkProfile,
+    tmp_path: Path,
+    record_property,
+):
+    files: list[Path] = _make_tree(sftp_root)
+    listing_cache = ssh_mod.RemoteListingCache(
+        namespace="benchmark", cache_file=tmp_path / "listing_cache.json"
+    )
+
+    timings: dict[str, float] = {}
+    for label, cache in (
+        ("uncached", None),
+        ("cold_cache", listing_cache),
+        ("warm_cache", listing_cache),
+    ):
+        started: float = time.monotonic()
+        jobs = wan_ssh_manager.plan_download(
+            remote_src="/backups", local_dest=tmp_path / "local", listing_cache=cache
+        )
+        timings[label] = time.monotonic() - started
+
+        assert len(jobs) == len(files)
+        record_property(f"walk_{label}_seconds", round(timings[label], 3))
+
+    log.info(f"Walk over {link_profile}: {timings}")
+
+    if link_profile.rtt_ms >= 10:
+        ## A warm cache stats every directory in one pipelined batch, instead of listing
+        #  each directory one round trip after another
+        assert timings["warm_cache"] < timings["uncached"] / 2
+        assert timings["warm_cache"] < N_DIRS * link_profile.rtt_ms / 1000
+
+
+def test_download(
+    wan_ssh_manager: ssh_mod.SSHManager,
+    sftp_root: Path,
+    link_profile: wan_emulator.LinkProfile,
+    tmp_path: Path,
+    record_property,
+):
+    files: list[Path] = _make_tree(sftp_root)
+    local_dest: Path = tmp_path / "local"
+
+    started: float = time.monotonic()
+    downloaded: list[Path] = wan_ssh_manager.sftp_download_all(
+        remote_src="/backups", local_dest=local_dest
+    )
+    elapsed: float = time.monotonic() - started
+
+    assert sorted(p.name for p in downloaded) == sorted(p.name for p in files)
+    for remote_file in files:
+        assert (local_dest / remote_file.name).read_bytes() == remote_file.read_bytes()
+
+    throughput: float = len(files) * FILE_SIZE / elapsed
+    record_property("download_seconds", round(elapsed, 3))
+    record_property("download_bytes_per_second", round(throughput))
+    log.info(
+        f"Downloaded [{len(files)}] file(s) over {link_profile} in {elapsed:.2f}s ({throughput / 1024 / 1024:.1f} MiB/s)"
+    )
@@ -0,0 +1,4 @@
+from __future__ import annotations
+
+from .classes import EmulatedLink, LinkProfile, SFTPStandIn, WanProxy
+from .methods import LINK_PROFILES, emulated_sftp, get_link_profile
@@ -0,0 +1,551 @@
+from __future__ import annotations
+
+from contextlib import AbstractContextManager
+import os
+from pathlib import Path
+import queue
+import random
+import socket
+import threading
+import time
+import typing as t
+
+from loguru import logger as log
+import paramiko
+from paramiko import (
+    AUTH_FAILED,
+    AUTH_SUCCESSFUL,
+    OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED,
+    OPEN_SUCCEEDED,
+    SFTP_OK,
+    SFTPAttributes,
+    SFTPHandle,
+    SFTPServer,
+    SFTPServerInterface,
+)
+
+def _close_socket(sock: socket.socket) -> None:
+    """Close sock, waking up any thread blocked reading from it."""
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    sock.close()
+
+
+class LinkProfile:
+    """Characteristics of an emulated network link.
+
+    Description:
+        Delays are applied to each direction of a connection separately, so a request &
+        its reply together take `rtt_ms` (plus jitter). Data is delivered in order, like
+        TCP: a chunk that draws a shorter delay than the one before it waits for it.
+
+    Params:
+        rtt_ms (float): Round trip time, in milliseconds.
+        jitter_ms (float): Each one-way delay varies by up to +/- this many milliseconds.
+        bandwidth (float | None): Link capacity in bytes/second, per direction. `None` is
+            unlimited.
+        stall_probability (float): Chance (0-1) that a chunk stalls the link, i.e. a lost
+            packet waiting on a retransmit.
+        stall_ms (float): How long a stall holds up the link, in milliseconds.
+        seed (int | None): Seed for the jitter & stalls, for repeatable runs.
+    """
+
+    def __init__(
+        self,
+        rtt_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        bandwidth: float | None = None,
+        stall_probability: float = 0.0,
+        stall_ms: float = 0.0,
+        seed: int | None = None,
+    ):
+        assert rtt_ms >= 0, ValueError(f"rtt_ms must be >= 0. Got: {rtt_ms}")
+        assert jitter_ms >= 0, ValueError(f"jitter_ms must be >= 0. Got: {jitter_ms}")
+        assert bandwidth is None or bandwidth > 0, ValueError(
+            f"bandwidth must be > 0 or None. Got: {bandwidth}"
+        )
+        assert 0 <= stall_probability <= 1, ValueError(
+            f"stall_probability must be between 0 and 1. Got: {stall_probability}"
+        )
+
+        self.rtt_ms: float = rtt_ms
+        self.jitter_ms: float = jitter_ms
+        self.bandwidth: float | None = bandwidth
+        self.stall_probability: float = stall_probability
+        self.stall_ms: float = stall_ms
+        self.seed: int | None = seed
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def one_way_delay(self) -> float:
+        """Seconds a chunk takes to cross the link in one direction, jitter included."""
+        delay: float = self.rtt_ms / 2
+        if self.jitter_ms:
+            with self._lock:
+                delay += self._random.uniform(-self.jitter_ms, self.jitter_ms)
+
+        return max(delay, 0.0) / 1000
+
+    def transmit_seconds(self, nbytes: int) -> float:
+        """Seconds the link is busy sending nbytes at its bandwidth."""
+        return nbytes / self.bandwidth if self.bandwidth else 0.0
+
+    def stall_seconds(self) -> float:
+        """Seconds to hold up the link before the next chunk, usually 0."""
+        if not self.stall_probability:
+            return 0.0
+
+        with self._lock:
+            stalled: bool = self._random.random() < self.stall_probability
+
+        return self.stall_ms / 1000 if stalled else 0.0
+
+    def __repr__(self) -> str:
+        return f"LinkProfile(rtt_ms={self.rtt_ms}, jitter_ms={self.jitter_ms}, bandwidth={self.bandwidth}, stall_probability={self.stall_probability}, stall_ms={self.stall_ms})"
+
+
+class WanProxy(AbstractContextManager):
+    """TCP proxy that forwards connections to an upstream server over an emulated link.
+
+    Description:
+        Point a client at `address` instead of the upstream server. Each direction of each
+        connection is read by one thread & written by another. The reader stamps every
+        chunk with the time it would arrive on the far side of the link (bandwidth,
+        stalls, then the one-way delay & jitter), the writer holds it until then.
+
+        At most window_bytes per direction are in flight, like a TCP window. When it is
+        full the proxy stops reading, so throughput is capped at roughly
+        `window_bytes / rtt` on long links, as it would be on a real one.
+
+    Params:
+        upstream_host (str): Host of the server to forward to.
+        upstream_port (int): Port of the server to forward to.
+        profile (LinkProfile): The emulated link. Defaults to a link with no delay.
+        listen_host (str): Address the proxy listens on.
+        listen_port (int): Port the proxy listens on. 0 picks a free port.
+        chunk_size (int): Maximum bytes read from a socket at once.
+        window_bytes (int): Maximum bytes in flight per direction of a connection.
+    """
+
+    def __init__(
+        self,
+        upstream_host: str = None,
+        upstream_port: int = None,
+        profile: LinkProfile | None = None,
+        listen_host: str = "127.0.0.1",
+        listen_port: int = 0,
+        chunk_size: int = 16 * 1024,
+        window_bytes: int = 4 * 1024 * 1024,
+    ):
+        assert upstream_host, ValueError("Missing an upstream host to forward to")
+        assert upstream_port, ValueError("Missing an upstream port to forward to")
+
+        self.upstream_host: str = upstream_host
+        self.upstream_port: int = upstream_port
+        self.profile: LinkProfile = profile or LinkProfile()
+        self.listen_host: str = listen_host
+        self.listen_port: int = listen_port
+        self.chunk_size: int = chunk_size
+        self.window_bytes: int = window_bytes
+
+        ## Bytes forwarded client -> server ("up") & server -> client ("down")
+        self.bytes_up: int = 0
+        self.bytes_down: int = 0
+        self.stalls: int = 0
+
+        self._listener: socket.socket | None = None
+        self._sockets: list[socket.socket] = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+    def __enter__(self) -> t.Self:
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def address(self) -> tuple[str, int]:
+        """`(host, port)` for clients to connect to."""
+        assert self._listener, ValueError("WanProxy has not been started")
+
+        return self._listener.getsockname()[:2]
+
+    @property
+    def port(self) -> int:
+        return self.address[1]
+
+    def start(self) -> t.Self:
+        self._closed.clear()
+        self._listener = socket.create_server((self.listen_host, self.listen_port))
+        threading.Thread(target=self._accept_loop, name="wan-proxy", daemon=True).start()
+
+        log.debug(
+            f"WAN proxy listening on {self.address[0]}:{self.port} -> {self.upstream_host}:{self.upstream_port} ({self.profile})"
+        )
+
+        return self
+
+    def stop(self) -> None:
+        self._closed.set()
+
+        with self._lock:
+            sockets = self._sockets + ([self._listener] if self._listener else [])
+            self._sockets = []
+
+        for sock in sockets:
+            _close_socket(sock)
+
+    def _accept_loop(self) -> None:
+        while not self._closed.is_set():
+            try:
+                client, _ = self._listener.accept()
+            except OSError:
+                return
+
+            try:
+                upstream = socket.create_connection((self.upstream_host, self.upstream_port))
+            except OSError as exc:
+                log.warning(
+                    f"WAN proxy could not connect to {self.upstream_host}:{self.upstream_port}. Details: {exc}"
+                )
+                client.close()
+                continue
+
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._sockets += [client, upstream]
+
+            self._forward(client, upstream, direction="up")
+            self._forward(upstream, client, direction="down")
+
+    def _forward(self, src: socket.socket, dst: socket.socket, direction: str) -> None:
+        """Start the reader & writer threads for one direction of a connection."""
+        in_flight: queue.Queue = queue.Queue(
+            maxsize=max(1, self.window_bytes // self.chunk_size)
+        )
+
+        def _read() -> None:
+            link_free_at: float = 0.0
+            last_delivery: float = 0.0
+
+            try:
+                while data := src.recv(self.chunk_size):
+                    stall: float = self.profile.stall_seconds()
+                    if stall:
+                        with self._lock:
+                            self.stalls += 1
+
+                    link_free_at = (
+                        max(time.monotonic(), link_free_at)
+                        + stall
+                        + self.profile.transmit_seconds(len(data))
+                    )
+                    last_delivery = max(
+                        link_free_at + self.profile.one_way_delay(), last_delivery
+                    )
+                    in_flight.put((last_delivery, data))
+            except OSError:
+                pass
+            finally:
+                in_flight.put(None)
+
+        def _write() -> None:
+            try:
+                while (item := in_flight.get()) is not None:
+                    deliver_at, data = item
+                    if (wait := deliver_at - time.monotonic()) > 0:
+                        time.sleep(wait)
+
+                    dst.sendall(data)
+                    with self._lock:
+                        if direction == "up":
+                            self.bytes_up += len(data)
+                        else:
+                            self.bytes_down += len(data)
+
+                dst.shutdown(socket.SHUT_WR)
+            except OSError:
+                ## The other side went away, unblock the reader & drop the connection
+                for sock in (src, dst):
+                    _close_socket(sock)
+
+        for target in (_read, _write):
+            threading.Thread(
+                target=target, name=f"wan-proxy-{direction}", daemon=True
+            ).start()
+
+    def __repr__(self) -> str:
+        return f"WanProxy(upstream={self.upstream_host}:{self.upstream_port}, profile={self.profile}, bytes_up={self.bytes_up}, bytes_down={self.bytes_down}, stalls={self.stalls})"
+
+
+class _StandInServer(paramiko.ServerInterface):
+    def __init__(self, username: str | None, password: str | None):
+        self.username: str | None = username
+        self.password: str | None = password
+
+    def get_allowed_auths(self, username: str) -> str:
+        return "password,publickey"
+
+    def check_auth_password(self, username: str, password: str) -> int:
+        if self.username not in (None, username):
+            return AUTH_FAILED
+        if self.password not in (None, password):
+            return AUTH_FAILED
+
+        return AUTH_SUCCESSFUL
+
+    def check_auth_publickey(self, username: str, key: paramiko.PKey) -> int:
+        return AUTH_SUCCESSFUL if self.username in (None, username) else AUTH_FAILED
+
+    def check_channel_request(self, kind: str, chanid: int) -> int:
+        return OPEN_SUCCEEDED if kind == "session" else OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class _StandInHandle(SFTPHandle):
+    def stat(self) -> SFTPAttributes | int:
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.filehandle.fileno()))
+        except OSError as exc:
+            return SFTPServer.convert_errno(exc.errno)
+
+
+class _StandInSFTP(SFTPServerInterface):
+    """Serves the stand-in's root directory over SFTP. Paths are confined to the root."""
+
+    def __init__(self, server: _StandInServer, *args, root: Path = None, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root: Path = root
+
+    def _local(self, path: str) -> str:
+        return f"{self.root}{self.canonicalize(path)}"
+
+    def list_folder(self, path: str) -> list[SFTPAttributes] | int:
+        local: str = self._local(path)
+        try:
+            entries: list[SFTPAttributes] = []
+            for name in os.listdir(local):
+                attr = SFTPAttributes.from_stat(os.lstat(os.path.join(local, name)))
+                attr.filename = name
+                entries.append(attr)
+
+            return entries
+        except OSError as exc:
+            return SFTPServer.convert_errno(exc.errno)
+
+    def stat(self, path: str) -> SFTPAttributes | int:
+        try:
+            return SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError as exc:
+            return SFTPServer.convert_errno(exc.errno)
+
+    def lstat(self, path: str) -> SFTPAttributes | int:
+        try:
+            return SFTPAttributes.from_stat(os.lstat(self._local(path)))
+        except OSError as exc:
+            return SFTPServer.convert_errno(exc.errno)
+
+    def open(self, path: str, flags: int, attr: SFTPAttributes) -> SFTPHandle | int:
+        local: str = self._local(path)
+        try:
+            fd: int = os.open(local, flags | getattr(os, "O_BINARY", 0), 0o644)
+        except OSError as exc:
+            return SFTPServer.convert_errno(exc.errno)
+
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+
+        handle = _StandInHandle(flags)
+        handle.filename = local
+        handle.filehandle = os.fdopen(fd, mode)
+        handle.readfile = handle.filehandle if mode not in ("wb", "ab") else None
+        handle.writefile = handle.filehandle if mode != "rb" else None
+
+        return handle
+
+    def remove(self, path: str) -> int:
+        try:
+            os.remove(self._local(path))
+        except OSError as exc:
+            return SFTPServer.convert_errno(exc.errno)
+
+        return SFTP_OK
+
+    def rename(self, oldpath: str, newpath: str) -> int:
+        try:
+            os.rename(self._local(oldpath), self._local(newpath))
+        except OSError as exc:
+            return SFTPServer.convert_errno(exc.errno)
+
+        return SFTP_OK
+
+    def mkdir(self, path: str, attr: SFTPAttributes) -> int:
+        try:
+            os.mkdir(self._local(path))
+        except OSError as exc:
+            return SFTPServer.convert_errno(exc.errno)
+
+        return SFTP_OK
+
+    def rmdir(self, path: str) -> int:
+        try:
+            os.rmdir(self._local(path))
+        except OSError as exc:
+            return SFTPServer.convert_errno(exc.errno)
+
+        return SFTP_OK
+
+    def chattr(self, path: str, attr: SFTPAttributes) -> int:
+        try:
+            SFTPServer.set_file_attr(self._local(path), attr)
+        except OSError as exc:
+            return SFTPServer.convert_errno(exc.errno)
+
+        return SFTP_OK
+
+
+class SFTPStandIn(AbstractContextManager):
+    """Local SFTP server, a stand-in for a backup host in tests & benchmarks.
+
+    Description:
+        Serves root over SFTP with paramiko, in background threads. Remote paths are
+        relative to root, i.e. `/backups/x` is `root/backups/x`. Only the SFTP subsystem is
+        available, `exec_command()` is refused (so delta transfers fall back to full
+        downloads). Any public key is accepted, as is the password when one is set.
+
+        Put a `WanProxy` in front of it to emulate a slow link.
+
+    Params:
+        root (str | Path): Local directory to serve.
+        username (str | None): Only accept this user. `None` accepts any user.
+        password (str | None): Only accept this password. `None` accepts any password.
+        host (str): Address to listen on.
+        port (int): Port to listen on. 0 picks a free port.
+    """
+
+    def __init__(
+        self,
+        root: t.Union[str, Path] = None,
+        username: str | None = None,
+        password: str | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        assert root, ValueError("Missing a root directory to serve")
+
+        self.root: Path = Path(f"{root}").resolve()
+        self.username: str | None = username
+        self.password: str | None = password
+        self.host: str = host
+        self.port: int = port
+
+        self.host_key: paramiko.PKey = _get_host_key()
+        self._listener: socket.socket | None = None
+        self._transports: list[paramiko.Transport] = []
+        self._closed = threading.Event()
+
+    def __enter__(self) -> t.Self:
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def address(self) -> tuple[str, int]:
+        """`(host, port)` the server is listening on."""
+        assert self._listener, ValueError("SFTPStandIn has not been started")
+
+        return self._listener.getsockname()[:2]
+
+    def start(self) -> t.Self:
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._closed.clear()
+        self._listener = socket.create_server((self.host, self.port), backlog=64)
+        threading.Thread(target=self._accept_loop, name="sftp-stand-in", daemon=True).start()
+
+        log.debug(f"SFTP stand-in serving '{self.root}' on {self.address[0]}:{self.address[1]}")
+
+        return self
+
+    def stop(self) -> None:
+        self._closed.set()
+
+        for transport in self._transports:
+            transport.close()
+        self._transports = []
+
+        if self._listener:
+            self._listener.close()
+
+    def _accept_loop(self) -> None:
+        while not self._closed.is_set():
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler(
+                "sftp", SFTPServer, _StandInSFTP, root=self.root
+            )
+            transport.start_server(
+                server=_StandInServer(username=self.username, password=self.password)
+            )
+            self._transports.append(transport)
+
+    def __repr__(self) -> str:
+        return f"SFTPStandIn(root='{self.root}', address={self.address if self._listener else None})"
+
+
+_HOST_KEY: paramiko.PKey | None = None
+
+
+def _get_host_key() -> paramiko.PKey:
+    """Return the host key shared by stand-ins in one process, as generating a key is slow."""
+    global _HOST_KEY
+
+    if _HOST_KEY is None:
+        _HOST_KEY = paramiko.RSAKey.generate(2048)
+
+    return _HOST_KEY
+
+
+class EmulatedLink:
+    """An `SFTPStandIn` behind a `WanProxy`, as yielded by `emulated_sftp()`.
+
+    Params:
+        stand_in (SFTPStandIn): The running SFTP server.
+        proxy (WanProxy): The running proxy in front of it. Connect to `host`:`port`.
+    """
+
+    def __init__(self, stand_in: SFTPStandIn = None, proxy: WanProxy = None):
+        self.stand_in: SFTPStandIn = stand_in
+        self.proxy: WanProxy = proxy
+
+    @property
+    def host(self) -> str:
+        return self.proxy.address[0]
+
+    @property
+    def port(self) -> int:
+        return self.proxy.port
+
+    @property
+    def root(self) -> Path:
+        return self.stand_in.root
+
+    @property
+    def profile(self) -> LinkProfile:
+        return self.proxy.profile
+
+    def __repr__(self) -> str:
+        return f"EmulatedLink(host={self.host}, port={self.port}, root='{self.root}', profile={self.profile})"
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from pathlib import Path
+import typing as t
+
+from .classes import EmulatedLink, LinkProfile, SFTPStandIn, WanProxy
+
+## Named links to benchmark against. Bandwidth is in bytes/second
+LINK_PROFILES: dict[str, dict[str, t.Any]] = {
+    "localhost": {},
+    "lan": {"rtt_ms": 1, "bandwidth": 110 * 1024 * 1024},
+    "wan_50ms": {"rtt_ms": 50, "jitter_ms": 5, "bandwidth": 12 * 1024 * 1024},
+    "wan_100ms": {
+        "rtt_ms": 100,
+        "jitter_ms": 10,
+        "bandwidth": 6 * 1024 * 1024,
+        "stall_probability": 0.0005,
+        "stall_ms": 200,
+    },
+    "wan_200ms": {
+        "rtt_ms": 200,
+        "jitter_ms": 20,
+        "bandwidth": 2.5 * 1024 * 1024,
+        "stall_probability": 0.001,
+        "stall_ms": 400,
+    },
+}
+
+
+def get_link_profile(name: str = "wan_50ms", seed: int | None = None, **overrides) -> LinkProfile:
+    """Build a `LinkProfile` from one of `LINK_PROFILES`, with any field overridden."""
+    assert name in LINK_PROFILES, ValueError(
+        f"Unknown link profile '{name}'. Choose from: {list(LINK_PROFILES)}"
+    )
+
+    return LinkProfile(seed=seed, **{**LINK_PROFILES[name], **overrides})
+
+
+@contextmanager
+def emulated_sftp(
+    root: t.Union[str, Path] = None,
+    profile: t.Union[LinkProfile, str, None] = None,
+    username: str | None = None,
+    password: str | None = None,
+    window_bytes: int = 4 * 1024 * 1024,
+) -> t.Generator[EmulatedLink, t.Any, None]:
+    """Serve root over SFTP behind an emulated link, for as long as the context is open.
+
+    Description:
+        Starts an `SFTPStandIn` for root & a `WanProxy` in front of it. Connect clients to
+        the yielded link's `host` & `port`, i.e.
+        `SSHManager(host=link.host, port=link.port, user="backup", password="x")`.
+
+    Params:
+        root (str | Path): Local directory served as the remote's `/`.
+        profile (LinkProfile | str | None): The link to emulate, or the name of one of
+            `LINK_PROFILES`. Defaults to "wan_50ms".
+        username (str | None): Only accept this user. `None` accepts any user.
+        password (str | None): Only accept this password. `None` accepts any password.
+        window_bytes (int): Maximum bytes in flight per direction (see `WanProxy`).
+
+    Returns:
+        (EmulatedLink): The running server & proxy.
+
+    """
+    if profile is None or isinstance(profile, str):
+        profile = get_link_profile(profile or "wan_50ms")
+
+    with SFTPStandIn(root=root, username=username, password=password) as stand_in:
+        with WanProxy(
+            upstream_host=stand_in.address[0],
+            upstream_port=stand_in.address[1],
+            profile=profile,
+            window_bytes=window_bytes,
+        ) as proxy:
+            yield EmulatedLink(stand_in=stand_in, proxy=proxy)